@@ -1,21 +1,63 @@
+import time
+
+# 模块开始导入的时间，用于统计插件导入耗时
+_IMPORT_STARTED = time.perf_counter()
+
+from contextlib import ExitStack
 from datetime import datetime, timedelta
+from hashlib import sha1
+from pathlib import Path
 from threading import Event
-from typing import Generator, List, Tuple, Dict, Any, Optional
-import time
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Generator,
+    Iterable,
+    List,
+    Tuple,
+    Dict,
+    Any,
+    Optional,
+)
 
 import pytz
 from apscheduler.schedulers.background import BackgroundScheduler  # type: ignore
+from fastapi.responses import PlainTextResponse
 from apscheduler.triggers.cron import CronTrigger  # type: ignore
 
-from app.api.endpoints.media import scrape
 from app.core.config import settings
-from app.chain.storage import StorageChain
 from app.schemas import FileItem, NotificationType
-from app.schemas.types import StorageSchema
-from app.db.transferhistory_oper import TransferHistoryOper
+from app.schemas.types import MediaType, StorageSchema
 from app.log import logger
 from app.plugins import _PluginBase
 
+from .aio import StorageLimits
+from .metacache import MetadataCache
+from .historyindex import HistoryIndex
+from .libraries import Library, LibraryCursors, parse_libraries
+from .lazy import LazyInstance, cached_form, lazy_import
+from .metrics import CONTENT_TYPE, PluginMetrics, render as render_metrics
+from .pipeline import STOP_TIMEOUT, Pipeline, RunStats, Skip, sampled, wait_until
+from .profiling import TraceRecorder, profile_api, profiled, trace
+from .runlog import render_runs, save_run
+from .scanner import (
+    FileFilter,
+    FileRecord,
+    round_robin,
+    scan_files,
+    scan_files_async,
+    valid_days_window,
+    valid_patterns,
+)
+from .sharding import ShardCoordinator, shard_filter
+
+if TYPE_CHECKING:
+    from app.core.context import MediaInfo
+    from app.db.models.transferhistory import TransferHistory
+
+scrape = lazy_import("app.api.endpoints.media.scrape")
+MetaInfoPath = lazy_import("app.core.metainfo.MetaInfoPath")
+
 
 class LibraryScrapeUpdate(_PluginBase):
     # 插件名称
@@ -25,7 +67,7 @@ class LibraryScrapeUpdate(_PluginBase):
     # 插件图标
     plugin_icon = "scraper.png"
     # 插件版本
-    plugin_version = "1.1"
+    plugin_version = "2.7"
     # 插件作者
     plugin_author = "Akimio521"
     # 作者主页
@@ -38,11 +80,14 @@ class LibraryScrapeUpdate(_PluginBase):
     user_level = 1
 
     # 私有属性
-    transferhis = TransferHistoryOper()
-    storagechain = StorageChain()
+    # 首次使用时才创建，加载插件时不初始化数据库与处理链
+    transferhis = LazyInstance("app.db.transferhistory_oper.TransferHistoryOper")
+    storagechain = LazyInstance("app.chain.storage.StorageChain")
+    mediachain = LazyInstance("app.chain.media.MediaChain")
     _scheduler: BackgroundScheduler | None = None
 
     _enabled: bool = False  # 运行状态
+    _running: bool = False  # 是否正在刮削
     _onlyonce: bool = False  # 立即运行
     _notify: bool = False  # 通知推送
     _detail_notify: bool = False  # 详细通知推送
@@ -50,10 +95,34 @@ class LibraryScrapeUpdate(_PluginBase):
     _cron: str = "0 0 */7 * *"  # 执行周期
     _target_type: str = StorageSchema.Local.value  # 媒体库类型
     _target_path: str = ""  # 媒体库路径
+    _libraries: str = ""  # 更多媒体库
+    _max_minutes: int = 0  # 单次运行最长时间（分钟）
+    _max_items: int = 0  # 单次运行最多刮削数量
+    _scan_workers: int = 4  # 扫描线程数
+    _workers: int = 1  # 刮削线程数
+    _async_io: bool = False  # 异步 I/O
+    _storage_limits: str = ""  # 存储并发限制
+    _timeout: float = 0  # 单项超时（秒）
+    _retries: int = 0  # 失败重试次数
+    _history_index: bool = False  # 本地整理记录索引
+    _include: str = ""  # 包含规则
+    _exclude: str = ""  # 排除规则
+    _exclude_dirs: str = ""  # 排除目录
+    _min_size: float = 0  # 最小文件大小（MB）
+    _mtime_window: str = ""  # 修改时间范围（天）
+    _cache_ttl: float = 7  # 识别缓存有效期（天）
+    _cache_size: int = 500  # 识别缓存条数
+    _shard_dir: str = ""  # 多实例分片目录
+    _shard_count: int = 16  # 分片数
+    _profile: bool = False  # 性能分析（仅下次运行）
+    _profile_detail: bool = False  # 调用栈采样与内存快照
+    _tracer: TraceRecorder | None = None  # 性能分析中的运行的时间线
 
-    _event = Event()  # 退出事件
+    _event = Event()  # 退出事件，每次运行开始时重新创建
 
     def init_plugin(self, config: Optional[Dict[str, Any]] = None) -> None:
+        logger.debug(f"{self.plugin_name}：模块导入耗时 {IMPORT_SECONDS * 1000:.1f} ms")
+        PluginMetrics(self.__class__.__name__).imported(IMPORT_SECONDS)
         # 读取配置
         if config:
             self._enabled = config.get("enabled") or False
@@ -64,6 +133,27 @@ class LibraryScrapeUpdate(_PluginBase):
             self._cron = config.get("cron") or "0 0 */7 * *"
             self._target_type = config.get("target_type") or StorageSchema.Local.value
             self._target_path = config.get("target_path") or ""
+            self._libraries = config.get("libraries") or ""
+            self._max_minutes = int(config.get("max_minutes") or 0)
+            self._max_items = int(config.get("max_items") or 0)
+            self._scan_workers = int(config.get("scan_workers") or 4)
+            self._workers = int(config.get("workers") or 1)
+            self._async_io = config.get("async_io") or False
+            self._storage_limits = config.get("storage_limits") or ""
+            self._timeout = float(config.get("timeout") or 0)
+            self._retries = int(config.get("retries") or 0)
+            self._history_index = config.get("history_index") or False
+            self._include = valid_patterns(config.get("include") or "")
+            self._exclude = valid_patterns(config.get("exclude") or "")
+            self._exclude_dirs = config.get("exclude_dirs") or ""
+            self._min_size = float(config.get("min_size") or 0)
+            self._mtime_window = valid_days_window(config.get("mtime_window") or "")
+            self._cache_ttl = float(config.get("cache_ttl", 7) or 0)
+            self._cache_size = int(config.get("cache_size") or 500)
+            self._shard_dir = config.get("shard_dir") or ""
+            self._shard_count = int(config.get("shard_count") or 16)
+            self._profile = config.get("profile") or False
+            self._profile_detail = config.get("profile_detail") or False
         logger.info(f"插件配置：{self.config}")
 
         self.stop_service()  # 停止现有任务
@@ -96,6 +186,27 @@ class LibraryScrapeUpdate(_PluginBase):
             "cron": self._cron,
             "target_type": self._target_type,
             "target_path": self._target_path,
+            "libraries": self._libraries,
+            "max_minutes": self._max_minutes,
+            "max_items": self._max_items,
+            "scan_workers": self._scan_workers,
+            "workers": self._workers,
+            "async_io": self._async_io,
+            "storage_limits": self._storage_limits,
+            "timeout": self._timeout,
+            "retries": self._retries,
+            "history_index": self._history_index,
+            "include": self._include,
+            "exclude": self._exclude,
+            "exclude_dirs": self._exclude_dirs,
+            "min_size": self._min_size,
+            "mtime_window": self._mtime_window,
+            "cache_ttl": self._cache_ttl,
+            "cache_size": self._cache_size,
+            "shard_dir": self._shard_dir,
+            "shard_count": self._shard_count,
+            "profile": self._profile,
+            "profile_detail": self._profile_detail,
         }
 
     def get_state(self) -> bool:
@@ -106,7 +217,41 @@ class LibraryScrapeUpdate(_PluginBase):
         return []
 
     def get_api(self) -> List[Dict[str, Any]]:
-        return []
+        return [
+            {
+                "path": "/metrics",
+                "endpoint": self.export_metrics,
+                "methods": ["GET"],
+                "auth": "apikey",
+                "summary": "运行指标",
+                "description": "Prometheus 文本格式的运行指标",
+            },
+            {
+                "path": "/shards",
+                "endpoint": self.shard_status,
+                "methods": ["GET"],
+                "auth": "apikey",
+                "summary": "分片状态",
+                "description": "多实例分片运行时，当前轮次各分片的认领与完成情况",
+            },
+            *profile_api(self),
+        ]
+
+    @staticmethod
+    def export_metrics() -> PlainTextResponse:
+        """
+        导出运行指标，供 Prometheus 抓取
+        """
+        return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
+
+    def shard_status(self) -> Dict[str, Any]:
+        """
+        当前轮次各分片的状态
+        """
+        coordinator = self.__shard_coordinator(self.__libraries())
+        if not coordinator:
+            return {"sweep": None, "shards": []}
+        return coordinator.status()
 
     def get_service(self) -> List[Dict[str, Any]]:
         """
@@ -127,6 +272,7 @@ class LibraryScrapeUpdate(_PluginBase):
             logger.warning("插件未启用，取消服务")
             return []
 
+    @cached_form
     def get_form(self) -> Tuple[List[dict], Dict[str, Any]]:
         return [
             {
@@ -260,6 +406,362 @@ class LibraryScrapeUpdate(_PluginBase):
                             },
                         ],
                     },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "libraries",
+                                            "label": "更多媒体库",
+                                            "rows": 2,
+                                            "placeholder": "每行一个，格式 存储类型:路径|天数，如 u115:/媒体库/动漫|3，天数省略时同上；所有媒体库在同一次运行中轮流刮削",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "max_minutes",
+                                            "label": "单次运行最长时间（分钟）",
+                                            "rows": 1,
+                                            "placeholder": "0 为不限制，超出后保存断点，下次运行继续",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "max_items",
+                                            "label": "单次运行最多刮削数量",
+                                            "rows": 1,
+                                            "placeholder": "0 为不限制，超出后保存断点，下次运行继续",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "scan_workers",
+                                            "label": "扫描线程数",
+                                            "rows": 1,
+                                            "placeholder": "并行扫描一级子目录，默认4",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "workers",
+                                            "label": "刮削线程数",
+                                            "rows": 1,
+                                            "placeholder": "同时刮削的文件数，默认1",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VSwitch",
+                                        "props": {
+                                            "model": "async_io",
+                                            "label": "异步 I/O",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 9},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "storage_limits",
+                                            "label": "存储并发限制",
+                                            "rows": 1,
+                                            "placeholder": "异步 I/O 下各存储同时进行的请求数，如 u115:4,alipan:8，留空则按线程数",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 4},
+                                "content": [
+                                    {
+                                        "component": "VSwitch",
+                                        "props": {
+                                            "model": "history_index",
+                                            "label": "本地整理记录索引",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 4},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "timeout",
+                                            "label": "单项超时（秒）",
+                                            "rows": 1,
+                                            "placeholder": "单个文件超过该时间记为失败并继续，0 为不限制",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 4},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "retries",
+                                            "label": "失败重试次数",
+                                            "rows": 1,
+                                            "placeholder": "失败或超时的文件在本次运行末尾重试，默认0",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "cache_ttl",
+                                            "label": "识别缓存有效期（天）",
+                                            "rows": 1,
+                                            "placeholder": "按媒体ID缓存识别结果，0 为不缓存，默认7",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "cache_size",
+                                            "label": "识别缓存条数",
+                                            "rows": 1,
+                                            "placeholder": "超出后淘汰最久未使用的条目，默认500",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "include",
+                                            "label": "包含规则",
+                                            "rows": 2,
+                                            "placeholder": "每行一条，通配符匹配完整路径，以 re: 开头按正则匹配，留空则不限制",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "exclude",
+                                            "label": "排除规则",
+                                            "rows": 2,
+                                            "placeholder": "每行一条，如 *sample* 或 re:\\btrailer\\b",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 4},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "exclude_dirs",
+                                            "label": "排除目录",
+                                            "rows": 1,
+                                            "placeholder": "逗号分隔，如 Extras,Samples",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 4},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "min_size",
+                                            "label": "最小文件大小（MB）",
+                                            "rows": 1,
+                                            "placeholder": "0 为不限制",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 4},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "mtime_window",
+                                            "label": "修改时间范围（天）",
+                                            "rows": 1,
+                                            "placeholder": "如 0-30 为30天内修改，365- 为一年前修改",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "shard_dir",
+                                            "label": "多实例分片目录",
+                                            "rows": 1,
+                                            "placeholder": "多个实例共享的目录，各实例通过其中的租约文件认领分片共同完成一轮刮削，留空为不启用",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "shard_count",
+                                            "label": "分片数",
+                                            "rows": 1,
+                                            "placeholder": "按各媒体库下一级子目录名称划分，共享目录的各实例需一致，默认16",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VSwitch",
+                                        "props": {
+                                            "model": "profile",
+                                            "label": "性能分析（仅下次运行）",
+                                            "hint": "记录各文件在扫描、查询、执行阶段的时间线，结果保存在插件数据目录",
+                                            "persistent-hint": True,
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VSwitch",
+                                        "props": {
+                                            "model": "profile_detail",
+                                            "label": "调用栈采样与内存快照",
+                                            "hint": "性能分析时同时采样调用栈并记录内存分配，开销较大",
+                                            "persistent-hint": True,
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
                 ],
             }
         ], {
@@ -271,87 +773,459 @@ class LibraryScrapeUpdate(_PluginBase):
             "cron": "0 0 */7 * *",
             "target_type": StorageSchema.Local.value,
             "target_path": "",
+            "libraries": "",
+            "max_minutes": 0,
+            "max_items": 0,
+            "scan_workers": 4,
+            "workers": 1,
+            "async_io": False,
+            "storage_limits": "",
+            "timeout": 0,
+            "retries": 0,
+            "history_index": False,
+            "include": "",
+            "exclude": "",
+            "exclude_dirs": "",
+            "min_size": 0,
+            "mtime_window": "",
+            "cache_ttl": 7,
+            "cache_size": 500,
+            "shard_dir": "",
+            "shard_count": 16,
+            "profile": False,
+            "profile_detail": False,
         }
 
     def get_page(self) -> List[dict]:
-        pass
+        return render_runs(self.get_data("runs") or [])
 
+    @profiled
     def __update_library_scrape(self, cron_trigger: bool = False) -> None:
         """
-        开始更新媒体库刮削
+        开始更新媒体库刮削，多个媒体库共用执行线程，轮流提交各媒体库的文件
+        运行出错时同样关闭索引、保存缓存并重置运行状态
         """
-        date = time.strftime(
-            "%Y-%m-%d %H:%M:%S", time.localtime(time.time() - 86400 * self._days)
-        )
+        if self._running:
+            logger.warning(f"{self.plugin_name}：上一次运行尚未退出，本次不运行")
+            return
+        # 每次运行使用新的退出事件，停止时设置的事件一直保留，卡住的调用返回后仍会退出
+        self._event = Event()
+        self._running = True
+        try:
+            with ExitStack() as cleanup:
+                self.__run_library_scrape(cron_trigger, cleanup)
+        finally:
+            self._running = False
+
+    def __run_library_scrape(self, cron_trigger: bool, cleanup: ExitStack) -> None:
+        """
+        媒体库刮削更新的运行过程
+        :param cleanup: 运行结束（包括出错）时执行的清理
+        """
+        libraries = self.__libraries()
+        if not libraries:
+            logger.error("未配置媒体库路径")
+            return
         start_time = datetime.now(tz=pytz.timezone(settings.TZ))
-        logger.info(
-            f"开始更新刮削【{StorageSchema(self._target_type).name}】{self._target_path} 媒体在 {date} 之后入库的文件"
+        dates = {library.key: library.since() for library in libraries}
+        scope = "\n".join(
+            f"{library.name}：入库时间晚于 {dates[library.key]}"
+            for library in libraries
         )
+        logger.info(f"开始更新刮削媒体库：\n{scope}")
         if self._notify:
             self.post_message(
                 mtype=NotificationType.Plugin,
                 title="【插件】媒体刮削更新开始运行",
-                text=f"媒体库：【{StorageSchema(self._target_type).name}】{self._target_path}\n更新入库时间晚于 {date} 的文件\n触发方式："
-                + f"定时任务 {self._cron}"
-                if cron_trigger
-                else "手动触发",
+                text=f"媒体库：\n{scope}\n触发方式："
+                + (f"定时任务 {self._cron}" if cron_trigger else "手动触发"),
             )
-        msgs: List[str] = []
-        for file, history_date in self.__list_files(
-            self._target_type, self._target_path
-        ):
-            if self._event.is_set():
-                logger.warning("媒体库刮削更新服务已停止！")
-                return
+        file_filter = self.__file_filter()
+        with trace(self._tracer, "准备", "setup"):
+            history_index = self.__open_history_index()
+            if history_index:
+                cleanup.callback(history_index.close)
+            cache = (
+                MetadataCache(
+                    self.get_data_path() / "metadata.cache",
+                    ttl=self._cache_ttl * 86400,
+                    max_entries=self._cache_size,
+                )
+                if self._cache_ttl > 0
+                else None
+            )
+            if cache:
+                cleanup.callback(cache.save)
+        # 多实例分片时断点保存在共享目录中各分片下
+        coordinator = self.__shard_coordinator(libraries)
+        cursors = {} if coordinator else self.__load_cursors(libraries)
+        top_filters: Dict[str, Callable[[FileItem], bool]] = {}
+        # 本次运行推进的各媒体库断点，每次运行流水线前重新创建
+        positions = LibraryCursors(cursors)
+        metrics = PluginMetrics(self.__class__.__name__)
+
+        def run(
+            max_seconds: float, max_items: int, event: Optional[Event] = None
+        ) -> RunStats:
+            pipeline: Optional[Pipeline] = None
+
+            def resolve(item: Tuple[FileRecord, Library]):
+                # 查询前先并入已确认完成的任务，未确认的任务数不超过执行中的任务数
+                if pipeline and pipeline.stats.last_done:
+                    positions.advance(pipeline.stats.last_done[4])
+                return self.__resolve(item, dates, history_index, positions)
+
+            pipeline = Pipeline(
+                name="媒体库刮削更新",
+                lister=lambda: round_robin(
+                    self.__list_files(
+                        library, cursors.get(library.key), top_filters.get(library.key)
+                    )
+                    for library in libraries
+                ),
+                file_filter=lambda item: file_filter(item[0]),
+                resolver=resolve,
+                action=lambda task: self.__scrape(task, cache),
+                label=lambda x: str(x[0].path),
+                workers=self._workers,
+                max_seconds=max_seconds,
+                max_items=max_items,
+                event=event or self._event,
+                async_io=self._async_io,
+                storage_of=lambda task: (task[0].storage,),
+                storage_limits=StorageLimits(self._storage_limits),
+                timeout=self._timeout,
+                retries=self._retries,
+                metrics=metrics,
+                tracer=self._tracer,
+            )
+            return pipeline.run()
+
+        shard_count: int = 0
+
+        def run_shards() -> RunStats:
+            """
+            依次认领分片并刮削，处理完一个分片才认领下一个，单次运行上限在各分片间共用
+            """
+            nonlocal cursors, positions, shard_count
+            stats = RunStats()
+            for shard in coordinator.claims(self._event):
+                cursors = dict(shard.cursor or {})
+                positions = LibraryCursors(cursors)
+                # 各媒体库的一级子目录名称加上媒体库作为前缀参与分片
+                top_filters.update(
+                    (
+                        library.key,
+                        shard_filter(coordinator.count, shard.index, library.key),
+                    )
+                    for library in libraries
+                )
+                logger.info(
+                    f"开始刮削分片 {shard.index}{'，从断点继续' if cursors else ''}"
+                )
+                max_seconds = self._max_minutes * 60
+                if max_seconds:
+                    max_seconds = max(max_seconds - stats.duration, 1)
+                max_items = self._max_items
+                if max_items:
+                    max_items = max(max_items - stats.dispatched, 1)
+                result = run(max_seconds, max_items, shard.stop)
+                if shard.stop.lost:
+                    # 租约已被其他实例回收，该分片由回收者从已保存的断点继续，
+                    # 只因租约丢失而停止时不视为插件退出
+                    result.stopped = self._event.is_set()
+                stats.merge(result)
+                if result.stopped or result.sliced:
+                    if result.last_done:
+                        positions.advance(result.last_done[4])
+                    coordinator.release(shard, positions.cursors, result)
+                    break
+                if not shard.stop.lost:
+                    coordinator.complete(shard, result)
+                    shard_count += 1
+                if (self._max_items and stats.dispatched >= self._max_items) or (
+                    self._max_minutes and stats.duration >= self._max_minutes * 60
+                ):
+                    stats.sliced = True
+                    break
+            stats.finished = time.time()
+            return stats
+
+        if coordinator:
+            with coordinator:
+                stats = run_shards()
+                report = coordinator.finish()
+        else:
+            stats = run(self._max_minutes * 60, self._max_items)
+        save_run(self, stats, self.config)
+        cache_summary = cache.summary if cache else "未启用"
+        msgs = sampled(stats.success_msgs, stats.success)
 
-            logger.debug(f"文件信息：{file}")
-            scrape(file, self._target_type)
-            msg = f"{file.name}（{history_date}）"
-            msgs.append(msg)
-            logger.info(msg + "：更新刮削完成")
+        if coordinator:
+            if not shard_count and not stats.listed:
+                logger.info("没有可认领的分片")
+            if report:
+                self.__report_shards(report)
+        elif not stats.listed:
+            logger.error(
+                f"未找到文件：{'、'.join(library.name for library in libraries)}"
+            )
+        if stats.stopped:
+            logger.warning("媒体库刮削更新服务已停止！")
+            if stats.last_done and not coordinator:
+                self.__save_cursors(positions, stats.last_done)
+            return
+        if not stats.sliced:
+            self.del_data("cursor")
+        elif coordinator:
+            logger.info("已达到单次运行上限，剩余分片将在下次运行时继续刮削")
+        elif stats.last_done:
+            self.__save_cursors(positions, stats.last_done)
+            logger.info("已达到单次运行上限，剩余文件将在下次运行时继续刮削")
 
         waste_time = datetime.now(tz=pytz.timezone(settings.TZ)) - start_time
+        shard_summary = (
+            f"本实例完成 {shard_count} 个（{coordinator.sweep.name}）"
+            if coordinator
+            else "未启用"
+        )
         logger.info(
-            f"更新 【{StorageSchema(self._target_type).name}】{self._target_path} 媒体库刮削完成，耗时：{waste_time}，更新任务数：{len(msgs)}"
+            f"更新 {len(libraries)} 个媒体库刮削完成，耗时：{waste_time}，更新任务数：{stats.success}，失败：{len(stats.failed_msgs)}（超时 {stats.timeouts}，重试 {stats.retried}），预筛选排除：{file_filter.summary}，识别缓存：{cache_summary}，多实例分片：{shard_summary}"
         )
         if self._notify:
             self.post_message(
                 mtype=NotificationType.Plugin,
                 title="【插件】媒体刮削更新运行结束",
-                text=f"媒体库：【{StorageSchema(self._target_type).name}】{self._target_path}\n更新入库时间晚于 {date} 的文件\n运行耗时：{waste_time}\n更新任务数：{len(msgs)}"
-                + ("\n\n更新文件列表：\n" + "\n".join(msgs))
-                if self._detail_notify
-                else "",
+                text=f"媒体库：\n{scope}\n运行耗时：{waste_time}\n更新任务数：{stats.success}\n识别缓存：{cache_summary}"
+                + (
+                    "\n\n更新文件列表：\n" + "\n".join(msgs)
+                    if self._detail_notify
+                    else ""
+                ),
+            )
+
+    def __libraries(self) -> List[Library]:
+        """
+        本次运行的媒体库：基本设置中的媒体库与更多媒体库，重复的只保留第一个
+        """
+        libraries = parse_libraries(self._libraries, self._days)
+        if self._target_path:
+            libraries.insert(
+                0, Library(self._target_type, self._target_path, self._days)
+            )
+        unique: Dict[str, Library] = {}
+        for library in libraries:
+            unique.setdefault(library.key, library)
+        return list(unique.values())
+
+    def __open_history_index(self) -> Optional[HistoryIndex]:
+        """
+        打开并同步本地整理记录索引，失败时回退到直接查询整理记录
+        """
+        if not self._history_index:
+            return None
+        index = HistoryIndex(self.get_data_path() / "history.db")
+        try:
+            index.refresh()
+            return index
+        except Exception as e:
+            logger.error(f"整理记录索引同步失败，本次直接查询整理记录：{e}")
+            index.close()
+            return None
+
+    def __load_cursors(self, libraries: List[Library]) -> Dict[str, str]:
+        """
+        读取上次运行保存的各媒体库断点，不再配置的媒体库断点失效
+        """
+        cursor = self.get_data("cursor") or {}
+        if "library" in cursor:
+            # 单媒体库版本保存的断点
+            cursors = {cursor["library"]: cursor.get("path")}
+        else:
+            cursors = cursor.get("libraries") or {}
+        keys = {library.key for library in libraries}
+        return {key: path for key, path in cursors.items() if key in keys and path}
+
+    def __save_cursors(self, positions: LibraryCursors, last_done: Tuple) -> None:
+        """
+        last_done 及之前提交的任务均已完成，保存各媒体库的断点
+        """
+        cursors = positions.advance(last_done[4])
+        self.save_data("cursor", {"libraries": cursors})
+        for key, path in cursors.items():
+            logger.info(f"已保存媒体库刮削更新断点：【{key}】{path}")
+
+    def __shard_coordinator(
+        self, libraries: List[Library]
+    ) -> Optional[ShardCoordinator]:
+        """
+        共享目录中本插件、本组媒体库对应的分片协调器，配置不同的实例互不干扰
+        """
+        if not self._shard_dir:
+            return None
+        fingerprint = "|".join(
+            [*sorted(library.key for library in libraries), str(self._shard_count)]
+        )
+        return ShardCoordinator(
+            self._shard_dir,
+            f"LibraryScrapeUpdate-{sha1(fingerprint.encode('utf-8')).hexdigest()[:8]}",
+            self._shard_count,
+        )
+
+    def __report_shards(self, report: Dict[str, Any]) -> None:
+        """
+        本实例最后完成分片时汇总本轮所有实例的结果
+        """
+        self.save_data("shard_report", report)
+        owners = "，".join(f"{k} {v} 个" for k, v in report["owners"].items())
+        text = (
+            f"{report['sweep']} 共 {report['shards']} 个分片已全部完成（{owners}）；"
+            f"扫描 {report['listed']} 个文件，刮削 {report['success']} 个，"
+            f"失败 {report['failed']} 个，跳过 {report['skipped']} 个"
+        )
+        logger.info(f"多实例分片：{text}")
+        if self._notify:
+            self.post_message(
+                mtype=NotificationType.Plugin,
+                title="【插件】媒体刮削更新分片汇总",
+                text="\n".join([text, *report["failed_msgs"]]),
             )
 
+    def __file_filter(self) -> FileFilter:
+        """
+        编译本次运行的文件预筛选规则
+        """
+        return FileFilter(
+            extensions=settings.RMT_MEDIAEXT,
+            include=self._include,
+            exclude=self._exclude,
+            exclude_dirs=self._exclude_dirs,
+            min_size=int(self._min_size * 1024**2),
+            mtime_window=self._mtime_window,
+        )
+
     def __list_files(
         self,
-        storage_type: str,
-        starge_path: str,
-    ) -> Generator[Tuple[FileItem, str], Any, None]:
-        date = time.strftime(
-            "%Y-%m-%d %H:%M:%S", time.localtime(time.time() - 86400 * self._days)
+        library: Library,
+        cursor: Optional[str] = None,
+        top_filter: Optional[Callable[[FileItem], bool]] = None,
+    ) -> Generator[Tuple[FileRecord, Library], Any, None]:
+        """
+        按路径顺序列出媒体库中断点之后的文件，与所在媒体库一并返回
+        :param top_filter: 只列出满足条件的一级子目录与文件，分片运行时使用
+        """
+        if cursor:
+            logger.info(f"{library.name} 从上次断点继续刮削：{cursor}")
+        # 扫描结果按路径顺序输出，边扫描边交给后续阶段，断点续跑时顺序稳定
+        for file in self.__scan(
+            FileItem(storage=library.storage, path=library.path), top_filter
+        ):
+            if cursor and (file.path or "") <= cursor:
+                continue
+            yield file, library
+
+    def __scan(
+        self,
+        fileitem: FileItem,
+        top_filter: Optional[Callable[[FileItem], bool]] = None,
+    ) -> Iterable[FileRecord]:
+        """
+        扫描媒体库，异步 I/O 下在事件循环中逐级并发列目录
+        """
+        if self._async_io:
+            concurrency = StorageLimits(self._storage_limits).get(
+                fileitem.storage, self._scan_workers
+            )
+            return scan_files_async(
+                self.storagechain, fileitem, concurrency, self._event, top_filter
+            )
+        return scan_files(
+            self.storagechain, fileitem, self._scan_workers, self._event, top_filter
+        )
+
+    def __resolve(
+        self,
+        item: Tuple[FileRecord, Library],
+        dates: Dict[str, str],
+        history_index: Optional[HistoryIndex] = None,
+        positions: Optional[LibraryCursors] = None,
+    ) -> Tuple[FileRecord, str, Optional[Tuple], Library, int] | Skip:
+        """
+        查询媒体文件的整理记录，只更新所在媒体库入库时间下限之后入库的文件
+        :param dates: 各媒体库的入库时间下限
+        :param history_index: 本地整理记录索引，为空时直接查询整理记录
+        :param positions: 记录提交的任务，任务末尾为提交序号
+        """
+        file, library = item
+        if history_index:
+            history = history_index.get("dest", file.path)
+        else:
+            history = self.transferhis.get_by_dest(dest=file.path)
+        if not history:
+            return Skip("未找到整理记录", record=False)
+        if history.dest_storage != library.storage:
+            return Skip("存储类型不匹配", record=False)
+        if history.date < dates[library.key]:
+            return Skip("入库时间过早", record=False)
+        seq = positions.submit(library.key, file.path) if positions else -1
+        return file, str(history.date), self.__media_key(history), library, seq
+
+    @staticmethod
+    def __media_key(history: "TransferHistory") -> Optional[Tuple]:
+        """
+        识别缓存键 (来源, 媒体ID, 媒体类型, 季, 语言)，整理记录中没有媒体ID时返回 None
+        TMDB 的电影与电视剧 ID 相互独立，媒体类型需作为键的一部分
+        """
+        if history.tmdbid:
+            source, mediaid = "themoviedb", history.tmdbid
+        elif history.doubanid:
+            source, mediaid = "douban", history.doubanid
+        else:
+            return None
+        return (
+            source,
+            mediaid,
+            history.type or "",
+            history.seasons or "",
+            settings.TMDB_LOCALE,
         )
-        files = self.storagechain.list_files(
-            FileItem(storage=storage_type, path=starge_path), True
+
+    def __recognize(self, media: Tuple, cache: MetadataCache) -> Optional["MediaInfo"]:
+        """
+        按整理记录中的媒体ID识别，优先使用缓存
+        """
+        source, mediaid, mtype, _, _ = media
+        return cache.get(
+            media,
+            lambda: self.mediachain.recognize_media(
+                mtype=MediaType(mtype) if mtype else None,
+                tmdbid=mediaid if source == "themoviedb" else None,
+                doubanid=mediaid if source == "douban" else None,
+            ),
         )
-        if files is None or len(files) == 0:
-            logger.error(f"未找到文件：【{storage_type}】{starge_path}")
-            return
+
+    def __scrape(
+        self,
+        task: Tuple[FileRecord, str, Optional[Tuple], Library, int],
+        cache: Optional[MetadataCache] = None,
+    ) -> Tuple[bool, str]:
+        file, history_date, media, library, _ = task
+        fileitem = file.to_fileitem()
+        logger.debug(f"文件信息：{fileitem}")
+        mediainfo = self.__recognize(media, cache) if media and cache else None
+        if mediainfo:
+            self.mediachain.scrape_metadata(
+                fileitem=fileitem,
+                meta=MetaInfoPath(Path(fileitem.path)),
+                mediainfo=mediainfo,
+                overwrite=True,
+            )
         else:
-            for file in files:
-                if (
-                    file.type == "file"
-                    and file.extension is not None
-                    and f".{file.extension.lower()}" in settings.RMT_MEDIAEXT
-                    and file.path is not None
-                ):
-                    history = self.transferhis.get_by_dest(dest=file.path)
-                    if (
-                        history.dest_storage == self._target_type
-                        and history.date >= date
-                    ):
-                        yield (file, str(history.date))
+            # 无法按媒体ID识别时按文件路径识别
+            scrape(fileitem, library.storage)
+        msg = f"{file.name}（{history_date}）"
+        logger.info(msg + "：更新刮削完成")
+        return True, msg
 
     def stop_service(self) -> None:
         """
@@ -361,9 +1235,16 @@ class LibraryScrapeUpdate(_PluginBase):
             if self._scheduler:
                 self._scheduler.remove_all_jobs()
                 if self._scheduler.running:
-                    self._event.set()
-                    self._scheduler.shutdown()
-                    self._event.clear()
+                    self._scheduler.shutdown(wait=False)
                 self._scheduler = None
+            if self._running:
+                # 通知运行中的任务退出，卡住的调用不再等待
+                self._event.set()
+                if not wait_until(lambda: not self._running, STOP_TIMEOUT + 5):
+                    logger.warning(f"{self.plugin_name}：运行中的任务未能及时退出")
         except Exception as e:
             print(str(e))
+
+
+# 插件模块（含依赖的辅助模块）的导入耗时（秒）
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
@@ -0,0 +1,89 @@
+from concurrent.futures import Executor, Future
+from functools import partial
+from itertools import count
+from threading import Thread
+from typing import Any, Callable, Dict, Optional
+import asyncio
+import inspect
+import re
+
+from app.log import logger
+
+
+class StorageLimits:
+    """
+    按存储类型限制同时进行的请求数
+    """
+
+    def __init__(self, rules: str = "", default: int = 0):
+        """
+        :param rules: 如 u115:4,alipan:8，未配置的存储使用 default
+        :param default: 默认并发数，0 为不限制
+        """
+        self.default = default
+        self.limits: Dict[str, int] = {}
+        for rule in re.split(r"[,，\n]", rules or ""):
+            if ":" not in rule:
+                continue
+            storage, limit = (s.strip() for s in rule.split(":", 1))
+            try:
+                self.limits[storage] = int(limit)
+            except ValueError:
+                logger.warning(f"存储并发限制配置错误：{rule}")
+
+    def get(self, storage: str, default: Optional[int] = None) -> int:
+        return self.limits.get(storage, self.default if default is None else default)
+
+
+class StorageSemaphores:
+    """
+    事件循环内按存储类型分配的信号量，只能在同一个事件循环中使用
+    """
+
+    def __init__(self, limits: StorageLimits):
+        self.limits = limits
+        self._semaphores: Dict[str, Optional[asyncio.Semaphore]] = {}
+
+    def get(self, storage: str) -> Optional[asyncio.Semaphore]:
+        if storage not in self._semaphores:
+            limit = self.limits.get(storage)
+            self._semaphores[storage] = asyncio.Semaphore(limit) if limit > 0 else None
+        return self._semaphores[storage]
+
+
+async def call(
+    func: Callable[..., Any], *args: Any, executor: Optional[Executor] = None
+) -> Any:
+    """
+    在事件循环中调用 func，协程函数直接等待，同步函数回退到线程池执行
+    """
+    if inspect.iscoroutinefunction(func):
+        return await func(*args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(func, *args))
+
+
+class DaemonExecutor(Executor):
+    """
+    每次调用使用独立的守护线程，卡住的调用不会占满线程池，也不会阻塞退出
+    """
+
+    def __init__(self, prefix: str = "call-"):
+        self._prefix = prefix
+        self._count = count()
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Future:
+        future: Future = Future()
+
+        def run() -> None:
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+        Thread(
+            target=run, name=f"{self._prefix}{next(self._count)}", daemon=True
+        ).start()
+        return future
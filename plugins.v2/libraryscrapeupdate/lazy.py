@@ -0,0 +1,65 @@
+from functools import wraps
+from importlib import import_module
+from threading import Lock
+from typing import Any, Callable, Dict, Optional
+
+_lock = Lock()
+
+
+def _resolve(path: str) -> Any:
+    module, name = path.rsplit(".", 1)
+    return getattr(import_module(module), name)
+
+
+def lazy_import(path: str) -> Callable[..., Any]:
+    """
+    首次调用时才导入的函数或类，避免加载插件时导入主程序中较重的模块
+    :param path: 完整路径，如 app.api.endpoints.transfer.manual_transfer
+    """
+    target: Optional[Callable[..., Any]] = None
+
+    def proxy(*args: Any, **kwargs: Any) -> Any:
+        nonlocal target
+        if target is None:
+            target = _resolve(path)
+        return target(*args, **kwargs)
+
+    proxy.__name__ = path.rsplit(".", 1)[1]
+    proxy.__qualname__ = proxy.__name__
+    return proxy
+
+
+class LazyInstance:
+    """
+    首次访问时才导入并创建的类属性，所有实例共享同一个对象
+    在实例上赋值会覆盖该属性
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: 类的完整路径，如 app.chain.storage.StorageChain
+        """
+        self.path = path
+        self._value: Any = None
+
+    def __get__(self, instance: Any, owner: Any) -> Any:
+        if self._value is None:
+            with _lock:
+                if self._value is None:
+                    self._value = _resolve(self.path)()
+        return self._value
+
+
+def cached_form(func: Callable[[Any], Any]) -> Callable[[Any], Any]:
+    """
+    配置页面结构不依赖插件状态，只构建一次，调用方不应修改返回值
+    """
+    cache: Dict[str, Any] = {}
+
+    @wraps(func)
+    def wrapper(self: Any) -> Any:
+        if "form" not in cache:
+            cache["form"] = func(self)
+        return cache["form"]
+
+    return wrapper
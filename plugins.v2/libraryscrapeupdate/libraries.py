@@ -0,0 +1,103 @@
+from collections import deque
+from threading import Lock
+from typing import Deque, Dict, List, Optional, Tuple
+import time
+
+from app.log import logger
+from app.schemas.types import StorageSchema
+
+
+class Library:
+    """
+    待更新刮削的媒体库，各自按入库天数筛选
+    """
+
+    __slots__ = ("storage", "path", "days")
+
+    def __init__(self, storage: str, path: str, days: int):
+        self.storage = storage
+        self.path = path
+        self.days = days
+
+    @property
+    def key(self) -> str:
+        """
+        断点使用的媒体库标识
+        """
+        return f"{self.storage}:{self.path}"
+
+    @property
+    def name(self) -> str:
+        return f"【{StorageSchema(self.storage).name}】{self.path}"
+
+    def since(self) -> str:
+        """
+        入库时间下限，早于该时间入库的文件不更新
+        """
+        return time.strftime(
+            "%Y-%m-%d %H:%M:%S", time.localtime(time.time() - 86400 * self.days)
+        )
+
+
+class LibraryCursors:
+    """
+    各媒体库的刮削断点，按提交顺序推进
+    任务提交时编号，确认完成的任务随即并入断点并丢弃，只保留尚未确认的任务
+    """
+
+    def __init__(self, cursors: Optional[Dict[str, str]] = None):
+        self.cursors: Dict[str, str] = dict(cursors or {})  # 已确认完成的断点
+        self._pending: Dict[str, Deque[Tuple[int, str]]] = {}  # 各媒体库未确认的任务
+        self._seq: int = 0
+        self._lock = Lock()
+
+    def submit(self, key: str, path: str) -> int:
+        """
+        记录提交的任务，返回其提交序号
+        """
+        with self._lock:
+            seq = self._seq
+            self._seq += 1
+            self._pending.setdefault(key, deque()).append((seq, path))
+        return seq
+
+    def advance(self, done: int) -> Dict[str, str]:
+        """
+        序号不大于 done 的任务均已完成，各媒体库的断点推进到其中最后一个任务
+        """
+        with self._lock:
+            for key, pending in self._pending.items():
+                while pending and pending[0][0] <= done:
+                    self.cursors[key] = pending.popleft()[1]
+            return dict(self.cursors)
+
+
+def parse_libraries(rules: str, default_days: int) -> List[Library]:
+    """
+    解析更多媒体库配置
+    :param rules: 每行一个，如 u115:/媒体库/动漫|3，天数省略时使用 default_days
+    """
+    libraries = []
+    for rule in (rules or "").splitlines():
+        rule = rule.strip()
+        if not rule:
+            continue
+        days = default_days
+        if "|" in rule:
+            rule, value = (s.strip() for s in rule.rsplit("|", 1))
+            try:
+                days = int(value)
+            except ValueError:
+                logger.warning(f"更多媒体库天数配置错误：{rule}|{value}")
+                continue
+        if ":" not in rule:
+            logger.warning(f"更多媒体库配置错误，缺少存储类型：{rule}")
+            continue
+        storage, path = (s.strip() for s in rule.split(":", 1))
+        try:
+            StorageSchema(storage)
+        except ValueError:
+            logger.warning(f"更多媒体库存储类型不支持：{rule}")
+            continue
+        libraries.append(Library(storage, path, days))
+    return libraries
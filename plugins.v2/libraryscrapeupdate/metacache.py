@@ -0,0 +1,96 @@
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Hashable, Optional, Tuple
+import pickle
+import time
+
+from app.log import logger
+
+
+class MetadataCache:
+    """
+    媒体识别结果的磁盘缓存，跨运行保留
+    超过有效期的条目重新识别，超出容量时淘汰最久未使用的条目
+    """
+
+    def __init__(self, path: Path, ttl: float, max_entries: int = 500):
+        """
+        :param path: 缓存文件路径
+        :param ttl: 有效期（秒）
+        :param max_entries: 最多缓存的条目数
+        """
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max(max_entries, 1)
+        self.hits: int = 0
+        self.misses: int = 0
+        self.expired: int = 0  # 未命中中因过期重新识别的次数
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = Lock()
+        self._dirty = False
+        self.__load()
+
+    def __load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            with self.path.open("rb") as f:
+                self._entries = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"读取识别缓存失败，将重新建立：{e}")
+            self._entries = OrderedDict()
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Optional[Any]:
+        """
+        读取缓存，缺失或过期时调用 loader 重新获取，loader 返回 None 时不缓存
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            if entry:
+                self.expired += 1
+        value = loader()
+        if value is None:
+            return None
+        with self._lock:
+            self._entries[key] = (now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+        return value
+
+    def save(self) -> None:
+        """
+        写回磁盘，先写临时文件再替换，避免中断后留下损坏的缓存
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            # 顺带清理已过期的条目
+            now = time.time()
+            for key in [k for k, v in self._entries.items() if now - v[0] >= self.ttl]:
+                del self._entries[key]
+            data = pickle.dumps(self._entries)
+            self._dirty = False
+        tmp = self.path.with_suffix(".tmp")
+        try:
+            tmp.write_bytes(data)
+            tmp.replace(self.path)
+        except Exception as e:
+            logger.error(f"保存识别缓存失败：{e}")
+
+    @property
+    def summary(self) -> str:
+        total = self.hits + self.misses
+        ratio = self.hits / total * 100 if total else 0
+        return (
+            f"命中 {self.hits} 次，未命中 {self.misses} 次（其中过期 {self.expired} 次），"
+            f"命中率 {ratio:.1f}%"
+        )
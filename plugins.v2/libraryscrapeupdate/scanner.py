@@ -0,0 +1,410 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from fnmatch import translate
+from pathlib import PurePosixPath
+from threading import Event, Thread
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Optional,
+    Pattern,
+    Tuple,
+)
+import asyncio
+import re
+import sys
+import time
+
+from app.log import logger
+from app.schemas import FileItem
+
+from .aio import call
+
+if TYPE_CHECKING:
+    from app.chain.storage import StorageChain
+
+# 重建 FileItem 时需要保留的网盘文件标识
+_EXTRA_FIELDS = ("fileid", "parent_fileid", "pickcode", "drive_id", "url")
+
+
+class FileRecord:
+    """
+    扫描结果的紧凑表示，只保留存储、路径、大小、修改时间与网盘文件标识
+    路径拆分为 扫描根目录 + 所在目录 + 文件名，根目录与所在目录字符串在文件间共用
+    """
+
+    __slots__ = ("storage", "root", "parent", "name", "size", "modify_time", "extra")
+
+    type = "file"
+
+    def __init__(self, item: FileItem, root: str = ""):
+        path = item.path or ""
+        if root and path.startswith(root):
+            rel = path[len(root) :]
+        else:
+            rel, root = path, ""
+        index = rel.rfind("/") + 1
+        self.storage: str = sys.intern(item.storage)
+        self.root: str = root
+        self.parent: str = sys.intern(rel[:index])
+        self.name: str = rel[index:]
+        self.size: Optional[int] = item.size
+        self.modify_time: Optional[float] = item.modify_time
+        extra = {k: getattr(item, k, None) for k in _EXTRA_FIELDS}
+        self.extra: Optional[Dict[str, Any]] = {
+            k: v for k, v in extra.items() if v
+        } or None
+
+    @property
+    def path(self) -> str:
+        return self.root + self.parent + self.name
+
+    @property
+    def extension(self) -> Optional[str]:
+        _, dot, ext = self.name.rpartition(".")
+        return ext if dot else None
+
+    def to_fileitem(self) -> FileItem:
+        """
+        重建完整的 FileItem，只在刮削等需要时调用
+        """
+        return FileItem(
+            storage=self.storage,
+            type="file",
+            path=self.path,
+            name=self.name,
+            basename=self.name.rpartition(".")[0] or self.name,
+            extension=self.extension,
+            size=self.size,
+            modify_time=self.modify_time,
+            **(self.extra or {}),
+        )
+
+    def __repr__(self) -> str:
+        return f"FileRecord({self.storage}:{self.path})"
+
+
+def compact_files(
+    items: Optional[Iterable[FileItem]], root: str
+) -> Generator[FileRecord, None, None]:
+    """
+    将列出的文件转换为 FileRecord，忽略目录
+    """
+    for item in items or []:
+        if item.type == "file":
+            yield FileRecord(item, root)
+
+
+def _root(fileitem: FileItem) -> str:
+    return sys.intern((fileitem.path or "").rstrip("/") + "/")
+
+
+def _path_key(item: Any) -> str:
+    """
+    按路径排序的键，目录以 / 结尾，使目录排在其下文件所在的位置
+    """
+    path = item.path or ""
+    if item.type == "dir":
+        return path.rstrip("/") + "/"
+    return path
+
+
+def _list_compact(
+    storagechain: "StorageChain", fileitem: FileItem, root: str
+) -> List[FileRecord]:
+    """
+    递归列出目录并立即转换，原始 FileItem 列表在扫描线程内释放
+    """
+    files = list(compact_files(storagechain.list_files(fileitem, True), root))
+    files.sort(key=_path_key)
+    return files
+
+
+def _ordered(
+    top: List[FileItem], results: Iterable[Any], root: str, event: Optional[Event]
+) -> Generator[FileRecord, None, None]:
+    """
+    按路径顺序合并一级文件与各子目录的扫描结果
+    :param results: 与排序后的一级子目录一一对应，返回该目录下已排序的文件
+    """
+    results = iter(results)
+    for item in sorted(top, key=_path_key):
+        if item.type == "file":
+            yield FileRecord(item, root)
+            continue
+        if item.type != "dir":
+            continue
+        future = next(results)
+        if event and event.is_set():
+            return
+        try:
+            yield from future.result() or []
+        except Exception as e:
+            logger.error(f"扫描目录失败：【{item.storage}】{item.path}：{e}")
+
+
+def scan_files(
+    storagechain: "StorageChain",
+    fileitem: FileItem,
+    workers: int = 4,
+    event: Optional[Event] = None,
+    top_filter: Optional[Callable[[FileItem], bool]] = None,
+) -> Generator[FileRecord, None, None]:
+    """
+    分片并行扫描目录下的所有文件，按路径顺序输出
+    先列出一级子目录，再在线程池中分别递归扫描各子目录，子目录扫描完成即可输出
+    :param workers: 并行扫描的子目录数，<= 1 时退化为单次递归扫描
+    :param event: 退出事件，设置后停止扫描
+    :param top_filter: 只扫描返回 True 的一级子目录与文件
+    """
+    root = _root(fileitem)
+    if workers <= 1 and not top_filter:
+        yield from _list_compact(storagechain, fileitem, root)
+        return
+
+    top = storagechain.list_files(fileitem, False)
+    if top and top_filter:
+        top = [f for f in top if top_filter(f)]
+    if not top:
+        return
+    dirs = sorted((f for f in top if f.type == "dir"), key=_path_key)
+    if not dirs:
+        yield from _ordered(top, [], root, event)
+        return
+
+    with ThreadPoolExecutor(
+        max_workers=min(max(workers, 1), len(dirs)), thread_name_prefix="scan"
+    ) as pool:
+        futures = [pool.submit(_list_compact, storagechain, d, root) for d in dirs]
+        try:
+            yield from _ordered(top, futures, root, event)
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def scan_files_async(
+    storagechain: "StorageChain",
+    fileitem: FileItem,
+    concurrency: int = 32,
+    event: Optional[Event] = None,
+    top_filter: Optional[Callable[[FileItem], bool]] = None,
+) -> Generator[FileRecord, None, None]:
+    """
+    在单个事件循环中逐级列出目录，同时进行的列目录请求不超过 concurrency
+    适用于网盘等单次请求延迟高的存储，同步接口回退到线程池执行
+    输出顺序与 scan_files 一致，按路径顺序输出
+    :param top_filter: 只扫描返回 True 的一级子目录与文件
+    """
+    root = _root(fileitem)
+    top = storagechain.list_files(fileitem, False)
+    if top and top_filter:
+        top = [f for f in top if top_filter(f)]
+    if not top:
+        return
+    dirs = sorted((f for f in top if f.type == "dir"), key=_path_key)
+    if not dirs:
+        yield from _ordered(top, [], root, event)
+        return
+
+    results: List[Future] = [Future() for _ in dirs]
+    stop = Event()  # 输出结束后停止剩余的扫描
+    concurrency = max(concurrency, 1)
+
+    async def walk(
+        d: FileItem, semaphore: asyncio.Semaphore, executor: ThreadPoolExecutor
+    ) -> List[FileRecord]:
+        if stop.is_set() or (event and event.is_set()):
+            return []
+        async with semaphore:
+            items = await call(storagechain.list_files, d, False, executor=executor)
+        items = sorted(items or [], key=lambda f: f.path or "")
+        subdirs = [f for f in items if f.type == "dir"]
+        files = list(compact_files(items, root))
+        del items
+        for sub in await asyncio.gather(
+            *(walk(s, semaphore, executor) for s in subdirs)
+        ):
+            files.extend(sub)
+        return files
+
+    async def walk_top(
+        d: FileItem,
+        future: Future,
+        semaphore: asyncio.Semaphore,
+        executor: ThreadPoolExecutor,
+    ) -> None:
+        try:
+            files = await walk(d, semaphore, executor)
+            files.sort(key=_path_key)
+            future.set_result(files)
+        except Exception as e:
+            future.set_exception(e)
+
+    async def main() -> None:
+        semaphore = asyncio.Semaphore(concurrency)
+        with ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="scan"
+        ) as executor:
+            await asyncio.gather(
+                *(
+                    walk_top(d, future, semaphore, executor)
+                    for d, future in zip(dirs, results)
+                )
+            )
+
+    runner = Thread(target=asyncio.run, args=(main(),), name="scan-loop", daemon=True)
+    runner.start()
+    try:
+        yield from _ordered(top, results, root, event)
+    finally:
+        stop.set()
+        runner.join()
+
+
+def round_robin(sources: Iterable[Iterable[Any]]) -> Generator[Any, Any, None]:
+    """
+    轮流从各来源取一项，来源耗尽后跳过，较大的来源不会让其他来源一直等待
+    """
+    iterators = [iter(source) for source in sources]
+    while iterators:
+        for iterator in list(iterators):
+            try:
+                yield next(iterator)
+            except StopIteration:
+                iterators.remove(iterator)
+
+
+def compile_patterns(rules: str) -> Optional[Pattern]:
+    """
+    将多行规则编译为一个正则，默认按通配符匹配完整路径，以 re: 开头的行按正则匹配
+    """
+    parts = []
+    for line in rules.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("re:"):
+            parts.append(f"(?:.*?(?:{line[3:]}))")
+        else:
+            parts.append(f"(?:{translate(line)})")
+    if not parts:
+        return None
+    return re.compile("|".join(parts), re.IGNORECASE)
+
+
+def valid_patterns(rules: str) -> str:
+    """
+    检查多行规则，去掉无法编译的 re: 规则行并记录警告
+    """
+    lines = []
+    for line in (rules or "").splitlines():
+        if line.strip().startswith("re:"):
+            try:
+                re.compile(line.strip()[3:])
+            except re.error as e:
+                logger.warning(f"正则规则无效，已忽略：{line.strip()}：{e}")
+                continue
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def valid_days_window(window: str) -> str:
+    """
+    检查修改时间范围，格式错误时记录警告并返回空字符串（不限制）
+    """
+    window = (window or "").strip()
+    if not window:
+        return ""
+    try:
+        if "-" not in window:
+            raise ValueError(window)
+        for value in window.split("-", 1):
+            if value.strip():
+                float(value)
+    except ValueError:
+        logger.warning(f"修改时间范围格式错误，已忽略：{window}")
+        return ""
+    return window
+
+
+def parse_days_window(window: str) -> Tuple[Optional[float], Optional[float]]:
+    """
+    解析修改时间范围，如 0-30 表示 30 天内修改，365- 表示一年前修改，返回 (最早, 最晚) 时间戳
+    """
+    if not window or "-" not in window:
+        return None, None
+    start, end = (s.strip() for s in window.split("-", 1))
+    now = time.time()
+    newest = now - float(start) * 86400 if start and float(start) > 0 else None
+    oldest = now - float(end) * 86400 if end else None
+    return oldest, newest
+
+
+class FileFilter:
+    """
+    候选文件预筛选，单次运行只编译一次，按开销从低到高依次检查
+    """
+
+    def __init__(
+        self,
+        extensions: Iterable[str],
+        include: str = "",
+        exclude: str = "",
+        exclude_dirs: str = "",
+        min_size: int = 0,
+        mtime_window: str = "",
+    ):
+        self._extensions = frozenset(e.lower() for e in extensions)
+        self._include = compile_patterns(include)
+        self._exclude = compile_patterns(exclude)
+        self._exclude_dirs = frozenset(
+            d.strip().lower() for d in re.split(r"[,，\n]", exclude_dirs) if d.strip()
+        )
+        self._min_size = min_size
+        self._oldest, self._newest = parse_days_window(mtime_window)
+        self.rejected: Dict[str, int] = {}  # 各原因排除的文件数
+
+    def __reject(self, reason: str) -> bool:
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        return False
+
+    @staticmethod
+    def __dirs(f: FileRecord | FileItem) -> List[str]:
+        """
+        文件所在的各级目录名，只取扫描根目录之下的部分，根目录及其上级不参与排除
+        """
+        if isinstance(f, FileRecord):
+            return [part for part in f.parent.split("/") if part]
+        return list(PurePosixPath(f.path).parts[:-1])
+
+    def __call__(self, f: FileRecord | FileItem) -> bool:
+        if f.type != "file" or not f.path or not f.extension:
+            return False
+        if f".{f.extension.lower()}" not in self._extensions:
+            return False
+        if self._min_size and (f.size or 0) < self._min_size:
+            return self.__reject("文件过小")
+        if self._oldest is not None or self._newest is not None:
+            mtime = f.modify_time or 0
+            if (self._oldest is not None and mtime < self._oldest) or (
+                self._newest is not None and mtime > self._newest
+            ):
+                return self.__reject("修改时间不符")
+        if self._exclude_dirs and any(
+            part.lower() in self._exclude_dirs for part in self.__dirs(f)
+        ):
+            return self.__reject("排除目录")
+        if self._exclude and self._exclude.match(f.path):
+            return self.__reject("排除规则")
+        if self._include and not self._include.match(f.path):
+            return self.__reject("不满足包含规则")
+        return True
+
+    @property
+    def summary(self) -> str:
+        return "，".join(f"{k} {v} 条" for k, v in self.rejected.items()) or "无"
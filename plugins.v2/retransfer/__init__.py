@@ -1,21 +1,69 @@
+import time
+
+# 模块开始导入的时间，用于统计插件导入耗时
+_IMPORT_STARTED = time.perf_counter()
+
+from contextlib import ExitStack, nullcontext
 from datetime import datetime, timedelta
+from hashlib import sha1
+from pathlib import Path, PurePosixPath
 from threading import Event
-from typing import List, Tuple, Dict, Any, Optional
-import time
+from typing import (
+    Any,
+    Callable,
+    ContextManager,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
 
 import pytz
 from apscheduler.schedulers.background import BackgroundScheduler  # type: ignore
+from fastapi.responses import PlainTextResponse
+from apscheduler.triggers.cron import CronTrigger  # type: ignore
 
 
-from app.api.endpoints.transfer import manual_transfer
 from app.core.config import settings
-from app.chain.storage import StorageChain
 from app.schemas import ManualTransferItem, Response, FileItem, NotificationType
-from app.schemas.types import StorageSchema
-from app.db.transferhistory_oper import TransferHistoryOper
+from app.schemas.types import MediaType, StorageSchema
 from app.log import logger
 from app.plugins import _PluginBase
 
+from .aio import StorageLimits
+from .fastcopy import THROTTLE_CHUNK, CopyStats, local_copy
+from .historyindex import HistoryIndex
+from .lazy import LazyInstance, cached_form, lazy_import
+from .metrics import CONTENT_TYPE, PluginMetrics, render as render_metrics
+from .negcache import NegativeCache
+from .pipeline import STOP_TIMEOUT, Pipeline, RunStats, Skip, sampled, wait_until
+from .profiling import TraceRecorder, profile_api, profiled, trace
+from .runlog import render_runs, save_run
+from .scanner import (
+    FileFilter,
+    FileRecord,
+    scan_files,
+    scan_files_async,
+    valid_days_window,
+    valid_patterns,
+)
+from .sharding import ShardCoordinator, shard_filter
+from .planner import (
+    FolderCensus,
+    SeasonBatch,
+    TransferTask,
+    TargetIndex,
+    batch_seasons,
+    order_tasks,
+    resolve_target_dir,
+)
+from .throttle import Throttle, ThrottleProfile
+from .verify import TransferVerifier
+
+manual_transfer = lazy_import("app.api.endpoints.transfer.manual_transfer")
+
 
 class ReTransfer(_PluginBase):
     # 插件名称
@@ -25,7 +73,7 @@ class ReTransfer(_PluginBase):
     # 插件图标
     plugin_icon = "directory.png"
     # 插件版本
-    plugin_version = "1.0"
+    plugin_version = "2.12"
     # 插件作者
     plugin_author = "Akimio521"
     # 作者主页
@@ -38,18 +86,50 @@ class ReTransfer(_PluginBase):
     user_level = 1
 
     # 私有属性
-    transferhis = TransferHistoryOper()
-    storagechain = StorageChain()
+    # 首次使用时才创建，加载插件时不初始化数据库与处理链
+    transferhis = LazyInstance("app.db.transferhistory_oper.TransferHistoryOper")
+    storagechain = LazyInstance("app.chain.storage.StorageChain")
+    transferchain = LazyInstance("app.chain.transfer.TransferChain")
 
     _scheduler: BackgroundScheduler | None = None
-    _enabled: bool = False  # 运行状态
+    _enabled: bool = False  # 启用插件
+    _running: bool = False  # 运行状态
+    _profile: bool = False  # 性能分析（仅下次运行）
+    _profile_detail: bool = False  # 调用栈采样与内存快照
+    _tracer: TraceRecorder | None = None  # 性能分析中的运行的时间线
 
     _onlyonce: bool  # 立即运行
+    _cron: str  # 执行周期
+    _incremental: bool  # 增量整理
+    _max_minutes: int  # 单次运行最长时间（分钟）
+    _max_items: int  # 单次运行最多整理数量
     _notify: bool  # 通知推送
     _skip_failed: bool  # 跳过失败记录
     _background: bool  # 后台转移
+    _sort_by_size: bool  # 小文件优先
+    _plan_window: int  # 边扫描边整理，每批编排的任务数
+    _season_batch: bool  # 整季批量整理
+    _diff_sync: bool  # 差异同步
+    _scan_workers: int  # 扫描线程数
+    _workers: int  # 整理线程数
+    _async_io: bool  # 异步 I/O
+    _storage_limits: str  # 存储并发限制
+    _timeout: float  # 单项超时（秒）
+    _retries: int  # 失败重试次数
+    _history_index: bool  # 本地整理记录索引
+    _negative_ttl: float  # 跳过缓存有效期（天）
+    _shard_dir: str  # 多实例分片目录
+    _shard_count: int  # 分片数
+    _include: str  # 包含规则
+    _exclude: str  # 排除规则
+    _exclude_dirs: str  # 排除目录
+    _min_size: float  # 最小文件大小（MB）
+    _mtime_window: str  # 修改时间范围（天）
 
     _transfer_type: str  # 转移模式
+    _fast_copy: bool  # 零拷贝复制
+    _verify: str  # 整理后校验
+    _verify_chunk: float  # 抽样大小（MB）
     _scrape: bool  # 是否刮削
     _library_type_folder: bool  # 是否按类型建立文件夹
     _library_category_folder: bool  # 是否按分类建立文件夹
@@ -58,16 +138,53 @@ class ReTransfer(_PluginBase):
     _target_type: str  # 目标媒体库类型
     _target_path: str  # 新媒体库路径
 
-    _event = Event()  # 退出事件
+    _day_bandwidth: float  # 日间带宽限制（MB/s）
+    _day_files: float  # 日间文件数限制（个/秒）
+    _night_bandwidth: float  # 夜间带宽限制（MB/s）
+    _night_files: float  # 夜间文件数限制（个/秒）
+    _night_window: str  # 夜间时段
+
+    _event = Event()  # 退出事件，每次运行开始时重新创建
 
     def init_plugin(self, config: Optional[Dict[str, Any]] = None):
+        logger.debug(f"{self.plugin_name}：模块导入耗时 {IMPORT_SECONDS * 1000:.1f} ms")
+        PluginMetrics(self.__class__.__name__).imported(IMPORT_SECONDS)
         # 读取配置
         if config:
+            self._enabled = config.get("enabled") or False
             self._onlyonce = config.get("onlyonce") or False
+            self._cron = config.get("cron") or ""
+            self._incremental = config.get("incremental") or False
+            self._max_minutes = int(config.get("max_minutes") or 0)
+            self._max_items = int(config.get("max_items") or 0)
             self._notify = config.get("notify") or False
             self._skip_failed = config.get("skip_failed") or False
             self._background = config.get("background") or False
+            self._sort_by_size = config.get("sort_by_size") or False
+            self._plan_window = int(config.get("plan_window") or 0)
+            self._season_batch = config.get("season_batch") or False
+            self._diff_sync = config.get("diff_sync") or False
+            self._scan_workers = int(config.get("scan_workers") or 4)
+            self._workers = int(config.get("workers") or 1)
+            self._async_io = config.get("async_io") or False
+            self._storage_limits = config.get("storage_limits") or ""
+            self._timeout = float(config.get("timeout") or 0)
+            self._retries = int(config.get("retries") or 0)
+            self._history_index = config.get("history_index") or False
+            self._negative_ttl = float(config.get("negative_ttl") or 0)
+            self._shard_dir = config.get("shard_dir") or ""
+            self._shard_count = int(config.get("shard_count") or 16)
+            self._profile = config.get("profile") or False
+            self._profile_detail = config.get("profile_detail") or False
+            self._include = valid_patterns(config.get("include") or "")
+            self._exclude = valid_patterns(config.get("exclude") or "")
+            self._exclude_dirs = config.get("exclude_dirs") or ""
+            self._min_size = float(config.get("min_size") or 0)
+            self._mtime_window = valid_days_window(config.get("mtime_window") or "")
             self._transfer_type = config.get("transfer_type") or "copy"
+            self._fast_copy = config.get("fast_copy") or False
+            self._verify = config.get("verify") or ""
+            self._verify_chunk = float(config.get("verify_chunk") or 4)
             self._scrape = config.get("scrape") or False
             self._library_type_folder = config.get("library_type_folder") or False
             self._library_category_folder = (
@@ -77,6 +194,11 @@ class ReTransfer(_PluginBase):
             self._source_path = config.get("source_path") or ""
             self._target_type = config.get("target_type") or StorageSchema.Local.value
             self._target_path = config.get("target_path") or ""
+            self._day_bandwidth = float(config.get("day_bandwidth") or 0)
+            self._day_files = float(config.get("day_files") or 0)
+            self._night_bandwidth = float(config.get("night_bandwidth") or 0)
+            self._night_files = float(config.get("night_files") or 0)
+            self._night_window = config.get("night_window") or "23:00-07:00"
 
         # 停止现有任务
         self.stop_service()
@@ -93,27 +215,63 @@ class ReTransfer(_PluginBase):
             )
             # 关闭一次性开关
             self._onlyonce = False
-            self.update_config(
-                {
-                    "onlyonce": self._onlyonce,
-                    "notify": self._notify,
-                    "skip_failed": self._skip_failed,
-                    "background": self._background,
-                    "transfer_type": self._transfer_type,
-                    "scrape": self._scrape,
-                    "library_type_folder": self._library_type_folder,
-                    "library_category_folder": self._library_category_folder,
-                    "source_type": self._source_type,
-                    "source_path": self._source_path,
-                    "target_type": self._target_type,
-                    "target_path": self._target_path,
-                }
-            )
+            self.update_config(self.config)
             if self._scheduler.get_jobs():
                 # 启动服务
                 self._scheduler.print_jobs()
                 self._scheduler.start()
 
+    @property
+    def config(self) -> Dict[str, Any]:
+        return {
+            "enabled": self._enabled,
+            "onlyonce": self._onlyonce,
+            "cron": self._cron,
+            "incremental": self._incremental,
+            "max_minutes": self._max_minutes,
+            "max_items": self._max_items,
+            "notify": self._notify,
+            "skip_failed": self._skip_failed,
+            "background": self._background,
+            "sort_by_size": self._sort_by_size,
+            "plan_window": self._plan_window,
+            "season_batch": self._season_batch,
+            "diff_sync": self._diff_sync,
+            "scan_workers": self._scan_workers,
+            "workers": self._workers,
+            "async_io": self._async_io,
+            "storage_limits": self._storage_limits,
+            "timeout": self._timeout,
+            "retries": self._retries,
+            "history_index": self._history_index,
+            "negative_ttl": self._negative_ttl,
+            "shard_dir": self._shard_dir,
+            "shard_count": self._shard_count,
+            "profile": self._profile,
+            "profile_detail": self._profile_detail,
+            "include": self._include,
+            "exclude": self._exclude,
+            "exclude_dirs": self._exclude_dirs,
+            "min_size": self._min_size,
+            "mtime_window": self._mtime_window,
+            "transfer_type": self._transfer_type,
+            "fast_copy": self._fast_copy,
+            "verify": self._verify,
+            "verify_chunk": self._verify_chunk,
+            "scrape": self._scrape,
+            "library_type_folder": self._library_type_folder,
+            "library_category_folder": self._library_category_folder,
+            "source_type": self._source_type,
+            "source_path": self._source_path,
+            "target_type": self._target_type,
+            "target_path": self._target_path,
+            "day_bandwidth": self._day_bandwidth,
+            "day_files": self._day_files,
+            "night_bandwidth": self._night_bandwidth,
+            "night_files": self._night_files,
+            "night_window": self._night_window,
+        }
+
     def get_state(self) -> bool:
         return self._enabled
 
@@ -122,11 +280,59 @@ class ReTransfer(_PluginBase):
         return []
 
     def get_api(self) -> List[Dict[str, Any]]:
-        return []
+        return [
+            {
+                "path": "/metrics",
+                "endpoint": self.export_metrics,
+                "methods": ["GET"],
+                "auth": "apikey",
+                "summary": "运行指标",
+                "description": "Prometheus 文本格式的运行指标",
+            },
+            {
+                "path": "/shards",
+                "endpoint": self.shard_status,
+                "methods": ["GET"],
+                "auth": "apikey",
+                "summary": "分片状态",
+                "description": "多实例分片运行时，当前轮次各分片的认领与完成情况",
+            },
+            *profile_api(self),
+        ]
+
+    @staticmethod
+    def export_metrics() -> PlainTextResponse:
+        """
+        导出运行指标，供 Prometheus 抓取
+        """
+        return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
+
+    def shard_status(self) -> Dict[str, Any]:
+        """
+        当前轮次各分片的状态
+        """
+        coordinator = self.__shard_coordinator()
+        if not coordinator:
+            return {"sweep": None, "shards": []}
+        return coordinator.status()
 
     def get_service(self) -> List[Dict[str, Any]]:
+        """
+        注册服务
+        """
+        if self._enabled and self._cron:
+            return [
+                {
+                    "id": "ReTransfer",
+                    "name": "重新整理媒体库",
+                    "trigger": CronTrigger.from_crontab(self._cron),
+                    "func": self.__re_transfer,
+                    "kwargs": {"incremental": self._incremental},
+                }
+            ]
         return []
 
+    @cached_form
     def get_form(self) -> Tuple[List[dict], Dict[str, Any]]:
         return [
             {
@@ -135,6 +341,19 @@ class ReTransfer(_PluginBase):
                     {
                         "component": "VRow",
                         "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VSwitch",
+                                        "props": {
+                                            "model": "enabled",
+                                            "label": "启用插件",
+                                        },
+                                    }
+                                ],
+                            },
                             {
                                 "component": "VCol",
                                 "props": {"cols": 12, "md": 3},
@@ -148,6 +367,25 @@ class ReTransfer(_PluginBase):
                                     }
                                 ],
                             },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VCronField",
+                                        "props": {
+                                            "model": "cron",
+                                            "label": "执行周期",
+                                            "placeholder": "5位cron表达式，留空则只支持立即运行",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
                             {
                                 "component": "VCol",
                                 "props": {"cols": 12, "md": 3},
@@ -187,6 +425,21 @@ class ReTransfer(_PluginBase):
                                     }
                                 ],
                             },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VSwitch",
+                                        "props": {
+                                            "model": "incremental",
+                                            "label": "增量整理",
+                                            "hint": "定时任务只整理上次运行后新增的整理记录",
+                                            "persistent-hint": True,
+                                        },
+                                    }
+                                ],
+                            },
                         ],
                     },
                     {
@@ -255,6 +508,80 @@ class ReTransfer(_PluginBase):
                             },
                         ],
                     },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VSwitch",
+                                        "props": {
+                                            "model": "season_batch",
+                                            "label": "整季批量整理",
+                                            "hint": "全量整理时，源目录下的文件属于同一季且全部需要整理时按目录整理一次，集数按文件名重新识别",
+                                            "persistent-hint": True,
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VSwitch",
+                                        "props": {
+                                            "model": "fast_copy",
+                                            "label": "零拷贝复制",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VSelect",
+                                        "props": {
+                                            "model": "verify",
+                                            "label": "整理后校验",
+                                            "items": [
+                                                {"title": "不校验", "value": ""},
+                                                {
+                                                    "title": "抽样校验",
+                                                    "value": "sample",
+                                                },
+                                                {"title": "完整校验", "value": "full"},
+                                            ],
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "verify_chunk",
+                                            "label": "抽样大小（MB）",
+                                            "rows": 1,
+                                            "placeholder": "抽样校验时首、中、尾各读取的大小，默认4",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
                     {
                         "component": "VRow",
                         "content": [
@@ -329,141 +656,1288 @@ class ReTransfer(_PluginBase):
                             },
                         ],
                     },
-                ],
-            }
-        ], {"enabled": False, "mode": "", "transfer_paths": "", "err_hosts": ""}
-
-    def get_page(self) -> List[dict]:
-        pass
-
-    def __re_transfer(self):
-        """
-        开始重新整理媒体库
-        """
-        self._enabled = True
-        __c: Dict[str, str | bool] = {
-            "后台转移": self._background,
-            "跳过失败记录": self._skip_failed,
-            "通知推送": self._notify,
-            "转移模式": self._transfer_type,
-            "是否刮削": self._scrape,
-            "按类型建立文件夹": self._library_type_folder,
-            "按分类建立文件夹": self._library_category_folder,
-            "源路径": f"【{StorageSchema(self._source_type).name}】{self._source_path}",
-            "新媒体库": f"【{StorageSchema(self._target_type).name}】{self._target_path}",
-        }
-        logger.info(f"重新整理媒体库服务，立即运行一次，配置：{__c}")
-        if self._notify:
-            self.post_message(
-                mtype=NotificationType.Plugin,
-                title="【插件】重新整理开始运行",
-                text="\n".join([f"{k}：{v}" for k, v in __c.items()]),
-            )
-        if not self._source_path or not self._target_path:
-            logger.error("重新整理媒体库服务配置错误！")
-            self._enabled = False
-            return
-
-        start_time = time.time()
-        sucess_count: int = 0
-        skip_msgs: List[str] = []
-        err_msgs: List[str] = []
-
-        for file in self.__list_files(self._source_type, self._source_path):
-            if self._event.is_set():
-                logger.info("重新整理服务已停止！")
-                self._enabled = False
-                return
-            history = self.transferhis.get_by_src(
-                src=file.path, storage=self._source_type
-            )
-            if not history:
-                skip_msgs.append(
-                    f"【{StorageSchema(self._source_type).name}】{file.path}：未找到整理记录"
-                )
-                continue
-
-            if self._skip_failed and not history.status:
-                skip_msgs.append(
-                    f"【{StorageSchema(self._source_type).name}】{file.path}：{history.errmsg}"
-                )
-                continue
-
-            transer_item = ManualTransferItem(
-                logid=history.id,
-                target_storage=self._target_type,
-                transfer_type=self._transfer_type,
-                target_path=self._target_path,
-                min_filesize=0,
-                scrape=self._scrape,
-                library_type_folder=self._library_type_folder,
-                library_category_folder=self._library_category_folder,
-                from_history=True,
-            )
-            response: Response = manual_transfer(
-                transer_item=transer_item, background=self._background
-            )
-            if response.success:
-                sucess_count += 1
-            else:
-                err_msgs.append(
-                    f"【{StorageSchema(self._source_type).name}】{file.path}：{response.message}"
-                )
-
-        msg: List[str] = [
-            f"成功整理 {sucess_count} 条",
-            f"失败整理 {len(err_msgs)} 条",
-            f"跳过整理 {len(skip_msgs)} 条",
-            f"总耗时 {((time.time() - start_time) / 60):.2f} 分钟",
-        ]
-        if self._notify:
-            self.post_message(
-                mtype=NotificationType.Plugin,
-                title="【插件】重新整理完成",
-                text="\n".join(msg),
-            )
-        msg.extend(
-            [
-                "错误信息：",
-                *err_msgs,
-                "跳过信息：",
-                *skip_msgs,
-            ]
-        )
-        logger.info(f"重新整理完成，{'；'.join(msg)}。")
-
-        self._enabled = False
-
-    def __list_files(
-        self,
-        storage_type: str,
-        starge_path: str,
-    ) -> List[FileItem]:
-        file = FileItem(storage=storage_type, path=starge_path)
-        files = self.storagechain.list_files(file, True)
-        if not files or len(files) == 0:
-            logger.error(f"未找到文件：【{storage_type}】{starge_path}")
-            return []
-        else:
-            return [
-                f
-                for f in files
-                if f.type == "file"
-                and f.extension
-                and f".{f.extension.lower()}" in settings.RMT_MEDIAEXT
-            ]
-
-    def stop_service(self):
-        """
-        退出插件
-        """
-        try:
-            if self._scheduler:
-                self._scheduler.remove_all_jobs()
-                if self._scheduler.running:
-                    self._event.set()
-                    self._scheduler.shutdown()
-                    self._event.clear()
-                self._scheduler = None
-        except Exception as e:
-            print(str(e))
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VSwitch",
+                                        "props": {
+                                            "model": "sort_by_size",
+                                            "label": "小文件优先",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "scan_workers",
+                                            "label": "扫描线程数",
+                                            "rows": 1,
+                                            "placeholder": "并行扫描一级子目录，默认4",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "workers",
+                                            "label": "整理线程数",
+                                            "rows": 1,
+                                            "placeholder": "同时整理的文件数，默认1",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "night_window",
+                                            "label": "夜间时段",
+                                            "rows": 1,
+                                            "placeholder": "HH:MM-HH:MM，默认'23:00-07:00'",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "plan_window",
+                                            "label": "边扫描边整理（条）",
+                                            "rows": 1,
+                                            "placeholder": "全量整理时每查询到多少条就编排并开始整理，0 为扫描完成后整体编排",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "negative_ttl",
+                                            "label": "跳过缓存有效期（天）",
+                                            "rows": 1,
+                                            "placeholder": "未找到整理记录、整理失败的文件在有效期内不再查询与整理，文件或整理记录变化后失效，0 为不启用",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "shard_dir",
+                                            "label": "多实例分片目录",
+                                            "rows": 1,
+                                            "placeholder": "多个实例共享的目录，全量整理时各实例通过其中的租约文件认领分片共同完成，留空为不启用",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "shard_count",
+                                            "label": "分片数",
+                                            "rows": 1,
+                                            "placeholder": "按源目录下一级子目录名称划分，共享目录的各实例需一致，默认16",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VSwitch",
+                                        "props": {
+                                            "model": "profile",
+                                            "label": "性能分析（仅下次运行）",
+                                            "hint": "记录各文件在扫描、查询、编排、执行、校验阶段的时间线，结果保存在插件数据目录",
+                                            "persistent-hint": True,
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VSwitch",
+                                        "props": {
+                                            "model": "profile_detail",
+                                            "label": "调用栈采样与内存快照",
+                                            "hint": "性能分析时同时采样调用栈并记录内存分配，开销较大",
+                                            "persistent-hint": True,
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "day_bandwidth",
+                                            "label": "日间带宽限制（MB/s）",
+                                            "rows": 1,
+                                            "placeholder": "0 为不限制",
+                                            "hint": "本地存储之间的前台复制在复制过程中按块限速，其他方式仅在每个文件开始整理前按文件大小放行",
+                                            "persistent-hint": True,
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "day_files",
+                                            "label": "日间文件数限制（个/秒）",
+                                            "rows": 1,
+                                            "placeholder": "0 为不限制",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "night_bandwidth",
+                                            "label": "夜间带宽限制（MB/s）",
+                                            "rows": 1,
+                                            "placeholder": "0 为不限制",
+                                            "hint": "本地存储之间的前台复制在复制过程中按块限速，其他方式仅在每个文件开始整理前按文件大小放行",
+                                            "persistent-hint": True,
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "night_files",
+                                            "label": "夜间文件数限制（个/秒）",
+                                            "rows": 1,
+                                            "placeholder": "0 为不限制",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "max_minutes",
+                                            "label": "单次运行最长时间（分钟）",
+                                            "rows": 1,
+                                            "placeholder": "0 为不限制，超出后保存断点，下次运行继续",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "max_items",
+                                            "label": "单次运行最多整理数量",
+                                            "rows": 1,
+                                            "placeholder": "0 为不限制，超出后保存断点，下次运行继续",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VSwitch",
+                                        "props": {
+                                            "model": "async_io",
+                                            "label": "异步 I/O",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VSwitch",
+                                        "props": {
+                                            "model": "diff_sync",
+                                            "label": "差异同步",
+                                            "hint": "跳过目标已存在且大小一致的文件",
+                                            "persistent-hint": True,
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "storage_limits",
+                                            "label": "存储并发限制",
+                                            "rows": 1,
+                                            "placeholder": "异步 I/O 下各存储同时进行的请求数，如 u115:4,alipan:8，留空则按线程数",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 4},
+                                "content": [
+                                    {
+                                        "component": "VSwitch",
+                                        "props": {
+                                            "model": "history_index",
+                                            "label": "本地整理记录索引",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 4},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "timeout",
+                                            "label": "单项超时（秒）",
+                                            "rows": 1,
+                                            "placeholder": "单个文件超过该时间记为失败并继续，0 为不限制",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 4},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "retries",
+                                            "label": "失败重试次数",
+                                            "rows": 1,
+                                            "placeholder": "失败或超时的文件在本次运行末尾重试，默认0",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "include",
+                                            "label": "包含规则",
+                                            "rows": 2,
+                                            "placeholder": "每行一条，通配符匹配完整路径，以 re: 开头按正则匹配，留空则不限制",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "exclude",
+                                            "label": "排除规则",
+                                            "rows": 2,
+                                            "placeholder": "每行一条，如 *sample* 或 re:\\btrailer\\b",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 4},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "exclude_dirs",
+                                            "label": "排除目录",
+                                            "rows": 1,
+                                            "placeholder": "逗号分隔，如 Extras,Samples",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 4},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "min_size",
+                                            "label": "最小文件大小（MB）",
+                                            "rows": 1,
+                                            "placeholder": "0 为不限制",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 4},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "mtime_window",
+                                            "label": "修改时间范围（天）",
+                                            "rows": 1,
+                                            "placeholder": "如 0-30 为30天内修改，365- 为一年前修改",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                ],
+            }
+        ], {
+            "enabled": False,
+            "onlyonce": False,
+            "cron": "",
+            "incremental": False,
+            "max_minutes": 0,
+            "max_items": 0,
+            "notify": False,
+            "skip_failed": False,
+            "background": False,
+            "sort_by_size": False,
+            "plan_window": 0,
+            "season_batch": False,
+            "diff_sync": False,
+            "scan_workers": 4,
+            "workers": 1,
+            "async_io": False,
+            "storage_limits": "",
+            "timeout": 0,
+            "retries": 0,
+            "history_index": False,
+            "negative_ttl": 0,
+            "shard_dir": "",
+            "shard_count": 16,
+            "profile": False,
+            "profile_detail": False,
+            "include": "",
+            "exclude": "",
+            "exclude_dirs": "",
+            "min_size": 0,
+            "mtime_window": "",
+            "transfer_type": "copy",
+            "fast_copy": False,
+            "verify": "",
+            "verify_chunk": 4,
+            "scrape": False,
+            "library_type_folder": False,
+            "library_category_folder": False,
+            "source_type": StorageSchema.Local.value,
+            "source_path": "",
+            "target_type": StorageSchema.Local.value,
+            "target_path": "",
+            "day_bandwidth": 0,
+            "day_files": 0,
+            "night_bandwidth": 0,
+            "night_files": 0,
+            "night_window": "23:00-07:00",
+        }
+
+    def get_page(self) -> List[dict]:
+        return render_runs(self.get_data("runs") or [])
+
+    @profiled
+    def __re_transfer(self, incremental: bool = False):
+        """
+        开始重新整理媒体库，运行出错时同样关闭索引、保存缓存并重置运行状态
+        :param incremental: 只整理上次运行后新增的整理记录，没有记录位置时执行全量整理
+        """
+        if self._running:
+            logger.warning(f"{self.plugin_name}：上一次运行尚未退出，本次不运行")
+            return
+        # 每次运行使用新的退出事件，停止时设置的事件一直保留，卡住的调用返回后仍会退出
+        self._event = Event()
+        self._running = True
+        try:
+            with ExitStack() as cleanup:
+                self.__run_re_transfer(incremental, cleanup)
+        finally:
+            self._running = False
+
+    def __run_re_transfer(self, incremental: bool, cleanup: ExitStack) -> None:
+        """
+        重新整理的运行过程
+        :param cleanup: 运行结束（包括出错）时执行的清理
+        """
+        watermark = self.__load_watermark() if incremental else None
+        __c: Dict[str, str | bool] = {
+            "整理方式": "增量" if watermark else "全量",
+            "后台转移": self._background,
+            "小文件优先": self._sort_by_size,
+            "整季批量整理": self._season_batch,
+            "边扫描边整理": (
+                f"每 {self._plan_window} 条编排一次"
+                if self._plan_window and not watermark
+                else False
+            ),
+            "差异同步": self._diff_sync,
+            "扫描线程数": self._scan_workers,
+            "整理线程数": self._workers,
+            "异步 I/O": f"{self._async_io}（{self._storage_limits or '按线程数'}）",
+            "单项超时": f"{self._timeout or '不限'} 秒，失败重试 {self._retries} 次",
+            "本地整理记录索引": self._history_index,
+            "跳过缓存": f"{self._negative_ttl} 天" if self._negative_ttl > 0 else False,
+            "多实例分片": (
+                f"{self._shard_dir}（{self._shard_count} 个）"
+                if self._shard_dir and not watermark
+                else False
+            ),
+            "性能分析": self._tracer is not None,
+            "跳过失败记录": self._skip_failed,
+            "通知推送": self._notify,
+            "转移模式": self._transfer_type,
+            "零拷贝复制": self._fast_copy,
+            "整理后校验": self._verify or "不校验",
+            "是否刮削": self._scrape,
+            "按类型建立文件夹": self._library_type_folder,
+            "按分类建立文件夹": self._library_category_folder,
+            "源路径": f"【{StorageSchema(self._source_type).name}】{self._source_path}",
+            "新媒体库": f"【{StorageSchema(self._target_type).name}】{self._target_path}",
+            "日间限速": f"{self._day_bandwidth} MB/s，{self._day_files} 个/秒",
+            "夜间限速": f"{self._night_bandwidth} MB/s，{self._night_files} 个/秒（{self._night_window}）",
+            "单次运行上限": f"{self._max_minutes or '不限'} 分钟，{self._max_items or '不限'} 条",
+        }
+        logger.info(f"重新整理媒体库服务开始运行，配置：{__c}")
+        if self._notify:
+            self.post_message(
+                mtype=NotificationType.Plugin,
+                title="【插件】重新整理开始运行",
+                text="\n".join([f"{k}：{v}" for k, v in __c.items()]),
+            )
+        if not self._source_path or not self._target_path:
+            logger.error("重新整理媒体库服务配置错误！")
+            return
+
+        source_name = StorageSchema(self._source_type).name
+        throttle = Throttle(
+            day=ThrottleProfile(
+                self._day_bandwidth * 1024**2, self._day_files, burst=THROTTLE_CHUNK
+            ),
+            night=ThrottleProfile(
+                self._night_bandwidth * 1024**2, self._night_files, burst=THROTTLE_CHUNK
+            ),
+            night_window=self._night_window,
+        )
+        # 仅复制、移动会产生实际数据读写
+        throttled = throttle.limited and self._transfer_type in ("copy", "move")
+        # 本地存储之间的前台复制由插件线程完成，复制过程中按块限速；
+        # 其他方式的数据读写不经过插件，只能在每个文件开始整理前按文件大小放行
+        chunked = throttled and self.__local_copy()
+        # 分批编排只用于全量整理，增量整理的记录数较少，仍整体编排
+        streaming = bool(self._plan_window) and not watermark
+        # 多实例分片只用于全量整理，断点保存在共享目录中各分片下
+        coordinator = self.__shard_coordinator() if not watermark else None
+        cursor = None if coordinator else self.__load_cursor(bool(watermark))
+        top_filter: Optional[Callable[[FileItem], bool]] = None
+        # 本次运行完成后的增量记录位置，全量整理以开始时间为准
+        now = datetime.now(tz=pytz.timezone(settings.TZ))
+        latest: Dict[str, Any] = dict(
+            watermark or {"date": now.strftime("%Y-%m-%d %H:%M:%S"), "id": 0}
+        )
+        resumed_count: int = 0
+        dir_count: int = 0
+        # 整季批量整理只用于整体编排的全量整理，需要在编排前扫描完整个源目录
+        census = (
+            FolderCensus(settings.RMT_MEDIAEXT)
+            if self._season_batch and not watermark and not streaming
+            else None
+        )
+        batch_dirs: int = 0
+        batch_files: int = 0
+
+        def plan(tasks: List[TransferTask]) -> List[TransferTask | SeasonBatch]:
+            """
+            按目标目录聚合，同一目录下的文件连续整理，并跳过断点前的任务
+            """
+            nonlocal resumed_count, dir_count, batch_dirs, batch_files
+            tasks = order_tasks(tasks, by_size=self._sort_by_size)
+            if streaming:
+                # 扫描按路径顺序输出，排序键以本批第一个源文件开头，批次间依次递增
+                start = min(t.file.path or "" for t in tasks)
+                for task in tasks:
+                    task.order = (start, *task.order)
+                dir_count += len(set(t.target_dir for t in tasks))
+                return tasks
+            if cursor:
+                total = len(tasks)
+                tasks = [t for t in tasks if t.order > cursor]
+                resumed_count += total - len(tasks)
+                logger.info(f"从上次断点继续整理，跳过已完成的 {total - len(tasks)} 条")
+            if census:
+                tasks = batch_seasons(tasks, census)
+                batches = [t for t in tasks if isinstance(t, SeasonBatch)]
+                batch_dirs += len(batches)
+                batch_files += sum(len(b.tasks) for b in batches)
+            dir_count += len(set(t.target_dir for t in tasks))
+            return tasks
+
+        def scan() -> Generator[FileRecord, None, None]:
+            """
+            扫描源目录，分批编排时跳过断点所在批次之前的文件，断点所在批次重新整理
+            整季批量整理时同时统计各目录下的媒体文件数，分片运行时只扫描本分片的一级子目录
+            """
+            nonlocal resumed_count
+            files = self.__scan(
+                FileItem(storage=self._source_type, path=self._source_path),
+                top_filter,
+            )
+            skip_before = cursor[0] if streaming and cursor else None
+            if skip_before:
+                logger.info(f"从上次断点继续整理，跳过 {skip_before} 之前的源文件")
+            for file in files:
+                if census:
+                    census.add(file)
+                if skip_before and (file.path or "") < skip_before:
+                    resumed_count += 1
+                    continue
+                yield file
+
+        metrics = PluginMetrics(self.__class__.__name__)
+        verifier = (
+            TransferVerifier(self._verify, self._verify_chunk)
+            if self.__use_verify()
+            else None
+        )
+
+        copy_stats = CopyStats() if self.__use_fast_copy() else None
+
+        def charge(size: int) -> None:
+            throttle.acquire(size, self._event, files=0)
+
+        def copying() -> ContextManager[None]:
+            """
+            包住一次整理调用，按需替换本地复制
+            """
+            if not copy_stats and not chunked:
+                return nullcontext()
+            return local_copy(copy_stats, charge if chunked else None)
+
+        def transfer_file(task: TransferTask) -> Tuple[bool, str]:
+            if throttled:
+                # 按块限速时开始前只申请文件数配额
+                throttle.acquire(0 if chunked else task.size, self._event)
+            if verifier and self._transfer_type == "move":
+                # 移动后源文件不再存在，先记录源文件的校验值
+                verifier.remember(task.logid, Path(task.file.path))
+            transer_item = ManualTransferItem(
+                logid=task.logid,
+                target_storage=self._target_type,
+                transfer_type=self._transfer_type,
+                target_path=self._target_path,
+                min_filesize=0,
+                scrape=self._scrape,
+                library_type_folder=self._library_type_folder,
+                library_category_folder=self._library_category_folder,
+                from_history=True,
+            )
+            with copying():
+                response: Response = manual_transfer(
+                    transer_item=transer_item, background=self._background
+                )
+            if response.success and self._transfer_type in ("copy", "move"):
+                metrics.transferred(self._target_type, task.size)
+            return response.success, "" if response.success else response.message
+
+        def transfer_folder(batch: SeasonBatch) -> Tuple[bool, str]:
+            """
+            整个源目录只识别、整理、刮削一次
+            与按整理记录重新整理一致，删除旧的整理记录与整理结果；
+            两者都在整理成功后才删除，整理失败时保持原状
+            """
+            if throttled:
+                throttle.acquire(
+                    0 if chunked else batch.size, self._event, len(batch.tasks)
+                )
+            # (源文件, 旧记录 ID, 旧整理结果)
+            olds: List[Tuple[FileRecord, int, Optional[FileItem]]] = []
+            for task in batch.tasks:
+                if verifier and self._transfer_type == "move":
+                    verifier.remember(task.logid, Path(task.file.path))
+                history = self.transferhis.get(task.logid)
+                if history:
+                    dest = history.dest_fileitem
+                    olds.append(
+                        (task.file, history.id, FileItem(**dest) if dest else None)
+                    )
+            mtype, tmdbid, doubanid, season = batch.media
+            with copying():
+                state, errormsg = self.transferchain.manual_transfer(
+                    fileitem=batch.folder,
+                    target_storage=self._target_type,
+                    target_path=Path(self._target_path),
+                    tmdbid=tmdbid,
+                    doubanid=doubanid,
+                    mtype=MediaType(mtype),
+                    season=season,
+                    transfer_type=self._transfer_type,
+                    min_filesize=0,
+                    scrape=self._scrape,
+                    library_type_folder=self._library_type_folder,
+                    library_category_folder=self._library_category_folder,
+                    force=True,
+                    background=self._background,
+                )
+            if not state:
+                if isinstance(errormsg, list):
+                    errormsg = "；".join(str(msg) for msg in errormsg)
+                return False, str(errormsg or "整理失败")
+            for file, logid, dest in olds:
+                self.transferhis.delete(logid)
+                if not dest:
+                    continue
+                # 新旧整理结果为同一文件时已被覆盖，不再删除
+                new = self.transferhis.get_by_src(
+                    src=file.path, storage=self._source_type
+                )
+                if new and new.dest == dest.path and new.dest_storage == dest.storage:
+                    continue
+                if not self.storagechain.delete_media_file(dest):
+                    logger.warning(f"旧的整理结果删除失败：{dest.path}")
+            if self._transfer_type in ("copy", "move"):
+                metrics.transferred(self._target_type, batch.size)
+            return True, ""
+
+        def verify(task: TransferTask | SeasonBatch) -> Tuple[bool, str]:
+            members = task.tasks if isinstance(task, SeasonBatch) else [task]
+            for member in members:
+                passed, detail = verifier.verify(
+                    member.logid,
+                    Path(member.file.path),
+                    self.__transferred_file(member),
+                    member.size,
+                )
+                if not passed:
+                    return False, detail
+            return True, ""
+
+        with trace(self._tracer, "准备", "setup"):
+            target_index = self.__target_index() if self._diff_sync else None
+            history_index = self.__open_history_index()
+            if history_index:
+                cleanup.callback(history_index.close)
+            negative_cache = self.__open_negative_cache()
+            if negative_cache:
+                cleanup.callback(negative_cache.save)
+        file_filter = self.__file_filter()
+
+        def resolve(file: FileRecord) -> TransferTask | Skip:
+            return self.__resolve(file, target_index, history_index)
+
+        if negative_cache:
+            resolve = negative_cache.resolver(resolve, lambda file: file)
+            transfer_file = negative_cache.action(transfer_file, lambda task: task.file)
+
+        def transfer(task: TransferTask | SeasonBatch) -> Tuple[bool, str]:
+            if isinstance(task, SeasonBatch):
+                return transfer_folder(task)
+            return transfer_file(task)
+
+        def run(
+            max_seconds: float, max_items: int, event: Optional[Event] = None
+        ) -> RunStats:
+            return Pipeline(
+                name="重新整理",
+                lister=lambda: (
+                    self.__new_files(watermark, latest, history_index)
+                    if watermark
+                    else scan()
+                ),
+                file_filter=file_filter,
+                resolver=resolve,
+                planner=plan,
+                plan_window=self._plan_window if streaming else 0,
+                action=transfer,
+                label=lambda x: f"【{source_name}】{getattr(x, 'file', x).path}",
+                workers=self._workers,
+                max_seconds=max_seconds,
+                max_items=max_items,
+                event=event or self._event,
+                async_io=self._async_io,
+                storage_of=lambda task: (task.file.storage, self._target_type),
+                storage_limits=StorageLimits(self._storage_limits),
+                timeout=self._timeout,
+                retries=self._retries,
+                metrics=metrics,
+                verifier=verify if verifier else None,
+                tracer=self._tracer,
+            ).run()
+
+        shard_count: int = 0
+
+        def run_shards() -> RunStats:
+            """
+            依次认领分片并整理，处理完一个分片才认领下一个，单次运行上限在各分片间共用
+            """
+            nonlocal cursor, top_filter, census, shard_count
+            stats = RunStats()
+            for shard in coordinator.claims(self._event):
+                cursor = tuple(shard.cursor) if shard.cursor else None
+                top_filter = shard_filter(coordinator.count, shard.index)
+                if census:
+                    census = FolderCensus(settings.RMT_MEDIAEXT)
+                logger.info(
+                    f"开始整理分片 {shard.index}{'，从断点继续' if cursor else ''}"
+                )
+                max_seconds = self._max_minutes * 60
+                if max_seconds:
+                    max_seconds = max(max_seconds - stats.duration, 1)
+                max_items = self._max_items
+                if max_items:
+                    max_items = max(max_items - stats.dispatched, 1)
+                result = run(max_seconds, max_items, shard.stop)
+                if shard.stop.lost:
+                    # 租约已被其他实例回收，该分片由回收者从已保存的断点继续，
+                    # 只因租约丢失而停止时不视为插件退出
+                    result.stopped = self._event.is_set()
+                stats.merge(result)
+                if result.stopped or result.sliced:
+                    order = result.last_done.order if result.last_done else cursor
+                    coordinator.release(shard, list(order) if order else None, result)
+                    break
+                if not shard.stop.lost:
+                    coordinator.complete(shard, result)
+                    shard_count += 1
+                if (self._max_items and stats.dispatched >= self._max_items) or (
+                    self._max_minutes and stats.duration >= self._max_minutes * 60
+                ):
+                    stats.sliced = True
+                    break
+            stats.finished = time.time()
+            return stats
+
+        if coordinator:
+            with coordinator:
+                stats = run_shards()
+                report = coordinator.finish()
+        else:
+            stats = run(self._max_minutes * 60, self._max_items)
+        save_run(self, stats, self.config)
+
+        if coordinator:
+            if not shard_count and not stats.listed:
+                logger.info("没有可认领的分片")
+            if report:
+                self.__report_shards(report)
+        elif not stats.listed:
+            if watermark:
+                logger.info("没有新增的整理记录")
+            else:
+                logger.error(f"未找到文件：【{self._source_type}】{self._source_path}")
+        if stats.stopped:
+            logger.info("重新整理服务已停止！")
+            if stats.last_done and not coordinator:
+                self.__save_cursor(stats.last_done.order, incremental=bool(watermark))
+            return
+        if not stats.sliced:
+            self.del_data("cursor")
+            if coordinator and not report:
+                # 其他实例持有或放弃的分片可能尚未完成，整轮完成后才记录增量整理位置
+                logger.info("本轮分片尚未全部完成，暂不更新增量整理位置")
+            else:
+                self.__save_watermark(latest)
+        elif stats.last_done and not coordinator:
+            self.__save_cursor(stats.last_done.order, incremental=bool(watermark))
+
+        msg: List[str] = [
+            f"成功整理 {stats.success} 条",
+            f"失败整理 {len(stats.failed_msgs)} 条",
+            f"跳过整理 {stats.skipped} 条",
+            f"超时 {stats.timeouts} 条，重试 {stats.retried} 条",
+            f"预筛选排除：{file_filter.summary}",
+            f"断点跳过 {resumed_count} 条",
+            f"目标已是最新 {stats.skip_reasons.get('目标已是最新', 0)} 条",
+            f"剩余待整理 {stats.remaining or 0} 条（下次运行继续）",
+            f"目标目录 {dir_count} 个",
+            f"整季批量整理：{f'{batch_dirs} 个目录（{batch_files} 个文件）' if census else '未启用'}",
+            f"限速等待 {(throttle.waited / 60):.2f} 分钟",
+            f"复制方式：{copy_stats.summary if copy_stats else '系统默认'}",
+            f"整理后校验：{verifier.summary if verifier else '未启用'}",
+            f"跳过缓存：{negative_cache.summary if negative_cache else '未启用'}",
+            f"多实例分片：{f'本实例完成 {shard_count} 个（{coordinator.sweep.name}）' if coordinator else '未启用'}",
+            f"总耗时 {(stats.duration / 60):.2f} 分钟",
+        ]
+        if self._notify:
+            self.post_message(
+                mtype=NotificationType.Plugin,
+                title="【插件】重新整理完成",
+                text="\n".join(msg),
+            )
+        msg.extend(
+            [
+                "错误信息：",
+                *stats.failed_msgs,
+                "跳过信息：",
+                *sampled(stats.skipped_msgs, stats.skipped),
+            ]
+        )
+        logger.info(f"重新整理完成，{'；'.join(msg)}。")
+
+    def __scan(
+        self,
+        fileitem: FileItem,
+        top_filter: Optional[Callable[[FileItem], bool]] = None,
+    ) -> Iterable[FileRecord]:
+        """
+        扫描源目录，异步 I/O 下在事件循环中逐级并发列目录
+        :param top_filter: 只扫描满足条件的一级子目录与文件
+        """
+        if self._async_io:
+            concurrency = StorageLimits(self._storage_limits).get(
+                fileitem.storage, self._scan_workers
+            )
+            return scan_files_async(
+                self.storagechain, fileitem, concurrency, self._event, top_filter
+            )
+        return scan_files(
+            self.storagechain, fileitem, self._scan_workers, self._event, top_filter
+        )
+
+    def __target_index(self) -> TargetIndex:
+        """
+        列出新媒体库中已有的文件，供差异同步比对
+        """
+        start = time.time()
+        index = TargetIndex(
+            self.__scan(FileItem(storage=self._target_type, path=self._target_path))
+        )
+        logger.info(
+            f"差异同步：新媒体库已有文件 {len(index)} 个，耗时 {time.time() - start:.2f} 秒"
+        )
+        return index
+
+    def __resolve(
+        self,
+        file: FileRecord,
+        target_index: Optional[TargetIndex] = None,
+        history_index: Optional[HistoryIndex] = None,
+    ) -> TransferTask | Skip:
+        """
+        查询源文件的整理记录，生成重新整理任务
+        :param target_index: 差异同步时的目标文件索引，目标已是最新的文件直接跳过
+        :param history_index: 本地整理记录索引，为空时直接查询整理记录
+        """
+        if history_index:
+            history = history_index.get("src", file.path, self._source_type)
+        else:
+            history = self.transferhis.get_by_src(
+                src=file.path, storage=self._source_type
+            )
+        if not history:
+            return Skip("未找到整理记录")
+        if self._skip_failed and not history.status:
+            return Skip("历史整理失败", history.errmsg)
+        task = TransferTask(
+            file=file,
+            history=history,
+            target_dir=resolve_target_dir(
+                history,
+                self._target_path,
+                self._library_type_folder,
+                self._library_category_folder,
+            ),
+            batch=self._season_batch,
+        )
+        if (
+            target_index is not None
+            and task.target_file
+            and target_index.is_current(
+                task.target_file, task.size, file.modify_time or 0
+            )
+        ):
+            return Skip("目标已是最新", record=False)
+        return task
+
+    def __new_files(
+        self,
+        watermark: Dict[str, Any],
+        latest: Dict[str, Any],
+        history_index: Optional[HistoryIndex] = None,
+    ) -> Generator[FileRecord, None, None]:
+        """
+        查询上次运行后新增、且源文件位于源路径下的整理记录，同时更新本次的记录位置
+        本插件重新整理产生的记录（目标位于新媒体库）与整理失败的记录不触发增量整理，
+        否则每次运行都会把上次运行写入的记录再整理一遍，失败的文件在全量整理时重试
+        :param history_index: 本地整理记录索引，只查询源路径下的记录
+        """
+        # 整理记录时间精确到秒，向前多查一分钟，再按 ID 去掉已处理的记录
+        since = (
+            datetime.strptime(watermark["date"], "%Y-%m-%d %H:%M:%S")
+            - timedelta(minutes=1)
+        ).strftime("%Y-%m-%d %H:%M:%S")
+        if history_index:
+            histories = history_index.under(
+                "src",
+                self._source_path,
+                self._source_type,
+                after_id=watermark["id"],
+                since=since,
+            )
+        else:
+            histories = self.transferhis.list_by_date(since) or []
+        root = self._source_path.rstrip("/") + "/"
+        target = self._target_path.rstrip("/") + "/"
+        seen = set()
+        count = own = 0
+        for history in sorted(histories, key=lambda h: h.id):
+            if history.id <= watermark["id"]:
+                continue
+            count += 1
+            latest["id"] = max(latest["id"], history.id)
+            latest["date"] = max(latest["date"], str(history.date))
+            if not history.status or (
+                history.dest_storage == self._target_type
+                and (history.dest or "").startswith(target)
+            ):
+                own += 1
+                continue
+            if (
+                history.src_storage != self._source_type
+                or not history.src
+                or not history.src.startswith(root)
+                or history.src in seen
+            ):
+                continue
+            seen.add(history.src)
+            if history.src_fileitem:
+                item = FileItem(**history.src_fileitem)
+            else:
+                path = PurePosixPath(history.src)
+                item = FileItem(
+                    storage=history.src_storage,
+                    type="file",
+                    path=history.src,
+                    name=path.name,
+                    extension=path.suffix[1:],
+                )
+            yield FileRecord(item, root)
+        logger.info(
+            f"{watermark['date']} 之后新增整理记录 {count} 条，"
+            f"其中新媒体库或整理失败的 {own} 条，源路径下的文件 {len(seen)} 个"
+        )
+
+    def __local_copy(self) -> bool:
+        """
+        是否为本地存储之间的前台复制，此时由插件线程调用 SystemUtils.copy 完成复制
+        """
+        return (
+            self._transfer_type == "copy"
+            and self._source_type == StorageSchema.Local.value
+            and self._target_type == StorageSchema.Local.value
+            and not self._background
+        )
+
+    def __use_fast_copy(self) -> bool:
+        """
+        零拷贝复制仅用于本地存储之间的前台复制
+        """
+        if not self._fast_copy or self._transfer_type != "copy":
+            return False
+        if self._source_type != StorageSchema.Local.value or (
+            self._target_type != StorageSchema.Local.value
+        ):
+            logger.info("零拷贝复制仅支持本地存储之间的复制，本次不启用")
+            return False
+        if self._background:
+            logger.warning("后台转移时由主程序队列执行复制，零拷贝复制不生效")
+            return False
+        return True
+
+    def __use_verify(self) -> bool:
+        """
+        整理后校验仅用于本地存储之间的前台复制、移动
+        """
+        if not self._verify or self._transfer_type not in ("copy", "move"):
+            return False
+        if self._source_type != StorageSchema.Local.value or (
+            self._target_type != StorageSchema.Local.value
+        ):
+            logger.info("整理后校验仅支持本地存储之间的复制、移动，本次不启用")
+            return False
+        if self._background:
+            logger.warning("后台转移时无法确认整理完成的时间，整理后校验不生效")
+            return False
+        return True
+
+    def __transferred_file(self, task: TransferTask) -> Optional[Path]:
+        """
+        整理后的目标文件，优先使用新的整理记录，没有时使用推算的路径
+        """
+        history = self.transferhis.get_by_src(
+            src=task.file.path, storage=self._source_type
+        )
+        if history and history.id != task.logid and history.dest:
+            return Path(history.dest)
+        return task.target_file
+
+    def __open_history_index(self) -> Optional[HistoryIndex]:
+        """
+        打开并同步本地整理记录索引，失败时回退到直接查询整理记录
+        """
+        if not self._history_index:
+            return None
+        index = HistoryIndex(self.get_data_path() / "history.db")
+        try:
+            index.refresh()
+            return index
+        except Exception as e:
+            logger.error(f"整理记录索引同步失败，本次直接查询整理记录：{e}")
+            index.close()
+            return None
+
+    def __open_negative_cache(self) -> Optional[NegativeCache]:
+        """
+        打开跳过缓存并移除失效条目，检查整理记录失败时本次不使用
+        """
+        if self._negative_ttl <= 0:
+            return None
+        cache = NegativeCache(
+            self.get_data_path() / "negative.cache",
+            ttl=self._negative_ttl * 86400,
+            reasons=("未找到整理记录", "历史整理失败"),
+            fingerprint=f"{self.__sync_fingerprint}|{self._skip_failed}",
+        )
+        try:
+            cache.refresh()
+            return cache
+        except Exception as e:
+            logger.error(f"跳过缓存检查整理记录失败，本次不使用：{e}")
+            return None
+
+    @property
+    def __sync_fingerprint(self) -> str:
+        """
+        源/目标对应的配置，变化后增量记录位置失效
+        """
+        return f"{self._source_type}:{self._source_path}|{self._target_type}:{self._target_path}"
+
+    def __load_watermark(self) -> Optional[Dict[str, Any]]:
+        watermark = self.get_data("watermark")
+        if not watermark or watermark.get("fingerprint") != self.__sync_fingerprint:
+            logger.info("未找到上次增量整理位置，本次执行全量整理")
+            return None
+        return {"date": watermark["date"], "id": watermark["id"]}
+
+    def __save_watermark(self, latest: Dict[str, Any]) -> None:
+        self.save_data("watermark", {"fingerprint": self.__sync_fingerprint, **latest})
+        logger.info(f"已保存增量整理位置：{latest}")
+
+    def __cursor_fingerprint(self, incremental: bool) -> str:
+        """
+        断点对应的配置，源/目标/排序方式/整理方式/编排方式变化后断点失效
+        """
+        fingerprint = f"{self.__sync_fingerprint}|{self._sort_by_size}|{incremental}"
+        if self._plan_window and not incremental:
+            fingerprint += "|streaming"
+        return fingerprint
+
+    def __shard_coordinator(self) -> Optional[ShardCoordinator]:
+        """
+        共享目录中本插件、本配置对应的分片协调器，配置不同的实例互不干扰
+        """
+        if not self._shard_dir:
+            return None
+        fingerprint = f"{self.__cursor_fingerprint(False)}|{self._shard_count}"
+        return ShardCoordinator(
+            self._shard_dir,
+            f"ReTransfer-{sha1(fingerprint.encode('utf-8')).hexdigest()[:8]}",
+            self._shard_count,
+        )
+
+    def __report_shards(self, report: Dict[str, Any]) -> None:
+        """
+        本实例最后完成分片时汇总本轮所有实例的结果
+        """
+        self.save_data("shard_report", report)
+        owners = "，".join(f"{k} {v} 个" for k, v in report["owners"].items())
+        text = (
+            f"{report['sweep']} 共 {report['shards']} 个分片已全部完成（{owners}）；"
+            f"扫描 {report['listed']} 个文件，整理成功 {report['success']} 个，"
+            f"失败 {report['failed']} 个，跳过 {report['skipped']} 个"
+        )
+        logger.info(f"多实例分片：{text}")
+        if self._notify:
+            self.post_message(
+                mtype=NotificationType.Plugin,
+                title="【插件】重新整理分片汇总",
+                text="\n".join([text, *report["failed_msgs"]]),
+            )
+
+    def __load_cursor(self, incremental: bool) -> Optional[Tuple]:
+        cursor = self.get_data("cursor")
+        if not cursor or cursor.get("fingerprint") != self.__cursor_fingerprint(
+            incremental
+        ):
+            return None
+        return tuple(cursor.get("order") or ()) or None
+
+    def __save_cursor(self, order: Tuple, incremental: bool) -> None:
+        self.save_data(
+            "cursor",
+            {
+                "fingerprint": self.__cursor_fingerprint(incremental),
+                "order": list(order),
+            },
+        )
+        logger.info(f"已保存重新整理断点：{order}")
+
+    def __file_filter(self) -> FileFilter:
+        """
+        编译本次运行的文件预筛选规则
+        """
+        return FileFilter(
+            extensions=settings.RMT_MEDIAEXT,
+            include=self._include,
+            exclude=self._exclude,
+            exclude_dirs=self._exclude_dirs,
+            min_size=int(self._min_size * 1024**2),
+            mtime_window=self._mtime_window,
+        )
+
+    def stop_service(self):
+        """
+        退出插件
+        """
+        try:
+            if self._scheduler:
+                self._scheduler.remove_all_jobs()
+                if self._scheduler.running:
+                    self._scheduler.shutdown(wait=False)
+                self._scheduler = None
+            if self._running:
+                # 通知运行中的任务退出，卡住的调用不再等待
+                self._event.set()
+                if not wait_until(lambda: not self._running, STOP_TIMEOUT + 5):
+                    logger.warning(f"{self.plugin_name}：运行中的任务未能及时退出")
+        except Exception as e:
+            print(str(e))
+
+
+# 插件模块（含依赖的辅助模块）的导入耗时（秒）
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
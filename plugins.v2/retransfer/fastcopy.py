@@ -0,0 +1,251 @@
+from contextlib import contextmanager
+from pathlib import Path
+from threading import Lock, local
+from typing import Any, Callable, ContextManager, Dict, Iterator, Optional, Tuple
+import errno
+import inspect
+import os
+import shutil
+
+from app.log import logger
+from app.utils.system import SystemUtils
+
+# linux/fs.h 中的 FICLONE，整文件克隆（reflink）
+FICLONE = 0x40049409
+
+# copy_file_range / sendfile 单次调用的最大字节数
+CHUNK_SIZE = 1024**3
+
+# 限速时每次申请配额并复制的字节数
+THROTTLE_CHUNK = 4 * 1024**2
+
+# 不支持时需要换用下一种方式的错误
+_UNSUPPORTED = {
+    errno.EXDEV,
+    errno.ENOSYS,
+    errno.EINVAL,
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EBADF,
+    errno.EPERM,
+}
+
+# 各复制方式的显示名称
+MECHANISMS = {
+    "reflink": "reflink 克隆",
+    "copy_file_range": "copy_file_range",
+    "sendfile": "sendfile",
+    "chunked": "分块复制",
+    "fallback": "系统默认",
+}
+
+# 限速回调，复制每块数据前按字节数申请配额
+Charge = Callable[[int], Any]
+
+
+def _reflink(src: int, dst: int) -> bool:
+    try:
+        import fcntl
+
+        fcntl.ioctl(dst, FICLONE, src)
+        return True
+    except (ImportError, OSError):
+        return False
+
+
+def _kernel_copy(
+    src: int,
+    dst: int,
+    size: int,
+    offset: int,
+    use_range: bool,
+    charge: Optional[Charge] = None,
+) -> int:
+    """
+    在内核中复制剩余数据，返回复制到的位置，遇到不支持的错误时提前返回
+    """
+    while offset < size:
+        count = min(size - offset, THROTTLE_CHUNK if charge else CHUNK_SIZE)
+        if charge:
+            charge(count)
+        try:
+            if use_range:
+                sent = os.copy_file_range(src, dst, count, offset, offset)
+            else:
+                sent = os.sendfile(dst, src, offset, count)
+        except OSError as e:
+            if e.errno in _UNSUPPORTED:
+                return offset
+            raise
+        if sent == 0:
+            break
+        offset += sent
+    return offset
+
+
+def copy_file(src: Path, dst: Path, charge: Optional[Charge] = None) -> str:
+    """
+    复制文件并保留时间、权限，依次尝试 reflink、copy_file_range、sendfile
+    :param charge: 限速回调，reflink 不复制数据，不申请配额
+    :return: 实际使用的复制方式
+    """
+    size = src.stat().st_size
+    with src.open("rb") as fsrc, dst.open("wb") as fdst:
+        infd, outfd = fsrc.fileno(), fdst.fileno()
+        if _reflink(infd, outfd):
+            mechanism = "reflink"
+        else:
+            mechanism, offset = "copy_file_range", 0
+            if hasattr(os, "copy_file_range"):
+                offset = _kernel_copy(
+                    infd, outfd, size, 0, use_range=True, charge=charge
+                )
+            if offset < size:
+                mechanism = "sendfile"
+                # sendfile 从输出文件的当前位置写入
+                os.lseek(outfd, offset, os.SEEK_SET)
+                offset = _kernel_copy(
+                    infd, outfd, size, offset, use_range=False, charge=charge
+                )
+            if offset < size:
+                raise OSError(errno.EIO, f"复制不完整：{offset}/{size}")
+    shutil.copystat(src, dst)
+    return mechanism
+
+
+def chunked_copy(src: Path, dst: Path, charge: Charge) -> str:
+    """
+    在用户态分块复制文件并保留时间、权限，每块复制前申请配额
+    :return: 实际使用的复制方式
+    """
+    with src.open("rb") as fsrc, dst.open("wb") as fdst:
+        while True:
+            buf = fsrc.read(THROTTLE_CHUNK)
+            if not buf:
+                break
+            charge(len(buf))
+            fdst.write(buf)
+    shutil.copystat(src, dst)
+    return "chunked"
+
+
+class CopyStats:
+    """
+    单次运行中各复制方式的文件数与字节数
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.counts: Dict[str, Tuple[int, int]] = {}
+
+    def add(self, mechanism: str, size: int) -> None:
+        with self._lock:
+            files, total = self.counts.get(mechanism, (0, 0))
+            self.counts[mechanism] = (files + 1, total + size)
+
+    @property
+    def summary(self) -> str:
+        if not self.counts:
+            return "无"
+        return "，".join(
+            f"{MECHANISMS[k]} {files} 个（{total / 1024**3:.2f} GB）"
+            for k, (files, total) in sorted(self.counts.items())
+        )
+
+
+# 替换后的复制实现：(源文件, 目标文件, 原实现) → (返回码, 错误信息)
+Copier = Callable[[Path, Path, Callable[..., Tuple[int, str]]], Tuple[int, str]]
+
+
+class _CopyHook:
+    """
+    按线程替换本地存储的复制实现 SystemUtils.copy
+    只有处于 use() 中的线程使用替换的实现，其他线程（主程序整理、其他插件）仍调用原实现
+    多个整理线程、多次运行共用一次替换，最后一个使用者结束后恢复原属性
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._users: int = 0
+        self._own = False  # 原实现是否定义在 SystemUtils 自身，而非继承自基类
+        self._saved: Any = None  # 替换前的原属性，用于恢复
+        self._original: Optional[Callable[..., Tuple[int, str]]] = None
+        self._patched: Any = None
+        self._local = local()
+
+    def __copy(self, src: Any, dest: Any) -> Tuple[int, str]:
+        copier: Optional[Copier] = getattr(self._local, "copier", None)
+        if copier is None:
+            return self._original(src, dest)
+        return copier(Path(src), Path(dest), self._original)
+
+    def __install(self) -> None:
+        self._own = "copy" in SystemUtils.__dict__
+        self._saved = inspect.getattr_static(SystemUtils, "copy")
+        self._original = SystemUtils.copy
+        self._patched = staticmethod(self.__copy)
+        SystemUtils.copy = self._patched
+
+    def __restore(self) -> None:
+        if SystemUtils.__dict__.get("copy") is not self._patched:
+            logger.warning("本地复制实现已被其他代码替换，不再恢复")
+        elif self._own:
+            SystemUtils.copy = self._saved
+        else:
+            del SystemUtils.copy
+        self._original = self._patched = None
+
+    @contextmanager
+    def use(self, copier: Copier) -> Iterator[None]:
+        """
+        当前线程在此期间的本地复制使用 copier
+        """
+        with self._lock:
+            if not self._users:
+                self.__install()
+            self._users += 1
+        self._local.copier = copier
+        try:
+            yield
+        finally:
+            self._local.copier = None
+            with self._lock:
+                self._users -= 1
+                if not self._users:
+                    self.__restore()
+
+
+_hook = _CopyHook()
+
+
+def local_copy(
+    stats: Optional[CopyStats] = None, charge: Optional[Charge] = None
+) -> ContextManager[None]:
+    """
+    当前线程的一次整理调用期间替换本地复制，失败时回退到原实现
+    只包住插件自己的整理调用，不影响同时进行的其他本地复制
+    :param stats: 不为空时使用零拷贝复制 copy_file，并统计各复制方式
+    :param charge: 不为空时按块复制，每块复制前申请配额；回退到原实现时先按整个文件申请
+    """
+
+    def copier(
+        src: Path, dest: Path, original: Callable[..., Tuple[int, str]]
+    ) -> Tuple[int, str]:
+        try:
+            if stats is not None:
+                mechanism = copy_file(src, dest, charge)
+            else:
+                mechanism = chunked_copy(src, dest, charge)
+        except Exception as e:
+            logger.debug(f"替换的复制方式失败，使用系统默认方式：{src}：{e}")
+            mechanism = "fallback"
+            if charge:
+                charge(src.stat().st_size)
+            code, message = original(src, dest)
+            if code != 0:
+                return code, message
+        if stats is not None:
+            stats.add(mechanism, dest.stat().st_size)
+        return 0, ""
+
+    return _hook.use(copier)
@@ -0,0 +1,231 @@
+from pathlib import Path
+from threading import Lock
+from typing import Any, List, Optional, Tuple
+import json
+import sqlite3
+import time
+
+from app.log import logger
+
+# 索引结构版本，结构变化后重建索引
+SCHEMA_VERSION = 2
+
+# 每次从整理记录表读取的条数
+BATCH_SIZE = 5000
+
+# 索引的整理记录字段，与 TransferHistory 同名
+FIELDS = (
+    "id",
+    "src",
+    "src_storage",
+    "src_fileitem",
+    "dest",
+    "dest_storage",
+    "dest_fileitem",
+    "mode",
+    "status",
+    "errmsg",
+    "date",
+    "type",
+    "category",
+    "tmdbid",
+    "doubanid",
+    "seasons",
+)
+
+# 以 JSON 保存的文件信息字段
+JSON_FIELDS = ("src_fileitem", "dest_fileitem")
+
+
+class IndexedHistory:
+    """
+    索引中的整理记录，字段与 TransferHistory 同名，可直接替代查询结果使用
+    """
+
+    __slots__ = FIELDS
+
+    def __init__(self, row: sqlite3.Row):
+        for field in FIELDS:
+            setattr(self, field, row[field])
+        for field in JSON_FIELDS:
+            setattr(self, field, json.loads(row[field] or "null"))
+
+    def __repr__(self) -> str:
+        return f"IndexedHistory(id={self.id}, src={self.src!r}, dest={self.dest!r})"
+
+
+class HistoryIndex:
+    """
+    插件自行维护的整理记录路径索引，保存在插件数据目录的 SQLite 中
+    按最大 ID 增量同步新增记录，记录数不一致时同步删除，查询不再访问主程序数据库
+    整理记录被原地修改（如状态变化）时不会同步，需要时删除索引文件重建
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self.__prepare()
+
+    def __prepare(self) -> None:
+        conn = self._conn
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+        row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if not row or row[0] != SCHEMA_VERSION:
+            conn.execute("DROP TABLE IF EXISTS history")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            "id INTEGER PRIMARY KEY, src TEXT, src_storage TEXT, src_fileitem TEXT, "
+            "dest TEXT, dest_storage TEXT, dest_fileitem TEXT, mode TEXT, "
+            "status INTEGER, errmsg TEXT, date TEXT, "
+            "type TEXT, category TEXT, tmdbid INTEGER, doubanid TEXT, seasons TEXT)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS history_src ON history (src)")
+        conn.execute("CREATE INDEX IF NOT EXISTS history_dest ON history (dest)")
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)",
+            (SCHEMA_VERSION,),
+        )
+        conn.commit()
+
+    @property
+    def last_id(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT MAX(id) FROM history").fetchone()[0] or 0
+
+    def refresh(self) -> Tuple[int, int]:
+        """
+        从整理记录表同步索引
+        :return: (新增条数, 移除条数)
+        """
+        from sqlalchemy import func  # type: ignore
+
+        from app.db import SessionFactory
+        from app.db.models.transferhistory import TransferHistory
+
+        start = time.time()
+        added = removed = 0
+        db = SessionFactory()
+        try:
+            last_id = self.last_id
+            columns = [getattr(TransferHistory, field) for field in FIELDS]
+            while True:
+                rows = (
+                    db.query(*columns)
+                    .filter(TransferHistory.id > last_id)
+                    .order_by(TransferHistory.id)
+                    .limit(BATCH_SIZE)
+                    .all()
+                )
+                if not rows:
+                    break
+                self.__insert(rows)
+                added += len(rows)
+                last_id = rows[-1][0]
+                if len(rows) < BATCH_SIZE:
+                    break
+            total = db.query(func.count(TransferHistory.id)).scalar() or 0
+            if total != self.count:
+                # 整理记录被删除，按 ID 对比移除
+                ids = {row[0] for row in db.query(TransferHistory.id).all()}
+                removed = self.__remove(ids)
+        finally:
+            db.close()
+        logger.info(
+            f"整理记录索引：新增 {added} 条，移除 {removed} 条，"
+            f"共 {self.count} 条，耗时 {time.time() - start:.2f} 秒"
+        )
+        return added, removed
+
+    def __insert(self, rows: List[Any]) -> None:
+        values = []
+        for row in rows:
+            row = list(row)
+            for field in JSON_FIELDS:
+                fileitem = row[FIELDS.index(field)]
+                row[FIELDS.index(field)] = (
+                    json.dumps(fileitem, ensure_ascii=False, default=str)
+                    if fileitem
+                    else None
+                )
+            row[FIELDS.index("date")] = str(row[FIELDS.index("date")] or "")
+            values.append(row)
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO history ({', '.join(FIELDS)}) "
+                f"VALUES ({', '.join('?' * len(FIELDS))})",
+                values,
+            )
+            self._conn.commit()
+
+    def __remove(self, ids: set) -> int:
+        with self._lock:
+            stale = [
+                (row[0],)
+                for row in self._conn.execute("SELECT id FROM history")
+                if row[0] not in ids
+            ]
+            self._conn.executemany("DELETE FROM history WHERE id = ?", stale)
+            self._conn.commit()
+        return len(stale)
+
+    @property
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    def get(
+        self, column: str, path: str, storage: Optional[str] = None
+    ) -> Optional[IndexedHistory]:
+        """
+        按源/目标路径查询最新的整理记录
+        :param column: src 或 dest
+        :param storage: 对应的存储类型，为空时不限制
+        """
+        sql, args = self.__where(column, storage)
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT * FROM history WHERE {column} = ?{sql} ORDER BY id DESC LIMIT 1",
+                (path, *args),
+            ).fetchone()
+        return IndexedHistory(row) if row else None
+
+    def under(
+        self,
+        column: str,
+        folder: str,
+        storage: Optional[str] = None,
+        after_id: int = 0,
+        since: str = "",
+    ) -> List[IndexedHistory]:
+        """
+        按 ID 顺序查询源/目标路径位于目录下的整理记录
+        :param after_id: 只返回 ID 大于该值的记录
+        :param since: 只返回整理时间不早于该时间的记录
+        """
+        # 路径按字符串有序，目录下的路径都在 [folder/, folder0) 区间内
+        prefix = folder.rstrip("/")
+        sql, args = self.__where(column, storage)
+        if since:
+            sql += " AND date >= ?"
+            args.append(since)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM history WHERE {column} >= ? AND {column} < ? "
+                f"AND id > ?{sql} ORDER BY id",
+                (prefix + "/", prefix + "0", after_id, *args),
+            ).fetchall()
+        return [IndexedHistory(row) for row in rows]
+
+    @staticmethod
+    def __where(column: str, storage: Optional[str]) -> Tuple[str, List[Any]]:
+        if column not in ("src", "dest"):
+            raise ValueError(f"不支持的索引字段：{column}")
+        if storage:
+            return f" AND {column}_storage = ?", [storage]
+        return "", []
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,237 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from threading import Lock
+from typing import Dict, List, Sequence, Tuple
+import time
+
+# 导出格式的 Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 指标名称前缀
+PREFIX = "moviepilot_plugin_"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric(ABC):
+    """
+    带标签的指标，标签值按声明顺序组成序列的键
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str]):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{k}="{_escape(v)}"' for k, v in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """
+        各序列的样本行
+        """
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self.samples(),
+        ]
+
+
+class Counter(_Metric):
+    """
+    只增不减的计数
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str]):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{self._labels(k)} {_format(v)}" for k, v in values]
+
+
+class Gauge(Counter):
+    """
+    可增可减的当前值
+    """
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """
+    按区间累计的分布
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str],
+        buckets: Sequence[float],
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # 各区间计数（非累计）、总和
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.setdefault(
+                key, ([0] * len(self.buckets), [0.0])
+            )
+            counts[bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            values = sorted((k, (list(c), t[0])) for k, (c, t) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_format(bound)}"'
+                lines.append(f"{self.name}_bucket{self._labels(key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(key)} {_format(total)}")
+            lines.append(f"{self.name}_count{self._labels(key)} {cumulative}")
+        return lines
+
+
+TASKS = Counter(
+    "tasks_total", "执行的任务数（含重试）", ("plugin", "storage", "result")
+)
+FAILURES = Counter(
+    "failures_total", "执行失败的任务数", ("plugin", "storage", "reason")
+)
+SKIPS = Counter("skipped_total", "查询阶段跳过的文件数", ("plugin", "reason"))
+BYTES = Counter(
+    "transferred_bytes_total", "整理的文件大小（字节）", ("plugin", "storage")
+)
+INFLIGHT = Gauge("inflight_calls", "正在执行的调用数", ("plugin", "storage"))
+TASK_SECONDS = Histogram(
+    "task_duration_seconds",
+    "单个任务的执行耗时（秒）",
+    ("plugin", "storage"),
+    (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+PHASE_SECONDS = Histogram(
+    "phase_duration_seconds",
+    "各阶段耗时（秒）",
+    ("plugin", "phase"),
+    (1, 5, 10, 30, 60, 300, 600, 1800, 3600, 7200),
+)
+RUNS = Counter("runs_total", "运行次数", ("plugin", "status"))
+LAST_RUN = Gauge("last_run_timestamp_seconds", "最近一次运行结束的时间戳", ("plugin",))
+IMPORT = Gauge("import_seconds", "插件模块的导入耗时（秒）", ("plugin",))
+LAST_THROUGHPUT = Gauge(
+    "last_run_throughput", "最近一次运行的吞吐量（任务/秒）", ("plugin",)
+)
+
+REGISTRY: List[_Metric] = [
+    TASKS,
+    FAILURES,
+    SKIPS,
+    BYTES,
+    INFLIGHT,
+    TASK_SECONDS,
+    PHASE_SECONDS,
+    RUNS,
+    LAST_RUN,
+    LAST_THROUGHPUT,
+    IMPORT,
+]
+
+
+def render() -> str:
+    """
+    按 Prometheus 文本格式导出全部指标
+    """
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class PluginMetrics:
+    """
+    绑定插件名称的指标记录
+    """
+
+    def __init__(self, plugin: str):
+        self.plugin = plugin
+
+    def imported(self, seconds: float) -> None:
+        IMPORT.set(seconds, plugin=self.plugin)
+
+    def call_started(self, storage: str) -> None:
+        INFLIGHT.inc(plugin=self.plugin, storage=storage)
+
+    def call_finished(self, storage: str) -> None:
+        INFLIGHT.dec(plugin=self.plugin, storage=storage)
+
+    def settled(self, storage: str, success: bool, reason: str, seconds: float) -> None:
+        """
+        :param reason: 失败原因：timeout 超时，error 返回失败，exception 抛出异常，verify 校验未通过
+        """
+        TASKS.inc(
+            plugin=self.plugin,
+            storage=storage,
+            result="success" if success else "failure",
+        )
+        if not success:
+            FAILURES.inc(plugin=self.plugin, storage=storage, reason=reason)
+        TASK_SECONDS.observe(seconds, plugin=self.plugin, storage=storage)
+
+    def skipped(self, reason: str) -> None:
+        SKIPS.inc(plugin=self.plugin, reason=reason)
+
+    def transferred(self, storage: str, size: int) -> None:
+        BYTES.inc(size or 0, plugin=self.plugin, storage=storage)
+
+    def run_finished(self, status: str, phases: Dict[str, float], throughput: float):
+        RUNS.inc(plugin=self.plugin, status=status)
+        for phase, seconds in phases.items():
+            PHASE_SECONDS.observe(seconds, plugin=self.plugin, phase=phase)
+        LAST_RUN.set(time.time(), plugin=self.plugin)
+        LAST_THROUGHPUT.set(throughput, plugin=self.plugin)
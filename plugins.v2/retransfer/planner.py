@@ -0,0 +1,240 @@
+from pathlib import Path, PurePosixPath
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple
+import re
+
+from app.schemas import FileItem
+from app.schemas.types import MediaType
+
+from .scanner import FileRecord
+
+if TYPE_CHECKING:
+    from app.db.models.transferhistory import TransferHistory
+
+
+class TransferTask:
+    """
+    单个重新整理任务
+    """
+
+    __slots__ = ("file", "logid", "dest_name", "target_dir", "media", "order")
+
+    def __init__(
+        self,
+        file: FileRecord,
+        history: "TransferHistory",
+        target_dir: Path,
+        batch: bool = False,
+    ):
+        """
+        :param batch: 是否整季批量整理，否则不提取媒体信息
+        """
+        self.file = file  # 源文件
+        # 只保留整理记录的 ID 与原文件名，不持有数据库对象
+        self.logid: int = history.id
+        self.dest_name: Optional[str] = (
+            Path(history.dest).name if history.dest else None
+        )
+        self.target_dir = target_dir  # 推算的目标目录
+        # 整理记录中的媒体信息，用于整季批量整理
+        self.media = media_key(history) if batch else None
+        self.order: Tuple = ()  # 排序键，同时作为分片运行的断点
+
+    @property
+    def size(self) -> int:
+        return self.file.size or 0
+
+    @property
+    def target_file(self) -> Optional[Path]:
+        """
+        推算的目标文件路径，沿用原媒体库中的文件名
+        """
+        if not self.dest_name:
+            return None
+        return self.target_dir / self.dest_name
+
+
+class SeasonBatch:
+    """
+    同一源目录下属于同一季（或同一部电影）的全部任务，按目录整理一次
+    """
+
+    __slots__ = ("tasks", "folder", "order")
+
+    def __init__(self, tasks: List[TransferTask], folder: FileItem):
+        self.tasks = tasks
+        self.folder = folder  # 源目录
+        self.order: Tuple = tasks[-1].order  # 与最后一个任务相同
+
+    @property
+    def file(self) -> FileItem:
+        return self.folder
+
+    @property
+    def size(self) -> int:
+        return sum(task.size for task in self.tasks)
+
+    @property
+    def target_dir(self) -> Path:
+        return self.tasks[0].target_dir
+
+    @property
+    def media(self) -> Tuple:
+        return self.tasks[0].media
+
+
+def media_key(history: "TransferHistory") -> Optional[Tuple]:
+    """
+    整理记录中的 (类型, TMDB ID, 豆瓣 ID, 季)，缺少媒体 ID、季不是单季、
+    或原记录为移动（重新整理时以目标文件为源）时返回 None，不参与批量整理
+    """
+    if not history.type or not (history.tmdbid or history.doubanid):
+        return None
+    if history.status and "move" in (history.mode or ""):
+        return None
+    season = None
+    if history.seasons:
+        match = re.fullmatch(r"S(\d+)", str(history.seasons))
+        if not match:
+            return None
+        season = int(match.group(1))
+    return (
+        history.type,
+        int(history.tmdbid) if history.tmdbid else None,
+        str(history.doubanid) if history.doubanid else None,
+        season,
+    )
+
+
+class FolderCensus:
+    """
+    扫描时统计各源目录下直接包含的媒体文件数，用于判断任务是否覆盖了整个目录
+    """
+
+    def __init__(self, extensions: Iterable[str]):
+        self._extensions = frozenset(e.lower() for e in extensions)
+        self._files: Dict[str, int] = {}
+        self._nested: Set[str] = set()  # 子目录中也有媒体文件的目录
+
+    def add(self, file: FileRecord) -> None:
+        extension = file.extension
+        if not extension or f".{extension.lower()}" not in self._extensions:
+            return
+        folder = file.root + file.parent
+        self._files[folder] = self._files.get(folder, 0) + 1
+        rel = file.parent.rstrip("/")
+        while rel:
+            rel = rel.rpartition("/")[0]
+            self._nested.add(file.root + rel + "/" if rel else file.root)
+
+    def complete(self, folder: str, count: int) -> bool:
+        """
+        目录下的媒体文件恰好为 count 个，且子目录中没有媒体文件
+        """
+        return folder not in self._nested and self._files.get(folder) == count
+
+
+def batch_seasons(
+    tasks: List[TransferTask], census: FolderCensus, min_files: int = 2
+) -> List[TransferTask | SeasonBatch]:
+    """
+    将覆盖了整个源目录、且媒体信息与目标目录一致的任务合并为整季批量任务
+    批量任务放在其最后一个任务的位置，保持断点前的任务均已完成
+    """
+    groups: Dict[str, List[TransferTask]] = {}
+    for task in tasks:
+        if task.file.parent and task.media:
+            groups.setdefault(task.file.root + task.file.parent, []).append(task)
+    batches: Dict[int, SeasonBatch] = {}
+    members: Set[int] = set()
+    for folder, group in groups.items():
+        if len(group) < min_files or not census.complete(folder, len(group)):
+            continue
+        if len({(t.media, t.target_dir) for t in group}) != 1:
+            continue
+        first = group[0].file
+        batches[id(group[-1])] = SeasonBatch(
+            group,
+            FileItem(
+                storage=first.storage,
+                type="dir",
+                path=folder,
+                name=PurePosixPath(folder).name,
+            ),
+        )
+        members.update(id(t) for t in group)
+    result: List[TransferTask | SeasonBatch] = []
+    for task in tasks:
+        if id(task) in batches:
+            result.append(batches[id(task)])
+        elif id(task) not in members:
+            result.append(task)
+    return result
+
+
+def resolve_target_dir(
+    history: "TransferHistory",
+    target_path: str,
+    library_type_folder: bool,
+    library_category_folder: bool,
+) -> Path:
+    """
+    根据整理记录推算文件在新媒体库中的目标目录
+    电视剧沿用原媒体库中的 剧集/季 两级目录，电影沿用一级目录
+    推算结果只用于排序与差异同步比对，实际目录由主程序整理时确定并创建
+    """
+    path = Path(target_path)
+    if library_type_folder and history.type:
+        path = path / history.type
+    if library_category_folder and history.category:
+        path = path / history.category
+    if not history.dest:
+        return path
+    depth = 2 if history.type == MediaType.TV.value else 1
+    return path.joinpath(*Path(history.dest).parent.parts[-depth:])
+
+
+def order_tasks(tasks: List[TransferTask], by_size: bool = False) -> List[TransferTask]:
+    """
+    按目标目录聚合任务，同一目录下的文件连续整理，并为每个任务生成排序键
+    :param by_size: 小目录、小文件优先
+    """
+    totals: Dict[Path, int] = {}
+    if by_size:
+        for task in tasks:
+            totals[task.target_dir] = totals.get(task.target_dir, 0) + task.size
+    for task in tasks:
+        if by_size:
+            task.order = (
+                totals[task.target_dir],
+                str(task.target_dir),
+                task.size,
+                task.file.path or "",
+            )
+        else:
+            task.order = (str(task.target_dir), task.file.path or "")
+    return sorted(tasks, key=lambda t: t.order)
+
+
+class TargetIndex:
+    """
+    目标媒体库的文件索引，路径 → (大小, 修改时间)，单次运行只列出一次目标目录
+    """
+
+    def __init__(self, files: Iterable[FileRecord]):
+        self._files: Dict[str, Tuple[int, float]] = {
+            f.path: (f.size or 0, f.modify_time or 0)
+            for f in files
+            if f.type == "file" and f.path
+        }
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def is_current(self, path: Path, size: int, mtime: float) -> bool:
+        """
+        目标文件存在、大小一致且不早于源文件时视为已是最新
+        """
+        target = self._files.get(path.as_posix())
+        if not target:
+            return False
+        return target[0] == size and target[1] >= mtime
@@ -0,0 +1,387 @@
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from pathlib import Path
+from threading import (
+    Event,
+    Lock,
+    Thread,
+    current_thread,
+    enumerate as threads,
+    get_ident,
+)
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional
+import json
+import os
+import shutil
+import sys
+import time
+import tracemalloc
+
+from fastapi.responses import FileResponse
+
+from app.log import logger
+from app.plugins import _PluginBase
+from app.schemas import Response
+
+# 插件数据目录下保存分析结果的目录
+PROFILE_DIR = "profiles"
+
+# 最多保留的分析结果数
+MAX_PROFILES = 5
+
+# 时间线最多记录的事件数，超出后丢弃
+MAX_EVENTS = 200000
+
+# 调用栈采样间隔（秒）
+SAMPLE_INTERVAL = 0.01
+
+# 内存快照记录的调用栈深度与输出的条目数
+MEMORY_FRAMES = 10
+MEMORY_TOP = 50
+
+# 分析结果文件
+TRACE_FILE = "trace.json"
+STACKS_FILE = "stacks.folded"
+MEMORY_FILE = "memory.txt"
+
+
+class TraceRecorder:
+    """
+    Chrome trace 格式的时间线，可在 chrome://tracing 或 ui.perfetto.dev 中打开
+    """
+
+    def __init__(self, max_events: int = MAX_EVENTS):
+        self.max_events = max_events
+        self.started = time.perf_counter()
+        self.dropped: int = 0
+        self._events: List[Dict[str, Any]] = []
+        self._threads: Dict[int, str] = {}
+        self._lock = Lock()
+
+    def __ts(self, moment: float) -> float:
+        return round((moment - self.started) * 1e6, 1)
+
+    def __add(self, *events: Dict[str, Any]) -> None:
+        with self._lock:
+            if len(self._events) + len(events) > self.max_events:
+                self.dropped += len(events)
+                return
+            self._events.extend(events)
+
+    @contextmanager
+    def span(
+        self, name: str, cat: str, min_seconds: float = 0, **args: Any
+    ) -> Iterator[None]:
+        """
+        记录当前线程上一段代码的耗时
+        :param min_seconds: 短于该时间的不记录，用于调用次数很多的阶段
+        """
+        tid = get_ident()
+        if tid not in self._threads:
+            self._threads[tid] = current_thread().name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            if duration >= min_seconds:
+                self.__add(
+                    {
+                        "name": name,
+                        "cat": cat,
+                        "ph": "X",
+                        "ts": self.__ts(start),
+                        "dur": round(duration * 1e6, 1),
+                        "pid": os.getpid(),
+                        "tid": tid,
+                        "args": args,
+                    }
+                )
+
+    def async_span(
+        self, name: str, cat: str, key: Any, start: float, **args: Any
+    ) -> None:
+        """
+        记录事件循环中并发执行的一段耗时，使用异步事件避免同一线程上的时间段相互重叠
+        :param start: 开始时的 time.perf_counter()
+        """
+        event = {"name": name, "cat": cat, "id": str(key), "pid": os.getpid()}
+        self.__add(
+            {**event, "ph": "b", "ts": self.__ts(start), "args": args},
+            {**event, "ph": "e", "ts": self.__ts(time.perf_counter())},
+        )
+
+    def dump(self, path: Path) -> None:
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+        # 线程名称，时间线中按名称显示各线程
+        events.extend(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": {"name": name},
+            }
+            for tid, name in threads.items()
+        )
+        with path.open("w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "traceEvents": events,
+                    "displayTimeUnit": "ms",
+                    "otherData": {"dropped": self.dropped},
+                },
+                f,
+                ensure_ascii=False,
+            )
+
+
+class StackSampler(Thread):
+    """
+    定时采样进程内所有线程的调用栈，汇总为折叠格式，可在 speedscope 或 flamegraph.pl 中查看
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.samples: int = 0
+        self.stacks: Counter = Counter()
+        self._halt = Event()
+
+    def run(self) -> None:
+        own = get_ident()
+        while not self._halt.wait(self.interval):
+            names = {t.ident: t.name for t in threads()}
+            for tid, frame in sys._current_frames().items():
+                if tid == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})"
+                    )
+                    frame = frame.f_back
+                stack.append(names.get(tid, str(tid)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self) -> None:
+        self._halt.set()
+        self.join()
+
+    def dump(self, path: Path) -> None:
+        with path.open("w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RunProfile:
+    """
+    单次运行的性能分析：时间线，可选调用栈采样与内存快照，结束后写入 directory
+    """
+
+    def __init__(self, directory: Path, detail: bool = False):
+        """
+        :param detail: 同时采样调用栈并记录运行前后的内存快照
+        """
+        self.directory = directory
+        self.detail = detail
+        self.tracer = TraceRecorder()
+        self._sampler: Optional[StackSampler] = None
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._tracing = False  # 是否由本次分析开启 tracemalloc
+
+    def __enter__(self) -> "RunProfile":
+        if self.detail:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(MEMORY_FRAMES)
+                self._tracing = True
+            self._snapshot = tracemalloc.take_snapshot()
+            self._sampler = StackSampler()
+            self._sampler.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        try:
+            self.save()
+        except Exception as e:
+            logger.error(f"保存性能分析结果失败：{e}")
+        finally:
+            if self._tracing:
+                tracemalloc.stop()
+
+    def save(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.tracer.dump(self.directory / TRACE_FILE)
+        if self._sampler:
+            self._sampler.stop()
+            self._sampler.dump(self.directory / STACKS_FILE)
+        if self._snapshot:
+            self.__dump_memory(self.directory / MEMORY_FILE)
+        logger.info(f"性能分析结果已保存：{self.directory}")
+
+    def __dump_memory(self, path: Path) -> None:
+        """
+        运行结束时与开始时的内存分配差异，按增量排序
+        """
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [
+            f"当前 {current / 1024**2:.1f} MB，峰值 {peak / 1024**2:.1f} MB",
+            "",
+            f"按代码行的内存增量（前 {MEMORY_TOP} 条）：",
+            *(
+                str(s)
+                for s in snapshot.compare_to(self._snapshot, "lineno")[:MEMORY_TOP]
+            ),
+            "",
+            f"按调用栈的内存占用（前 {MEMORY_TOP // 5} 条）：",
+        ]
+        for stat in snapshot.statistics("traceback")[: MEMORY_TOP // 5]:
+            lines.append(f"{stat.count} 个对象，{stat.size / 1024:.1f} KiB")
+            lines.extend(f"    {line}" for line in stat.traceback.format())
+        path.write_text("\n".join(lines), encoding="utf-8")
+
+
+class ProfileStore:
+    """
+    插件数据目录下保存的性能分析结果，每次运行一个子目录，只保留最近的几次
+    """
+
+    def __init__(self, directory: Path, keep: int = MAX_PROFILES):
+        self.directory = directory
+        self.keep = keep
+
+    def create(self, detail: bool) -> RunProfile:
+        runs = self.runs()
+        for name in runs[self.keep - 1 :]:
+            shutil.rmtree(self.directory / name, ignore_errors=True)
+        name = time.strftime("%Y%m%d-%H%M%S")
+        directory, n = self.directory / name, 1
+        while directory.exists():
+            # 同一秒内多次运行
+            directory, n = self.directory / f"{name}-{n}", n + 1
+        return RunProfile(directory, detail)
+
+    def runs(self) -> List[str]:
+        """
+        分析结果目录名，最近的在前
+        """
+        if not self.directory.exists():
+            return []
+        return sorted(
+            (p.name for p in self.directory.iterdir() if p.is_dir()), reverse=True
+        )
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "run": name,
+                "files": {
+                    p.name: p.stat().st_size
+                    for p in sorted((self.directory / name).iterdir())
+                },
+            }
+            for name in self.runs()
+        ]
+
+    def file(self, run: str, name: str) -> Optional[Path]:
+        """
+        按目录名与文件名取得分析结果文件，只接受已存在的名称
+        """
+        if run not in self.runs():
+            return None
+        path = self.directory / run / name
+        if name not in os.listdir(self.directory / run) or not path.is_file():
+            return None
+        return path
+
+
+def profiled(func: Callable[..., Any]) -> Callable[..., Any]:
+    """
+    插件运行方法的装饰器：开启了性能分析时记录本次运行，开关只对一次运行生效
+    插件需提供 _profile、_profile_detail 配置，运行期间通过 _tracer 取得时间线
+    """
+
+    @wraps(func)
+    def wrapper(plugin: _PluginBase, *args: Any, **kwargs: Any) -> Any:
+        if not plugin._profile:
+            return func(plugin, *args, **kwargs)
+        plugin._profile = False
+        plugin.update_config({**(plugin.get_config() or {}), "profile": False})
+        profile = ProfileStore(plugin.get_data_path() / PROFILE_DIR).create(
+            plugin._profile_detail
+        )
+        plugin._tracer = profile.tracer
+        try:
+            with profile, profile.tracer.span("运行", "run"):
+                return func(plugin, *args, **kwargs)
+        finally:
+            plugin._tracer = None
+
+    return wrapper
+
+
+def profile_api(plugin: _PluginBase) -> List[Dict[str, Any]]:
+    """
+    性能分析相关的插件 API：开启下次运行的分析、列出与下载分析结果
+    """
+
+    def store() -> ProfileStore:
+        return ProfileStore(plugin.get_data_path() / PROFILE_DIR)
+
+    def arm(detail: bool = False) -> Response:
+        plugin._profile, plugin._profile_detail = True, detail
+        plugin.update_config(
+            {**(plugin.get_config() or {}), "profile": True, "profile_detail": detail}
+        )
+        return Response(success=True, message="下次运行时进行性能分析")
+
+    def runs() -> List[Dict[str, Any]]:
+        return store().list()
+
+    def download(run: str, name: str) -> Any:
+        path = store().file(run, name)
+        if not path:
+            return Response(success=False, message="分析结果不存在")
+        return FileResponse(path, filename=f"{run}-{name}")
+
+    return [
+        {
+            "path": "/profile",
+            "endpoint": arm,
+            "methods": ["GET"],
+            "auth": "apikey",
+            "summary": "开启性能分析",
+            "description": "下次运行时记录时间线，detail=true 时同时采样调用栈与内存快照",
+        },
+        {
+            "path": "/profiles",
+            "endpoint": runs,
+            "methods": ["GET"],
+            "auth": "apikey",
+            "summary": "性能分析结果",
+            "description": "列出保存的性能分析结果及其中的文件",
+        },
+        {
+            "path": "/profile/download",
+            "endpoint": download,
+            "methods": ["GET"],
+            "auth": "apikey",
+            "summary": "下载性能分析结果",
+            "description": f"下载 {TRACE_FILE}、{STACKS_FILE} 或 {MEMORY_FILE}",
+        },
+    ]
+
+
+def trace(
+    tracer: Optional[TraceRecorder], name: str, cat: str, **args: Any
+) -> ContextManager[None]:
+    """
+    开启性能分析时在时间线中记录一段耗时，否则不做任何事
+    """
+    return tracer.span(name, cat, **args) if tracer else nullcontext()
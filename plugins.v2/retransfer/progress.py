@@ -0,0 +1,55 @@
+from typing import Dict, Iterable
+import time
+
+from app.log import logger
+
+
+class LazyJoin:
+    """
+    延迟拼接，只有日志真正输出时才生成字符串
+    """
+
+    __slots__ = ("sep", "items")
+
+    def __init__(self, sep: str, items: Iterable[str]):
+        self.sep = sep
+        self.items = items
+
+    def __str__(self) -> str:
+        return self.sep.join(self.items)
+
+
+class ProgressLogger:
+    """
+    限频输出运行进度，每处理 every 条或间隔 interval 秒输出一行汇总
+    """
+
+    def __init__(self, title: str, every: int = 100, interval: float = 30):
+        self.title = title
+        self.every = every
+        self.interval = interval
+        self.total: int = 0
+        self.counters: Dict[str, int] = {}
+        self._start = time.monotonic()
+        self._last = self._start
+
+    def count(self, key: str) -> None:
+        """
+        记录一条处理结果
+        """
+        self.total += 1
+        self.counters[key] = self.counters.get(key, 0) + 1
+        now = time.monotonic()
+        if self.total % self.every == 0 or now - self._last >= self.interval:
+            self.flush(now)
+
+    def flush(self, now: float = 0) -> None:
+        now = now or time.monotonic()
+        self._last = now
+        logger.info(
+            "%s进度：已处理 %d 条（%.1f 条/秒），%s",
+            self.title,
+            self.total,
+            self.total / max(now - self._start, 1e-6),
+            LazyJoin("，", (f"{k} {v} 条" for k, v in self.counters.items())),
+        )
@@ -0,0 +1,434 @@
+from pathlib import Path, PurePosixPath
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple
+from uuid import uuid4
+import json
+import os
+import shutil
+import socket
+import time
+import zlib
+
+from app.log import logger
+from app.schemas import FileItem
+
+from .pipeline import RunStats
+
+# 租约有效期（秒），持有者每隔四分之一有效期续期一次，各实例的系统时间需大致一致
+LEASE_TTL = 300
+
+# 保留的处理轮次数
+KEEP_SWEEPS = 3
+
+# 分片结果与汇总报告中保留的失败信息条数
+MAX_MESSAGES = 100
+
+# 分片结果中的计数，续跑时重新扫描整个分片，扫描、排除、跳过数取各次运行的最大值，其余累加
+COUNTERS = ("listed", "filtered", "dispatched", "success", "failed", "skipped")
+RESCANNED = ("listed", "filtered", "skipped")
+
+
+def shard_of(key: str, count: int) -> int:
+    """
+    稳定的分片序号，各实例、各次运行一致
+    """
+    return zlib.crc32(key.encode("utf-8")) % count
+
+
+def summarize(
+    stats: RunStats, previous: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    分片运行结果，写入共享目录供汇总
+    :param previous: 该分片之前未完成的运行结果，累加到本次结果中
+    """
+    previous = previous or {}
+    current = {
+        "listed": stats.listed,
+        "filtered": stats.filtered,
+        "dispatched": stats.dispatched,
+        "success": stats.success,
+        "failed": len(stats.failed_msgs),
+        "skipped": sum(stats.skip_reasons.values()),
+    }
+    return {
+        **{
+            key: (
+                max(current[key], previous.get(key, 0))
+                if key in RESCANNED
+                else current[key] + previous.get(key, 0)
+            )
+            for key in COUNTERS
+        },
+        "duration": round(stats.duration + previous.get("duration", 0), 2),
+        "failed_msgs": [*previous.get("failed_msgs", []), *stats.failed_msgs][
+            :MAX_MESSAGES
+        ],
+    }
+
+
+class ShardStop(Event):
+    """
+    分片的退出事件，租约丢失时设置，插件的退出事件设置后同样视为已设置
+    """
+
+    def __init__(self, parent: Optional[Event] = None):
+        super().__init__()
+        self._parent = parent
+
+    def is_set(self) -> bool:
+        return self.lost or bool(self._parent and self._parent.is_set())
+
+    @property
+    def lost(self) -> bool:
+        """
+        租约是否已被其他实例回收
+        """
+        return super().is_set()
+
+
+class Shard:
+    """
+    本实例认领的分片
+    """
+
+    __slots__ = ("index", "cursor", "partial", "stop")
+
+    def __init__(
+        self,
+        index: int,
+        cursor: Any = None,
+        partial: Optional[Dict[str, Any]] = None,
+        stop: Optional[ShardStop] = None,
+    ):
+        self.index = index
+        self.cursor = cursor  # 之前认领者未完成时保存的断点
+        self.partial = partial  # 之前认领者未完成时的运行结果
+        self.stop = stop or ShardStop()  # 处理该分片时使用的退出事件
+
+
+class ShardCoordinator:
+    """
+    多个 MoviePilot 实例通过共享目录中的租约文件分担同一轮全量处理
+    目录结构：<directory>/<namespace>/sweep-<轮次>/ 下每个分片一组文件
+    shard-<序号>.lease 租约，shard-<序号>.done 已完成及其结果，shard-<序号>.cursor 未完成时的断点
+    所有分片完成后由最后完成的实例写入 report.json 汇总报告，下次运行开始新的一轮
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        namespace: str,
+        count: int,
+        ttl: float = LEASE_TTL,
+    ):
+        """
+        :param namespace: 同一插件、同一配置的实例共用，配置不同的实例互不干扰
+        :param count: 分片数，共用 namespace 的实例需一致
+        """
+        self.root = Path(directory) / namespace
+        self.count = max(count, 1)
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:6]}"
+        self.sweep: Optional[Path] = None
+        self.lost: int = 0  # 被其他实例回收的租约数
+        self._held: Dict[int, Tuple[Path, ShardStop]] = {}  # 序号 → (租约, 退出事件)
+        self._lock = Lock()
+        self._stop = Event()
+        self._heartbeat: Optional[Thread] = None
+
+    def __enter__(self) -> "ShardCoordinator":
+        self.sweep = self.__current_sweep(create=True)
+        self._heartbeat = Thread(
+            target=self.__renew_loop, name="shard-heartbeat", daemon=True
+        )
+        self._heartbeat.start()
+        logger.info(f"分片运行：{self.sweep}，实例 {self.owner}")
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        if self._heartbeat:
+            self._heartbeat.join()
+        # 异常退出时未完成的分片释放给其他实例
+        for index in list(self._held):
+            self.release(Shard(index))
+
+    def __path(self, index: int, suffix: str, sweep: Optional[Path] = None) -> Path:
+        return (sweep or self.sweep) / f"shard-{index:04d}.{suffix}"
+
+    def __sweeps(self) -> List[int]:
+        if not self.root.exists():
+            return []
+        return sorted(
+            int(p.name[6:])
+            for p in self.root.iterdir()
+            if p.name.startswith("sweep-") and p.name[6:].isdigit()
+        )
+
+    def __current_sweep(self, create: bool = False) -> Optional[Path]:
+        """
+        当前轮次，上一轮已汇总时开始新的一轮
+        """
+        sweeps = self.__sweeps()
+        number = sweeps[-1] if sweeps else 1
+        sweep = self.root / f"sweep-{number:06d}"
+        if not create:
+            return sweep if sweeps else None
+        if (sweep / "report.json").exists():
+            sweep = self.root / f"sweep-{number + 1:06d}"
+        sweep.mkdir(parents=True, exist_ok=True)
+        for old in sweeps[:-KEEP_SWEEPS]:
+            shutil.rmtree(self.root / f"sweep-{old:06d}", ignore_errors=True)
+        return sweep
+
+    @staticmethod
+    def __read(path: Path) -> Optional[Dict[str, Any]]:
+        """
+        读取 JSON 对象，文件不存在、内容不完整或不是对象时返回 None
+        """
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        return data if isinstance(data, dict) else None
+
+    @staticmethod
+    def __write(path: Path, data: Dict[str, Any]) -> None:
+        """
+        先写临时文件再替换，其他实例不会读到写了一半的内容
+        """
+        tmp = path.with_name(f"{path.name}.{uuid4().hex[:6]}.tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(path)
+
+    def __lease(self) -> Dict[str, Any]:
+        return {"owner": self.owner, "expires": time.time() + self.ttl}
+
+    def __expired(self, lease: Path, data: Optional[Dict[str, Any]]) -> bool:
+        """
+        :param data: 已读取的租约内容
+        """
+        expires = data.get("expires") if data else None
+        if isinstance(expires, (int, float)):
+            return expires < time.time()
+        # 刚创建尚未写入内容，或内容损坏时按修改时间判断
+        try:
+            return lease.stat().st_mtime + self.ttl < time.time()
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def __put_back(stale: Path, lease: Path) -> None:
+        """
+        放回误移走的租约，原处已有新租约时放弃，被移走租约的持有者续期时会发现租约丢失
+        """
+        try:
+            os.link(stale, lease)
+        except FileExistsError:
+            pass
+        except OSError:
+            # 不支持硬链接的文件系统
+            if not lease.exists():
+                stale.replace(lease)
+        stale.unlink(missing_ok=True)
+
+    def __claim(self, index: int, event: Optional[Event] = None) -> Optional[Shard]:
+        """
+        认领未完成、且无人持有或租约已过期的分片
+        """
+        lease = self.__path(index, "lease")
+        for _ in range(2):
+            if self.__path(index, "done").exists():
+                return None
+            try:
+                fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+            except FileExistsError:
+                seen = self.__read(lease)
+                if not self.__expired(lease, seen):
+                    return None
+                # 重命名只有一个实例能成功，成功者删除过期租约后重新认领
+                stale = lease.with_name(f"{lease.name}.{uuid4().hex[:6]}.stale")
+                try:
+                    lease.rename(stale)
+                except FileNotFoundError:
+                    continue
+                # 检查与重命名之间租约可能已被续期，或已被其他实例回收并重新认领，
+                # 移走的不是检查过的过期租约时放回原处
+                moved = self.__read(stale)
+                if moved != seen or not self.__expired(stale, moved):
+                    self.__put_back(stale, lease)
+                    return None
+                stale.unlink(missing_ok=True)
+                owner = (moved or {}).get("owner")
+                logger.info(f"回收分片 {index} 的过期租约（原持有者 {owner}）")
+                continue
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.__lease(), f)
+            if self.__path(index, "done").exists():
+                lease.unlink(missing_ok=True)
+                return None
+            stop = ShardStop(event)
+            with self._lock:
+                self._held[index] = (lease, stop)
+            saved = self.__read(self.__path(index, "cursor")) or {}
+            return Shard(index, saved.get("cursor"), saved.get("partial"), stop)
+        return None
+
+    def claims(self, event: Optional[Event] = None) -> Generator[Shard, None, None]:
+        """
+        依次认领分片，调用方处理完一个分片后才认领下一个
+        各实例从不同位置开始，减少同时认领同一分片
+        处理分片时使用 Shard.stop 作为退出事件，租约丢失时停止处理该分片
+        """
+        start = shard_of(self.owner, self.count)
+        for offset in range(self.count):
+            if event and event.is_set():
+                return
+            shard = self.__claim((start + offset) % self.count, event)
+            if shard:
+                yield shard
+
+    def __renew_loop(self) -> None:
+        while not self._stop.wait(self.ttl / 4):
+            with self._lock:
+                held = dict(self._held)
+            for index, (lease, stop) in held.items():
+                data = self.__read(lease)
+                if not data:
+                    # 其他实例检查过期租约时可能短暂移走后放回
+                    time.sleep(1)
+                    data = self.__read(lease)
+                if not data or data.get("owner") != self.owner:
+                    logger.warning(
+                        f"分片 {index} 的租约已被其他实例回收，停止处理该分片"
+                    )
+                    stop.set()
+                    with self._lock:
+                        self._held.pop(index, None)
+                        self.lost += 1
+                    continue
+                try:
+                    self.__write(lease, self.__lease())
+                except OSError as e:
+                    logger.error(f"分片 {index} 租约续期失败：{e}")
+
+    def holds(self, shard: Shard) -> bool:
+        with self._lock:
+            return shard.index in self._held
+
+    def complete(self, shard: Shard, stats: RunStats) -> None:
+        """
+        分片处理完成，记录结果并释放租约
+        """
+        if self.holds(shard):
+            self.__write(
+                self.__path(shard.index, "done"),
+                {
+                    "owner": self.owner,
+                    "finished": time.time(),
+                    **summarize(stats, shard.partial),
+                },
+            )
+        self.__path(shard.index, "cursor").unlink(missing_ok=True)
+        self.release(shard)
+
+    def release(
+        self, shard: Shard, cursor: Any = None, stats: Optional[RunStats] = None
+    ) -> None:
+        """
+        未完成时释放分片，保存断点与已有的运行结果供下一个认领者继续
+        """
+        with self._lock:
+            held = self._held.pop(shard.index, None)
+        if not held:
+            return
+        lease, _ = held
+        if cursor is not None:
+            self.__write(
+                self.__path(shard.index, "cursor"),
+                {
+                    "cursor": cursor,
+                    "partial": (
+                        summarize(stats, shard.partial) if stats else shard.partial
+                    ),
+                },
+            )
+        lease.unlink(missing_ok=True)
+
+    def finish(self) -> Optional[Dict[str, Any]]:
+        """
+        所有分片完成后汇总本轮结果，只有一个实例能写入报告并返回，其余返回 None
+        """
+        results = [self.__read(self.__path(i, "done")) for i in range(self.count)]
+        if not all(results):
+            return None
+        owners: Dict[str, int] = {}
+        for result in results:
+            owners[result["owner"]] = owners.get(result["owner"], 0) + 1
+        report = {
+            "sweep": self.sweep.name,
+            "shards": self.count,
+            "owners": owners,
+            "finished": time.time(),
+            **{key: sum(r.get(key, 0) for r in results) for key in COUNTERS},
+            "failed_msgs": [m for r in results for m in r.get("failed_msgs", [])][
+                :MAX_MESSAGES
+            ],
+        }
+        try:
+            fd = os.open(
+                self.sweep / "report.json", os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644
+            )
+        except FileExistsError:
+            return None
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False)
+        return report
+
+    def status(self) -> Dict[str, Any]:
+        """
+        当前轮次各分片的状态，不认领分片，内容不完整的租约按无人持有处理
+        """
+        sweep = self.__current_sweep()
+        if not sweep:
+            return {"sweep": None, "shards": []}
+        shards = []
+        for index in range(self.count):
+            done = self.__read(self.__path(index, "done", sweep))
+            lease = self.__read(self.__path(index, "lease", sweep))
+            expires = lease.get("expires") if lease else None
+            if done:
+                shards.append(
+                    {"shard": index, "state": "done", "owner": done.get("owner")}
+                )
+            elif isinstance(expires, (int, float)):
+                state = "leased" if expires >= time.time() else "expired"
+                shards.append(
+                    {"shard": index, "state": state, "owner": lease.get("owner")}
+                )
+            else:
+                cursor = self.__read(self.__path(index, "cursor", sweep))
+                shards.append(
+                    {"shard": index, "state": "partial" if cursor else "pending"}
+                )
+        return {
+            "sweep": sweep.name,
+            "shards": shards,
+            "report": self.__read(sweep / "report.json"),
+        }
+
+
+def shard_filter(
+    count: int, index: int, prefix: str = ""
+) -> Callable[[FileItem], bool]:
+    """
+    扫描时只保留属于该分片的一级子目录与文件
+    :param prefix: 参与哈希的前缀，多个扫描根目录时用于区分
+    """
+
+    def accept(item: FileItem) -> bool:
+        name = item.name or PurePosixPath((item.path or "").rstrip("/")).name
+        return shard_of(prefix + name, count) == index
+
+    return accept
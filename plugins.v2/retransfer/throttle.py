@@ -0,0 +1,130 @@
+from datetime import datetime, time as dtime
+from threading import Event, Lock
+from typing import Optional, Tuple
+import time
+
+import pytz
+
+from app.core.config import settings
+
+
+class TokenBucket:
+    """
+    令牌桶，多个整理线程共享同一个实例
+    按块申请时单次不超过桶容量，不会透支；按整个文件申请时可能超过桶容量，
+    此时允许透支，后续申请需等待补齐欠款，长期速率保持不变
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate  # 每秒补充的令牌数，<= 0 表示不限制
+        self.capacity = capacity or rate  # 桶容量，默认允许 1 秒的突发
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = Lock()
+
+    def acquire(self, amount: float, event: Optional[Event] = None) -> float:
+        """
+        申请令牌，返回等待的秒数；event 被设置时立即返回
+        """
+        if self.rate <= 0 or amount <= 0:
+            return 0.0
+        need = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._last) * self.rate
+                )
+                self._last = now
+                if self._tokens >= need:
+                    self._tokens -= amount
+                    return waited
+                delay = (need - self._tokens) / self.rate
+            if event is not None:
+                if event.wait(delay):
+                    return waited
+            else:
+                time.sleep(delay)
+            waited += delay
+
+
+class ThrottleProfile:
+    """
+    一组带宽（字节/秒）与文件数（个/秒）限制
+    """
+
+    def __init__(self, bytes_per_sec: float, files_per_sec: float, burst: int = 0):
+        """
+        :param burst: 带宽的最小突发字节数，不小于单次按块申请的大小以免透支
+        """
+        self.bytes = TokenBucket(bytes_per_sec, max(bytes_per_sec, burst))
+        self.files = TokenBucket(files_per_sec)
+
+    @property
+    def limited(self) -> bool:
+        return self.bytes.rate > 0 or self.files.rate > 0
+
+    def acquire(
+        self, size: int, event: Optional[Event] = None, files: int = 1
+    ) -> float:
+        waited = self.files.acquire(files, event)
+        return waited + self.bytes.acquire(size, event)
+
+
+def parse_window(window: str) -> Optional[Tuple[dtime, dtime]]:
+    """
+    解析 HH:MM-HH:MM 格式的时间段，支持跨越零点
+    """
+    try:
+        start, end = (s.strip() for s in window.split("-", 1))
+        return (
+            datetime.strptime(start, "%H:%M").time(),
+            datetime.strptime(end, "%H:%M").time(),
+        )
+    except ValueError:
+        return None
+
+
+class Throttle:
+    """
+    按时间段在日间/夜间限速配置之间切换
+    """
+
+    def __init__(
+        self,
+        day: ThrottleProfile,
+        night: ThrottleProfile,
+        night_window: str = "",
+    ):
+        self.day = day
+        self.night = night
+        self._window = parse_window(night_window) if night_window else None
+        self.waited: float = 0.0  # 累计限速等待时间
+        self._lock = Lock()
+
+    @property
+    def limited(self) -> bool:
+        return self.day.limited or self.night.limited
+
+    def is_night(self, now: Optional[datetime] = None) -> bool:
+        if not self._window:
+            return False
+        current = (now or datetime.now(tz=pytz.timezone(settings.TZ))).time()
+        start, end = self._window
+        if start <= end:
+            return start <= current < end
+        return current >= start or current < end
+
+    def acquire(
+        self, size: int, event: Optional[Event] = None, files: int = 1
+    ) -> float:
+        """
+        为即将整理的文件或即将复制的数据块申请配额
+        :param files: 文件数，按目录整理时为目录下的文件数，按块申请时为 0
+        """
+        profile = self.night if self.is_night() else self.day
+        waited = profile.acquire(size, event, files)
+        with self._lock:
+            self.waited += waited
+        return waited
@@ -0,0 +1,94 @@
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Optional, Tuple
+import hashlib
+import mmap
+
+# 完整校验时每次读取的大小
+FULL_BLOCK = 8 * 1024**2
+
+# 校验模式
+MODES = {"sample": "抽样校验", "full": "完整校验"}
+
+
+def file_digest(path: Path, chunk: int, full: bool = False) -> str:
+    """
+    文件校验值，包含文件大小，通过 mmap 读取
+    :param chunk: 抽样时首、中、尾各读取的字节数
+    :param full: 读取整个文件
+    """
+    size = path.stat().st_size
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    if not size:
+        return digest.hexdigest()
+    with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+        if full or size <= chunk * 3:
+            for offset in range(0, size, FULL_BLOCK):
+                digest.update(m[offset : offset + FULL_BLOCK])
+        else:
+            for offset in (0, (size - chunk) // 2, size - chunk):
+                digest.update(m[offset : offset + chunk])
+    return digest.hexdigest()
+
+
+class TransferVerifier:
+    """
+    整理后校验目标文件与源文件一致：先比较大小，再比较抽样或完整的校验值
+    移动模式下源文件会被删除，需要在整理前记录源文件的校验值
+    """
+
+    def __init__(self, mode: str, chunk_mb: float):
+        self.mode = mode
+        self.chunk = max(int(chunk_mb * 1024**2), 1)
+        self._digests: Dict[int, str] = {}
+        self._lock = Lock()
+        self.passed: int = 0
+        self.failed: int = 0
+
+    def digest(self, path: Path) -> str:
+        return file_digest(path, self.chunk, self.mode == "full")
+
+    def remember(self, key: int, source: Path) -> None:
+        """
+        整理前记录源文件的校验值
+        """
+        value = self.digest(source)
+        with self._lock:
+            self._digests[key] = value
+
+    def verify(
+        self, key: int, source: Path, target: Optional[Path], size: int
+    ) -> Tuple[bool, str]:
+        """
+        :param key: 整理前记录校验值时使用的键，未记录时读取源文件
+        :param size: 源文件大小
+        """
+        with self._lock:
+            expected = self._digests.pop(key, None)
+        result = self.__check(expected, source, target, size)
+        with self._lock:
+            if result[0]:
+                self.passed += 1
+            else:
+                self.failed += 1
+        return result
+
+    def __check(
+        self, expected: Optional[str], source: Path, target: Optional[Path], size: int
+    ) -> Tuple[bool, str]:
+        if not target or not target.exists():
+            return False, f"校验失败：目标文件不存在 {target or ''}"
+        target_size = target.stat().st_size
+        if target_size != size:
+            return False, f"校验失败：大小不一致（{size} → {target_size}）"
+        if expected is None:
+            if not source.exists():
+                return False, "校验失败：源文件已不存在，无法比较"
+            expected = self.digest(source)
+        if self.digest(target) != expected:
+            return False, f"校验失败：{MODES[self.mode]}值不一致 {target}"
+        return True, ""
+
+    @property
+    def summary(self) -> str:
+        return f"{MODES[self.mode]}通过 {self.passed} 条，失败 {self.failed} 条"
@@ -1,20 +1,43 @@
 import time
+
+# 模块开始导入的时间，用于统计插件导入耗时
+_IMPORT_STARTED = time.perf_counter()
+
+from contextlib import ExitStack
 from datetime import datetime, timedelta
 from threading import Event
-from typing import List, Tuple, Dict, Any, Optional, Generator
+from typing import List, Tuple, Dict, Any, Optional, Generator, Iterable
 
 import pytz
 from apscheduler.schedulers.background import BackgroundScheduler  # type: ignore
+from fastapi.responses import PlainTextResponse
 
 from app.core.config import settings
-from app.api.endpoints.media import scrape
-from app.chain.storage import StorageChain
 from app.schemas import FileItem, NotificationType
 from app.schemas.types import StorageSchema
-from app.db.transferhistory_oper import TransferHistoryOper
 from app.log import logger
 from app.plugins import _PluginBase
 
+from .aio import StorageLimits
+from .scanner import (
+    FileFilter,
+    FileRecord,
+    scan_files,
+    scan_files_async,
+    valid_days_window,
+    valid_patterns,
+)
+from .historyindex import HistoryIndex
+from .lazy import LazyInstance, cached_form, lazy_import
+from .metrics import CONTENT_TYPE, PluginMetrics, render as render_metrics
+from .negcache import NegativeCache
+from .pipeline import STOP_TIMEOUT, Pipeline, Skip, sampled, wait_until
+from .profiling import TraceRecorder, profile_api, profiled, trace
+from .runlog import render_runs, save_run
+from .progress import LazyJoin
+
+scrape = lazy_import("app.api.endpoints.media.scrape")
+
 
 class UpdateScrape(_PluginBase):
     # 插件名称
@@ -24,7 +47,7 @@ class UpdateScrape(_PluginBase):
     # 插件图标
     plugin_icon = "scraper.png"
     # 插件版本
-    plugin_version = "0.0.1"
+    plugin_version = "0.1.5"
     # 插件作者
     plugin_author = "Akimio521"
     # 作者主页
@@ -37,28 +60,63 @@ class UpdateScrape(_PluginBase):
     user_level = 1
 
     # 私有属性
-    transferhis = TransferHistoryOper()
-    storagechain = StorageChain()
+    # 首次使用时才创建，加载插件时不初始化数据库与处理链
+    transferhis = LazyInstance("app.db.transferhistory_oper.TransferHistoryOper")
+    storagechain = LazyInstance("app.chain.storage.StorageChain")
 
     _scheduler: BackgroundScheduler | None = None
     _enabled: bool = False  # 运行状态
+    _running: bool = False  # 是否正在刮削
+    _profile: bool = False  # 性能分析（仅下次运行）
+    _profile_detail: bool = False  # 调用栈采样与内存快照
+    _tracer: TraceRecorder | None = None  # 性能分析中的运行的时间线
 
     _onlyonce: bool  # 立即运行
     _notify: bool  # 通知推送
 
     _days: int  # 重新刮削几天内入库的文件
+    _scan_workers: int  # 扫描线程数
+    _workers: int  # 刮削线程数
+    _async_io: bool  # 异步 I/O
+    _storage_limits: str  # 存储并发限制
+    _timeout: float  # 单项超时（秒）
+    _retries: int  # 失败重试次数
+    _history_index: bool  # 本地整理记录索引
+    _negative_ttl: float  # 跳过缓存有效期（天）
+    _include: str  # 包含规则
+    _exclude: str  # 排除规则
+    _exclude_dirs: str  # 排除目录
+    _min_size: float  # 最小文件大小（MB）
+    _mtime_window: str  # 修改时间范围（天）
     _target_type: str  # 媒体库类型
     _target_path: str  # 媒体库路径
 
-    _event = Event()  # 退出事件
+    _event = Event()  # 退出事件，每次运行开始时重新创建
 
     def init_plugin(self, config: Optional[Dict[str, Any]] = None) -> None:
         logger.warning(f"初始化插件：媒体库刮削更新({self.plugin_version})")
+        logger.debug(f"{self.plugin_name}：模块导入耗时 {IMPORT_SECONDS * 1000:.1f} ms")
+        PluginMetrics(self.__class__.__name__).imported(IMPORT_SECONDS)
         # 读取配置
         if config:
             self._onlyonce = config.get("onlyonce") or False
             self._notify = config.get("notify") or False
             self._days = int(config.get("days") or 7)
+            self._scan_workers = int(config.get("scan_workers") or 4)
+            self._workers = int(config.get("workers") or 1)
+            self._async_io = config.get("async_io") or False
+            self._storage_limits = config.get("storage_limits") or ""
+            self._timeout = float(config.get("timeout") or 0)
+            self._retries = int(config.get("retries") or 0)
+            self._history_index = config.get("history_index") or False
+            self._negative_ttl = float(config.get("negative_ttl") or 0)
+            self._profile = config.get("profile") or False
+            self._profile_detail = config.get("profile_detail") or False
+            self._include = valid_patterns(config.get("include") or "")
+            self._exclude = valid_patterns(config.get("exclude") or "")
+            self._exclude_dirs = config.get("exclude_dirs") or ""
+            self._min_size = float(config.get("min_size") or 0)
+            self._mtime_window = valid_days_window(config.get("mtime_window") or "")
             self._target_type = config.get("target_type") or StorageSchema.Local.value
             self._target_path = config.get("target_path") or ""
 
@@ -82,6 +140,21 @@ class UpdateScrape(_PluginBase):
                     "onlyonce": self._onlyonce,
                     "notify": self._notify,
                     "days": self._days,
+                    "scan_workers": self._scan_workers,
+                    "workers": self._workers,
+                    "async_io": self._async_io,
+                    "storage_limits": self._storage_limits,
+                    "timeout": self._timeout,
+                    "retries": self._retries,
+                    "history_index": self._history_index,
+                    "negative_ttl": self._negative_ttl,
+                    "profile": self._profile,
+                    "profile_detail": self._profile_detail,
+                    "include": self._include,
+                    "exclude": self._exclude,
+                    "exclude_dirs": self._exclude_dirs,
+                    "min_size": self._min_size,
+                    "mtime_window": self._mtime_window,
                     "target_type": self._target_type,
                     "target_path": self._target_path,
                 }
@@ -99,11 +172,29 @@ class UpdateScrape(_PluginBase):
         return []
 
     def get_api(self) -> List[Dict[str, Any]]:
-        return []
+        return [
+            {
+                "path": "/metrics",
+                "endpoint": self.export_metrics,
+                "methods": ["GET"],
+                "auth": "apikey",
+                "summary": "运行指标",
+                "description": "Prometheus 文本格式的运行指标",
+            },
+            *profile_api(self),
+        ]
+
+    @staticmethod
+    def export_metrics() -> PlainTextResponse:
+        """
+        导出运行指标，供 Prometheus 抓取
+        """
+        return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
 
     def get_service(self) -> List[Dict[str, Any]]:
         return []
 
+    @cached_form
     def get_form(self) -> Tuple[List[dict], Dict[str, Any]]:
         return [
             {
@@ -151,6 +242,41 @@ class UpdateScrape(_PluginBase):
                                     }
                                 ],
                             },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "scan_workers",
+                                            "label": "扫描线程数",
+                                            "rows": 1,
+                                            "placeholder": "并行扫描一级子目录，默认4",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "workers",
+                                            "label": "刮削线程数",
+                                            "rows": 1,
+                                            "placeholder": "同时刮削的文件数，默认1",
+                                        },
+                                    }
+                                ],
+                            },
                         ],
                     },
                     {
@@ -190,105 +316,439 @@ class UpdateScrape(_PluginBase):
                             },
                         ],
                     },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "include",
+                                            "label": "包含规则",
+                                            "rows": 2,
+                                            "placeholder": "每行一条，通配符匹配完整路径，以 re: 开头按正则匹配，留空则不限制",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "exclude",
+                                            "label": "排除规则",
+                                            "rows": 2,
+                                            "placeholder": "每行一条，如 *sample* 或 re:\\btrailer\\b",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 4},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "exclude_dirs",
+                                            "label": "排除目录",
+                                            "rows": 1,
+                                            "placeholder": "逗号分隔，如 Extras,Samples",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 4},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "min_size",
+                                            "label": "最小文件大小（MB）",
+                                            "rows": 1,
+                                            "placeholder": "0 为不限制",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 4},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "mtime_window",
+                                            "label": "修改时间范围（天）",
+                                            "rows": 1,
+                                            "placeholder": "如 0-30 为30天内修改，365- 为一年前修改",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 3},
+                                "content": [
+                                    {
+                                        "component": "VSwitch",
+                                        "props": {
+                                            "model": "async_io",
+                                            "label": "异步 I/O",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 9},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "storage_limits",
+                                            "label": "存储并发限制",
+                                            "rows": 1,
+                                            "placeholder": "异步 I/O 下各存储同时进行的请求数，如 u115:4,alipan:8，留空则按线程数",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 4},
+                                "content": [
+                                    {
+                                        "component": "VSwitch",
+                                        "props": {
+                                            "model": "history_index",
+                                            "label": "本地整理记录索引",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 4},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "timeout",
+                                            "label": "单项超时（秒）",
+                                            "rows": 1,
+                                            "placeholder": "单个文件超过该时间记为失败并继续，0 为不限制",
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 4},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "retries",
+                                            "label": "失败重试次数",
+                                            "rows": 1,
+                                            "placeholder": "失败或超时的文件在本次运行末尾重试，默认0",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VTextarea",
+                                        "props": {
+                                            "model": "negative_ttl",
+                                            "label": "跳过缓存有效期（天）",
+                                            "rows": 1,
+                                            "placeholder": "未找到整理记录、入库时间过早的文件在有效期内不再查询，文件或整理记录变化后失效，0 为不启用",
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
+                    {
+                        "component": "VRow",
+                        "content": [
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VSwitch",
+                                        "props": {
+                                            "model": "profile",
+                                            "label": "性能分析（仅下次运行）",
+                                            "hint": "记录各文件在扫描、查询、执行阶段的时间线，结果保存在插件数据目录",
+                                            "persistent-hint": True,
+                                        },
+                                    }
+                                ],
+                            },
+                            {
+                                "component": "VCol",
+                                "props": {"cols": 12, "md": 6},
+                                "content": [
+                                    {
+                                        "component": "VSwitch",
+                                        "props": {
+                                            "model": "profile_detail",
+                                            "label": "调用栈采样与内存快照",
+                                            "hint": "性能分析时同时采样调用栈并记录内存分配，开销较大",
+                                            "persistent-hint": True,
+                                        },
+                                    }
+                                ],
+                            },
+                        ],
+                    },
                 ],
             }
         ], {"enabled": False, "mode": "", "transfer_paths": "", "err_hosts": ""}
 
-    def get_page(self):
-        pass
+    def get_page(self) -> List[dict]:
+        return render_runs(self.get_data("runs") or [])
 
+    @profiled
     def __update_scrape(self) -> None:
         """
-        媒体库刮削更新
+        媒体库刮削更新，运行出错时同样关闭索引、保存缓存并重置运行状态
+        """
+        if self._running:
+            logger.warning(f"{self.plugin_name}：上一次运行尚未退出，本次不运行")
+            return
+        # 每次运行使用新的退出事件，停止时设置的事件一直保留，卡住的调用返回后仍会退出
+        self._event = Event()
+        self._running = True
+        try:
+            with ExitStack() as cleanup:
+                self.__run_update_scrape(cleanup)
+        finally:
+            self._running = False
+
+    def __run_update_scrape(self, cleanup: ExitStack) -> None:
+        """
+        媒体库刮削更新的运行过程
+        :param cleanup: 运行结束（包括出错）时执行的清理
         """
         self._enabled = True
         __c: Dict[str, str | bool] = {
             "通知推送": self._notify,
             "更新刮削几天内入库的文件": f"{self._days} 天",
             "媒体库": f"【{StorageSchema(self._target_type).name}】{self._target_path}",
+            "跳过缓存": f"{self._negative_ttl} 天" if self._negative_ttl > 0 else False,
         }
         logger.info(f"开始媒体库刮削更新，立即运行一次，配置：{__c}")
 
-        scrape_msgs: List[str] = []
-        skip_msgs: List[str] = []
-        start_time = time.time()
         date = datetime.now(tz=pytz.timezone(settings.TZ)) - timedelta(
             days=self._days
         )  # 在这之后的记录都需要重新刮削
-        for file in self.__list_files(self._target_type, self._target_path):
-            if self._event.is_set():
-                logger.info("媒体库刮削更新服务已停止！")
-                self._enabled = False
-                return
-
-            if not file.path:
-                logger.error(f"文件路径为空，跳过：{file}")
-                continue
+        file_filter = self.__file_filter()
+        with trace(self._tracer, "准备", "setup"):
+            history_index = self.__open_history_index()
+            if history_index:
+                cleanup.callback(history_index.close)
+            negative_cache = self.__open_negative_cache()
+            if negative_cache:
+                cleanup.callback(negative_cache.save)
 
-            history = self.transferhis.get_by_dest(dest=file.path)
-            if not history:
-                skip_msgs.append(
-                    f"【{StorageSchema(self._target_type).name}】{file.path}：未找到整理记录"
-                )
-                continue
-            if history.dest_storage != self._target_type:
-                skip_msgs.append(
-                    f"【{StorageSchema(self._target_type).name}】{file.path}：整理记录存储类型不匹配"
-                )
-                continue
-
-            logger.info(
-                f"找到整理记录：{history.dest_storage} {history.dest} | {history.date}({type(history.date)})"
-            )
+        def resolve(file: FileRecord) -> Tuple[FileRecord, str] | Skip:
+            return self.__resolve(file, date, history_index)
 
-            if history.date < date:
-                continue
-
-            logger.info(f"文件信息：{file}")
-            scrape(file, self._target_type)
-            scrape_msgs.append(
-                f"【{StorageSchema(self._target_type).name}】{file.path}（入库时间：{history.date}）：更新刮削完成"
-            )
+        if negative_cache:
+            resolve = negative_cache.resolver(resolve, lambda file: file)
+        stats = Pipeline(
+            name="媒体库刮削更新",
+            lister=lambda: self.__list_files(self._target_type, self._target_path),
+            file_filter=file_filter,
+            resolver=resolve,
+            action=self.__scrape,
+            label=lambda x: f"【{StorageSchema(self._target_type).name}】{(x[0] if isinstance(x, tuple) else x).path}",
+            workers=self._workers,
+            event=self._event,
+            async_io=self._async_io,
+            storage_of=lambda task: (task[0].storage,),
+            storage_limits=StorageLimits(self._storage_limits),
+            timeout=self._timeout,
+            retries=self._retries,
+            metrics=PluginMetrics(self.__class__.__name__),
+            tracer=self._tracer,
+        ).run()
+        save_run(self, stats, __c)
+        if stats.stopped:
+            logger.info("媒体库刮削更新服务已停止！")
+            self._enabled = False
+            return
+        scrape_msgs = sampled(stats.success_msgs, stats.success)
+        skip_msgs = sampled(stats.skipped_msgs, stats.skipped)
 
         msg: List[str] = [
-            f"成功整理 {len(scrape_msgs)} 条",
-            f"跳过整理 {len(skip_msgs)} 条",
-            f"总耗时 {((time.time() - start_time) / 60):.2f} 分钟",
-            "更新文件：",
-            *scrape_msgs,
+            f"成功整理 {stats.success} 条",
+            f"跳过整理 {stats.skipped} 条",
+            f"失败整理 {len(stats.failed_msgs)} 条（超时 {stats.timeouts} 条，重试 {stats.retried} 条）",
+            f"预筛选排除：{file_filter.summary}",
+            f"跳过缓存：{negative_cache.summary if negative_cache else '未启用'}",
+            f"总耗时 {(stats.duration / 60):.2f} 分钟",
         ]
         if self._notify:
             self.post_message(
                 mtype=NotificationType.Plugin,
                 title="【插件】媒体库刮削更新完成",
-                text="\n".join(msg),
+                text="\n".join([*msg, "更新文件：", *scrape_msgs]),
             )
-        msg.extend(
-            [
-                "跳过信息：",
-                *skip_msgs,
-            ]
-        )
         logger.info(f"媒体库刮削更新完成，{'；'.join(msg)}。")
+        # 明细仅在 DEBUG 级别输出
+        logger.debug("更新文件：\n%s", LazyJoin("\n", scrape_msgs))
+        logger.debug("跳过信息：\n%s", LazyJoin("\n", skip_msgs))
+
+    def __open_history_index(self) -> Optional[HistoryIndex]:
+        """
+        打开并同步本地整理记录索引，失败时回退到直接查询整理记录
+        """
+        if not self._history_index:
+            return None
+        index = HistoryIndex(self.get_data_path() / "history.db")
+        try:
+            index.refresh()
+            return index
+        except Exception as e:
+            logger.error(f"整理记录索引同步失败，本次直接查询整理记录：{e}")
+            index.close()
+            return None
+
+    def __open_negative_cache(self) -> Optional[NegativeCache]:
+        """
+        打开跳过缓存并移除失效条目，检查整理记录失败时本次不使用
+        """
+        if self._negative_ttl <= 0:
+            return None
+        cache = NegativeCache(
+            self.get_data_path() / "negative.cache",
+            ttl=self._negative_ttl * 86400,
+            reasons=("未找到整理记录", "整理记录存储类型不匹配", "入库时间过早"),
+            fingerprint=f"{self._target_type}:{self._target_path}|{self._days}",
+        )
+        try:
+            cache.refresh()
+            return cache
+        except Exception as e:
+            logger.error(f"跳过缓存检查整理记录失败，本次不使用：{e}")
+            return None
+
+    def __file_filter(self) -> FileFilter:
+        """
+        编译本次运行的文件预筛选规则
+        """
+        return FileFilter(
+            extensions=settings.RMT_MEDIAEXT,
+            include=self._include,
+            exclude=self._exclude,
+            exclude_dirs=self._exclude_dirs,
+            min_size=int(self._min_size * 1024**2),
+            mtime_window=self._mtime_window,
+        )
 
     def __list_files(
         self,
         storage_type: str,
         starge_path: str,
-    ) -> Generator[FileItem]:
+    ) -> Generator[FileRecord, None, None]:
         file = FileItem(storage=storage_type, path=starge_path)
-        files = self.storagechain.list_files(file, True)
-        if files is None or len(files) == 0:
+        files = self.__scan(file)
+        empty = True
+        for f in files:
+            empty = False
+            yield f
+        if empty:
             logger.error(f"未找到文件：【{storage_type}】{starge_path}")
-            return
+
+    def __scan(self, fileitem: FileItem) -> Iterable[FileRecord]:
+        """
+        扫描媒体库，异步 I/O 下在事件循环中逐级并发列目录
+        """
+        if self._async_io:
+            concurrency = StorageLimits(self._storage_limits).get(
+                fileitem.storage, self._scan_workers
+            )
+            return scan_files_async(
+                self.storagechain, fileitem, concurrency, self._event
+            )
+        return scan_files(self.storagechain, fileitem, self._scan_workers, self._event)
+
+    def __resolve(
+        self,
+        file: FileRecord,
+        date: datetime,
+        history_index: Optional[HistoryIndex] = None,
+    ) -> Tuple[FileRecord, str] | Skip:
+        """
+        查询媒体文件的整理记录，只更新指定时间之后入库的文件
+        :param history_index: 本地整理记录索引，为空时直接查询整理记录
+        """
+        if history_index:
+            history = history_index.get("dest", file.path)
         else:
-            for f in files:
-                if (
-                    f.type == "file"
-                    and f.extension
-                    and f".{f.extension.lower()}" in settings.RMT_MEDIAEXT
-                ):
-                    yield f
+            history = self.transferhis.get_by_dest(dest=file.path)
+        if not history:
+            return Skip("未找到整理记录")
+        if history.dest_storage != self._target_type:
+            return Skip("整理记录存储类型不匹配")
+
+        logger.debug(
+            "找到整理记录：%s %s | %s",
+            history.dest_storage,
+            history.dest,
+            history.date,
+        )
+
+        # 整理记录中的时间为字符串
+        if str(history.date) < date.strftime("%Y-%m-%d %H:%M:%S"):
+            return Skip("入库时间过早", record=False)
+        return file, history.date
+
+    def __scrape(self, task: Tuple[FileRecord, str]) -> Tuple[bool, str]:
+        file, history_date = task
+        logger.debug("文件信息：%s", file)
+        scrape(file.to_fileitem(), self._target_type)
+        return (
+            True,
+            f"【{StorageSchema(self._target_type).name}】{file.path}（入库时间：{history_date}）：更新刮削完成",
+        )
 
     def stop_service(self):
         """
@@ -299,9 +759,16 @@ class UpdateScrape(_PluginBase):
             if self._scheduler:
                 self._scheduler.remove_all_jobs()
                 if self._scheduler.running:
-                    self._event.set()
-                    self._scheduler.shutdown()
-                    self._event.clear()
+                    self._scheduler.shutdown(wait=False)
                 self._scheduler = None
+            if self._running:
+                # 通知运行中的任务退出，卡住的调用不再等待
+                self._event.set()
+                if not wait_until(lambda: not self._running, STOP_TIMEOUT + 5):
+                    logger.warning(f"{self.plugin_name}：运行中的任务未能及时退出")
         except Exception as e:
             print(str(e))
+
+
+# 插件模块（含依赖的辅助模块）的导入耗时（秒）
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
@@ -0,0 +1,223 @@
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Collection, Dict, Optional, Set, Tuple
+import pickle
+import time
+
+from app.log import logger
+
+from .pipeline import Skip
+
+# 执行失败时使用的跳过原因
+FAILED = "已知失败"
+
+
+def history_changes(after_id: int) -> Tuple[int, Set[str], Set[str]]:
+    """
+    查询整理记录表当前的最大 ID，以及 after_id 之后新增记录涉及的路径
+    :return: (最大 ID, 整理成功记录的源/目标路径, 整理失败记录的源路径)
+    """
+    from sqlalchemy import func  # type: ignore
+
+    from app.db import SessionFactory
+    from app.db.models.transferhistory import TransferHistory
+
+    db = SessionFactory()
+    try:
+        last_id = db.query(func.max(TransferHistory.id)).scalar() or 0
+        paths: Set[str] = set()
+        failed: Set[str] = set()
+        if after_id and last_id > after_id:
+            for src, dest, status in db.query(
+                TransferHistory.src, TransferHistory.dest, TransferHistory.status
+            ).filter(TransferHistory.id > after_id):
+                if status:
+                    paths.update(p for p in (src, dest) if p)
+                elif src:
+                    failed.add(src)
+        return last_id, paths, failed
+    finally:
+        db.close()
+
+
+class NegativeCache:
+    """
+    查询或执行结果为跳过/失败的文件的磁盘缓存，有效期内再次遇到时直接跳过
+    键为 (存储, 路径)，文件大小或修改时间变化、路径有新的整理记录、插件配置变化后失效
+    重新整理失败时主程序会为源文件写入失败记录，新的失败记录不会让已知失败的条目失效
+    """
+
+    def __init__(
+        self, path: Path, ttl: float, reasons: Collection[str], fingerprint: str
+    ):
+        """
+        :param path: 缓存文件路径
+        :param ttl: 有效期（秒）
+        :param reasons: 可以缓存的跳过原因，其余原因（如与目标状态有关的）不缓存
+        :param fingerprint: 影响跳过结果的配置，变化后清空缓存
+        """
+        self.path = path
+        self.ttl = ttl
+        self.reasons = set(reasons)
+        self.fingerprint = fingerprint
+        self.hits: int = 0
+        self.added: int = 0
+        self.invalidated: int = 0  # 因文件或整理记录变化失效的条目数
+        # (存储, 路径) → (大小, 修改时间, 原因, 详情, 是否记录, 过期时间)
+        self._entries: Dict[Tuple[str, str], Tuple] = {}
+        self._last_id: int = 0  # 已检查到的整理记录 ID
+        self._lock = Lock()
+        self._dirty = False
+        self.__load()
+
+    def __load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            with self.path.open("rb") as f:
+                data = pickle.load(f)
+        except Exception as e:
+            logger.warning(f"读取跳过缓存失败，将重新建立：{e}")
+            return
+        if data.get("fingerprint") != self.fingerprint:
+            logger.info("插件配置已变化，清空跳过缓存")
+            self._dirty = True
+            return
+        self._entries = data.get("entries") or {}
+        self._last_id = data.get("last_id") or 0
+
+    def refresh(self) -> None:
+        """
+        移除过期条目，以及上次运行后有新整理记录的路径
+        只有新增失败记录的路径，已知失败的条目仍然有效，其余原因的条目失效
+        """
+        last_id, paths, failed = history_changes(self._last_id)
+        now = time.time()
+        with self._lock:
+            if last_id < self._last_id:
+                # 整理记录表被清空或重建
+                paths = {path for _, path in self._entries}
+
+            def changed(key: Tuple[str, str], entry: Tuple) -> bool:
+                return key[1] in paths or (key[1] in failed and entry[2] != FAILED)
+
+            stale = [
+                key
+                for key, entry in self._entries.items()
+                if entry[5] <= now or changed(key, entry)
+            ]
+            self.invalidated += len(
+                [key for key in stale if changed(key, self._entries[key])]
+            )
+            for key in stale:
+                del self._entries[key]
+            self._dirty = self._dirty or bool(stale) or last_id != self._last_id
+            self._last_id = last_id
+
+    @staticmethod
+    def __stat(file: Any) -> Tuple[int, float]:
+        return file.size or 0, file.modify_time or 0
+
+    def check(self, file: Any) -> Optional[Skip]:
+        """
+        文件在缓存中且未变化时返回缓存的跳过结果
+        """
+        key = (file.storage, file.path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if not entry:
+                return None
+            if entry[:2] != self.__stat(file) or entry[5] <= time.time():
+                del self._entries[key]
+                self.invalidated += 1
+                self._dirty = True
+                return None
+            self.hits += 1
+        _, _, reason, detail, record, _ = entry
+        return Skip(reason, f"{detail or reason}（跳过缓存）", record)
+
+    def add(
+        self, file: Any, reason: str, detail: str = "", record: bool = True
+    ) -> None:
+        with self._lock:
+            self._entries[(file.storage, file.path)] = (
+                *self.__stat(file),
+                reason,
+                detail,
+                record,
+                time.time() + self.ttl,
+            )
+            self.added += 1
+            self._dirty = True
+
+    def discard(self, file: Any) -> None:
+        with self._lock:
+            if self._entries.pop((file.storage, file.path), None):
+                self._dirty = True
+
+    def resolver(
+        self, resolve: Callable[[Any], Any], file_of: Callable[[Any], Any]
+    ) -> Callable[[Any], Any]:
+        """
+        包装查询阶段：先查缓存，可缓存的跳过结果写入缓存
+        """
+
+        def wrapper(item: Any) -> Any:
+            file = file_of(item)
+            cached = self.check(file)
+            if cached:
+                return cached
+            result = resolve(item)
+            if isinstance(result, Skip) and result.reason in self.reasons:
+                self.add(file, result.reason, result.detail, result.record)
+            return result
+
+        return wrapper
+
+    def action(
+        self,
+        act: Callable[[Any], Tuple[bool, str]],
+        file_of: Callable[[Any], Any],
+    ) -> Callable[[Any], Tuple[bool, str]]:
+        """
+        包装执行阶段：返回失败的文件写入缓存，重试成功后移除，抛出异常的不缓存
+        """
+
+        def wrapper(task: Any) -> Tuple[bool, str]:
+            success, message = act(task)
+            if success:
+                self.discard(file_of(task))
+            else:
+                self.add(file_of(task), FAILED, message)
+            return success, message
+
+        return wrapper
+
+    def save(self) -> None:
+        """
+        写回磁盘，先写临时文件再替换
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            data = pickle.dumps(
+                {
+                    "fingerprint": self.fingerprint,
+                    "last_id": self._last_id,
+                    "entries": self._entries,
+                }
+            )
+            self._dirty = False
+        tmp = self.path.with_suffix(".tmp")
+        try:
+            tmp.write_bytes(data)
+            tmp.replace(self.path)
+        except Exception as e:
+            logger.error(f"保存跳过缓存失败：{e}")
+
+    @property
+    def summary(self) -> str:
+        return (
+            f"命中 {self.hits} 次，新增 {self.added} 条，失效 {self.invalidated} 条，"
+            f"共 {len(self._entries)} 条"
+        )
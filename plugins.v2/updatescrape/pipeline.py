@@ -0,0 +1,809 @@
+from contextlib import AsyncExitStack, nullcontext
+from queue import Empty, Full, Queue
+from threading import BoundedSemaphore, Condition, Event, Lock, Thread
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    ContextManager,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+import asyncio
+import inspect
+import time
+
+from app.log import logger
+
+from .aio import DaemonExecutor, StorageLimits, StorageSemaphores, call
+from .metrics import PluginMetrics
+from .progress import ProgressLogger
+
+if TYPE_CHECKING:
+    from .profiling import TraceRecorder
+
+# 时间线中只记录耗时超过该值的单次扫描（秒），避免逐个文件记录
+SLOW_LIST = 0.01
+
+# 运行统计中保留的成功、跳过明细条数，其余只计数
+MAX_SAMPLES = 100
+
+
+class Skip:
+    """
+    查询阶段的跳过结果
+    """
+
+    __slots__ = ("reason", "detail", "record")
+
+    def __init__(self, reason: str, detail: str = "", record: bool = True):
+        self.reason = reason  # 跳过原因，用于分类计数
+        self.detail = detail  # 跳过详情，为空时使用原因
+        self.record = record  # 是否记录到跳过信息中
+
+
+class RunStats:
+    """
+    单次运行的统计信息
+    """
+
+    def __init__(self):
+        self.started: float = time.time()
+        self.finished: float = 0.0
+        self.listed: int = 0  # 扫描到的文件数
+        self.filtered: int = 0  # 预筛选通过的文件数
+        self.planned: Optional[int] = None  # 已编排的任务数，未编排时为 None
+        self.dispatched: int = 0  # 已提交执行的任务数
+        self.success: int = 0
+        self.success_msgs: List[str] = []  # 成功明细，只保留前 MAX_SAMPLES 条
+        self.failed_msgs: List[str] = []  # 重试后仍失败的任务
+        self.timeouts: int = 0  # 执行超时的次数
+        self.verify_failed: int = 0  # 校验未通过的次数
+        self.retried: int = 0  # 重试的任务数
+        self.skipped: int = 0  # 需要记录的跳过数
+        self.skipped_msgs: List[str] = []  # 跳过明细，只保留前 MAX_SAMPLES 条
+        self.skip_reasons: Dict[str, int] = {}
+        self.phases: Dict[str, float] = {}  # 各阶段耗时（秒）
+        self.stopped: bool = False  # 收到退出事件
+        self.sliced: bool = False  # 达到单次运行上限
+        self.last_done: Any = None  # 按提交顺序连续完成的最后一个任务
+
+    @property
+    def duration(self) -> float:
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def remaining(self) -> Optional[int]:
+        if self.planned is None:
+            return None
+        return self.planned - self.dispatched
+
+    def merge(self, other: "RunStats") -> None:
+        """
+        合并同一次运行中另一段处理（如下一个分片）的统计
+        """
+        self.started = min(self.started, other.started)
+        self.finished = max(self.finished, other.finished)
+        for name in (
+            "listed",
+            "filtered",
+            "dispatched",
+            "success",
+            "timeouts",
+            "verify_failed",
+            "retried",
+            "skipped",
+        ):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        if other.planned is not None:
+            self.planned = (self.planned or 0) + other.planned
+        for msgs, more in (
+            (self.success_msgs, other.success_msgs),
+            (self.skipped_msgs, other.skipped_msgs),
+        ):
+            msgs.extend(more[: max(MAX_SAMPLES - len(msgs), 0)])
+        self.failed_msgs.extend(other.failed_msgs)
+        for reason, count in other.skip_reasons.items():
+            self.skip_reasons[reason] = self.skip_reasons.get(reason, 0) + count
+        for phase, seconds in other.phases.items():
+            self.phases[phase] = self.phases.get(phase, 0) + seconds
+        self.stopped = self.stopped or other.stopped
+        self.sliced = self.sliced or other.sliced
+        self.last_done = other.last_done
+
+
+def sampled(msgs: List[str], total: int) -> List[str]:
+    """
+    明细列表，只保留了部分明细时在末尾注明未列出的条数
+    """
+    if total > len(msgs):
+        return [*msgs, f"……另有 {total - len(msgs)} 条未列出"]
+    return msgs
+
+
+# 收到退出事件后等待执行中任务的最长时间（秒）
+STOP_TIMEOUT = 10
+
+_DONE = object()
+
+
+class _Job:
+    """
+    单次执行，失败重试时同一任务会产生多次执行
+    """
+
+    __slots__ = (
+        "seq",
+        "task",
+        "attempt",
+        "started",
+        "deadline",
+        "slots",
+        "running",
+        "settled",
+    )
+
+    def __init__(self, seq: int, task: Any, attempt: int, timeout: float, slots: Any):
+        self.seq = seq  # 首次提交的序号
+        self.task = task
+        self.attempt = attempt  # 0 为首次执行
+        self.started = time.time()
+        self.deadline = self.started + timeout if timeout else 0.0
+        self.slots = slots  # 占用的执行位置
+        self.running = True  # 底层调用是否仍在执行
+        self.settled = False  # 结果是否已汇总
+
+
+def wait_until(predicate: Callable[[], bool], timeout: float) -> bool:
+    """
+    等待条件成立，超时返回 False
+    """
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() >= deadline:
+            return False
+        time.sleep(0.2)
+    return True
+
+
+class Pipeline:
+    """
+    扫描 → 筛选 → 查询整理记录 → 编排 → 执行 → 汇总 的通用处理流程
+    扫描线程、查询线程（筛选、查询、编排）与执行线程池同时运行，阶段间通过有界队列连接
+    下游处理不过来时上游暂停，内存占用受队列长度限制
+    """
+
+    def __init__(
+        self,
+        name: str,
+        lister: Callable[[], Iterable[Any]],
+        resolver: Callable[[Any], Any],
+        action: Callable[[Any], Tuple[bool, str]],
+        label: Callable[[Any], str] = str,
+        file_filter: Optional[Callable[[Any], bool]] = None,
+        planner: Optional[Callable[[List[Any]], List[Any]]] = None,
+        plan_window: int = 0,
+        workers: int = 1,
+        queue_size: int = 100,
+        max_seconds: float = 0,
+        max_items: int = 0,
+        event: Optional[Event] = None,
+        async_io: bool = False,
+        storage_of: Optional[Callable[[Any], Iterable[str]]] = None,
+        storage_limits: Optional[StorageLimits] = None,
+        timeout: float = 0,
+        retries: int = 0,
+        stop_timeout: float = STOP_TIMEOUT,
+        metrics: Optional[PluginMetrics] = None,
+        verifier: Optional[Callable[[Any], Tuple[bool, str]]] = None,
+        tracer: Optional["TraceRecorder"] = None,
+    ):
+        """
+        :param lister: 扫描阶段，返回待处理的文件
+        :param resolver: 查询阶段，返回待执行的任务或 Skip
+        :param action: 执行阶段，返回 (是否成功, 信息)
+        :param label: 生成文件/任务在信息中的显示名称
+        :param file_filter: 预筛选阶段，返回 False 的文件直接丢弃
+        :param planner: 编排阶段，收集任务后重新排序
+        :param plan_window: 每收集到多少个任务编排一次并开始执行，0 为等待扫描完成后整体编排
+        :param workers: 执行线程数
+        :param queue_size: 阶段间队列长度
+        :param max_seconds: 单次运行最长时间，0 为不限制
+        :param max_items: 单次运行最多执行的任务数，0 为不限制
+        :param event: 退出事件
+        :param async_io: 执行阶段使用事件循环调度，同步的 action 回退到线程池执行
+        :param storage_of: 返回任务涉及的存储类型，用于按存储限制并发（仅异步模式生效），第一个存储作为指标的 storage 标签
+        :param storage_limits: 各存储的并发数限制，仅异步模式生效
+        :param timeout: 单个任务的执行超时（秒），超时记为失败并不再等待，0 为不限制
+        :param retries: 失败任务（包括超时）在本次运行末尾的重试次数
+        :param stop_timeout: 收到退出事件后等待执行中任务的最长时间（秒）
+        :param metrics: 运行指标记录
+        :param verifier: 校验阶段，执行成功后让出执行位置再校验，返回 (是否通过, 信息)，未通过记为失败
+        :param tracer: 性能分析的时间线，记录每个文件/任务在各阶段的耗时
+        """
+        self.name = name
+        self.lister = lister
+        self.resolver = resolver
+        self.action = action
+        self.label = label
+        self.file_filter = file_filter
+        self.planner = planner
+        self.plan_window = max(plan_window, 0)
+        self.workers = max(workers, 1)
+        self.queue_size = max(queue_size, 1)
+        self.max_seconds = max_seconds
+        self.max_items = max_items
+        self.event = event or Event()
+        self.async_io = async_io
+        self.storage_of = storage_of
+        self.storage_limits = storage_limits or StorageLimits()
+        self.timeout = timeout
+        self.retries = retries
+        self.stop_timeout = stop_timeout
+        self.metrics = metrics
+        self.verifier = verifier
+        self.tracer = tracer
+
+        self.stats = RunStats()
+        self.progress = ProgressLogger(name)
+        self._halt = Event()  # 停止生产
+        self._watch_stop = Event()  # 停止看门狗
+        self._lock = Lock()
+        self._cond = Condition(self._lock)
+        self._jobs: Set[_Job] = set()  # 线程模式下执行中的任务
+        self._verify_slots = BoundedSemaphore(
+            self.workers
+        )  # 线程模式下同时校验的任务数
+        self._failed: Dict[int, Tuple[_Job, str]] = {}
+        self._inflight: Dict[int, Any] = {}
+        self._finished: set = set()
+        self._next_done: int = 0
+
+    def run(self) -> RunStats:
+        """
+        执行完整流程，阻塞直到所有已提交任务完成、超时或收到退出事件后超过 stop_timeout
+        """
+        listed: Queue = Queue(maxsize=self.queue_size)
+        queue: Queue = Queue(maxsize=self.queue_size)
+        stages = [
+            Thread(
+                target=self.__list,
+                args=(listed,),
+                name=f"{self.name}-lister",
+                daemon=True,
+            ),
+            Thread(
+                target=self.__produce,
+                args=(listed, queue),
+                name=f"{self.name}-producer",
+                daemon=True,
+            ),
+        ]
+        for stage in stages:
+            stage.start()
+        if self.timeout and not self.async_io:
+            Thread(
+                target=self.__watchdog, name=f"{self.name}-watchdog", daemon=True
+            ).start()
+        try:
+            start = time.time()
+            self.__execute_all(self.__take(queue), 0)
+            self.stats.phases["执行"] = time.time() - start
+            for attempt in range(1, self.retries + 1):
+                if self.stats.stopped or self.event.is_set():
+                    break
+                tasks = self.__retry_tasks()
+                if not tasks:
+                    break
+                logger.info(f"{self.name}：第 {attempt} 次重试 {len(tasks)} 条失败任务")
+                self.stats.retried += len(tasks)
+                start = time.time()
+                self.__execute_all(tasks, attempt)
+                self.stats.phases["重试"] = (
+                    self.stats.phases.get("重试", 0) + time.time() - start
+                )
+        finally:
+            self._halt.set()
+            self._watch_stop.set()
+            # 扫描卡住时不再等待扫描、查询线程
+            deadline = time.time() + self.stop_timeout
+            for stage in stages:
+                stage.join(max(deadline - time.time(), 0))
+            with self._lock:
+                self.stats.failed_msgs = [
+                    f"{self.label(job.task)}：{message}"
+                    for _, (job, message) in sorted(self._failed.items())
+                ]
+            self.stats.finished = time.time()
+            self.progress.flush()
+            if self.metrics:
+                self.metrics.run_finished(
+                    (
+                        "stopped"
+                        if self.stats.stopped
+                        else "sliced" if self.stats.sliced else "completed"
+                    ),
+                    self.stats.phases,
+                    self.stats.dispatched / self.stats.duration,
+                )
+        return self.stats
+
+    def __put(self, queue: Queue, item: Any) -> bool:
+        while not self._halt.is_set():
+            try:
+                queue.put(item, timeout=0.5)
+                return True
+            except Full:
+                continue
+        return False
+
+    def __get(self, queue: Queue) -> Any:
+        while not self._halt.is_set():
+            try:
+                return queue.get(timeout=0.5)
+            except Empty:
+                continue
+        return _DONE
+
+    def __list(self, listed: Queue) -> None:
+        """
+        扫描线程：列出文件交给查询线程
+        """
+        start = time.time()
+        try:
+            items = iter(self.lister())
+            while True:
+                with self.__span("扫描", "list", min_seconds=SLOW_LIST):
+                    item = next(items, _DONE)
+                if item is _DONE:
+                    break
+                if self._halt.is_set() or self.event.is_set():
+                    return
+                self.stats.listed += 1
+                if not self.__put(listed, item):
+                    return
+        except Exception as e:
+            logger.error(f"{self.name}：扫描出错：{e}")
+        finally:
+            self.stats.phases["扫描"] = time.time() - start
+            self.__put(listed, _DONE)
+
+    def __produce(self, listed: Queue, queue: Queue) -> None:
+        """
+        查询线程：筛选、查询整理记录、编排
+        """
+        start = time.time()
+        tasks: List[Any] = []
+        try:
+            while True:
+                item = self.__get(listed)
+                if item is _DONE:
+                    break
+                if self.event.is_set():
+                    return
+                if self.file_filter and not self.file_filter(item):
+                    continue
+                self.stats.filtered += 1
+                with self.__span("查询", "resolve", item):
+                    task = self.__resolve(item)
+                if task is None:
+                    continue
+                if not self.planner:
+                    if not self.__put(queue, task):
+                        return
+                    continue
+                tasks.append(task)
+                if self.plan_window and len(tasks) >= self.plan_window:
+                    if not self.__submit(queue, tasks):
+                        return
+                    tasks = []
+            if self._halt.is_set():
+                return
+            self.stats.phases["扫描查询"] = time.time() - start
+            if self.planner and (tasks or not self.plan_window):
+                self.__submit(queue, tasks)
+        except Exception as e:
+            logger.error(f"{self.name}：扫描查询出错：{e}")
+        finally:
+            self.stats.phases.setdefault("扫描查询", time.time() - start)
+            self.__put(queue, _DONE)
+
+    def __submit(self, queue: Queue, tasks: List[Any]) -> bool:
+        """
+        编排一批任务并交给执行线程池
+        """
+        with self.__span("编排", "plan", count=len(tasks)):
+            tasks = self.planner(tasks)
+        self.stats.planned = (self.stats.planned or 0) + len(tasks)
+        for task in tasks:
+            if not self.__put(queue, task):
+                return False
+        return True
+
+    def __span(
+        self, name: str, cat: str, item: Any = None, **args: Any
+    ) -> ContextManager[None]:
+        """
+        性能分析时记录一段耗时，未开启时不做任何事
+        """
+        if not self.tracer:
+            return nullcontext()
+        if item is not None:
+            args["item"] = self.label(item)
+        return self.tracer.span(name, cat, **args)
+
+    def __resolve(self, item: Any) -> Any:
+        try:
+            result = self.resolver(item)
+        except Exception as e:
+            result = Skip("查询出错", str(e))
+        if isinstance(result, Skip):
+            with self._lock:
+                self.stats.skip_reasons[result.reason] = (
+                    self.stats.skip_reasons.get(result.reason, 0) + 1
+                )
+                if result.record:
+                    self.stats.skipped += 1
+                    if len(self.stats.skipped_msgs) < MAX_SAMPLES:
+                        self.stats.skipped_msgs.append(
+                            f"{self.label(item)}：{result.detail or result.reason}"
+                        )
+                self.progress.count(result.reason)
+            if self.metrics:
+                self.metrics.skipped(result.reason)
+            return None
+        return result
+
+    def __exhausted(self) -> bool:
+        if self.max_seconds and time.time() - self.stats.started >= self.max_seconds:
+            return True
+        return bool(self.max_items and self.stats.dispatched >= self.max_items)
+
+    def __take(self, queue: Queue) -> Iterator[Tuple[int, Any]]:
+        """
+        从队列中取出任务并分配提交序号，收到退出事件或达到单次运行上限时停止
+        """
+        while True:
+            try:
+                task = queue.get(timeout=0.5)
+            except Empty:
+                if self.event.is_set():
+                    self.stats.stopped = True
+                    return
+                continue
+            if task is _DONE:
+                return
+            if self.event.is_set():
+                self.stats.stopped = True
+                return
+            if self.__exhausted():
+                self.stats.sliced = True
+                return
+            seq = self.stats.dispatched
+            self.stats.dispatched += 1
+            with self._lock:
+                self._inflight[seq] = task
+            yield seq, task
+
+    def __execute_all(self, tasks: Iterable[Tuple[int, Any]], attempt: int) -> None:
+        if self.async_io:
+            asyncio.run(self.__dispatch_async(tasks, attempt))
+        else:
+            self.__dispatch(tasks, attempt)
+
+    def __retry_tasks(self) -> List[Tuple[int, Any]]:
+        """
+        需要重试的失败任务，超时后仍在执行的调用不重试，避免同一任务同时执行两次
+        """
+        with self._lock:
+            return [
+                (seq, job.task)
+                for seq, (job, _) in sorted(self._failed.items())
+                if not job.running
+            ]
+
+    def __storage(self, task: Any) -> str:
+        storages = self.storage_of(task) if self.storage_of else ()
+        return next(iter(storages), "")
+
+    def __call(self, job: _Job) -> Tuple[bool, str]:
+        storage = self.__storage(job.task)
+        if self.metrics:
+            self.metrics.call_started(storage)
+        try:
+            with self.__span("执行", "action", job.task, attempt=job.attempt):
+                return self.action(job.task)
+        finally:
+            job.running = False
+            if self.metrics:
+                self.metrics.call_finished(storage)
+
+    async def __call_async(self, job: _Job) -> Tuple[bool, str]:
+        storage = self.__storage(job.task)
+        if self.metrics:
+            self.metrics.call_started(storage)
+        start = time.perf_counter()
+        try:
+            return await self.action(job.task)
+        finally:
+            job.running = False
+            if self.tracer:
+                self.tracer.async_span(
+                    "执行",
+                    "action",
+                    (job.seq, job.attempt),
+                    start,
+                    item=self.label(job.task),
+                    attempt=job.attempt,
+                )
+            if self.metrics:
+                self.metrics.call_finished(storage)
+
+    def __settle(
+        self, job: _Job, success: bool, message: str, reason: str = "error"
+    ) -> bool:
+        """
+        汇总单个任务的执行结果，每个任务只汇总一次，超时后返回的结果直接丢弃
+        :param reason: 失败原因：timeout 超时，error 返回失败，exception 抛出异常，verify 校验未通过
+        """
+        timed_out = reason == "timeout"
+        with self._cond:
+            if job.settled:
+                return False
+            job.settled = True
+            self._jobs.discard(job)
+            self._cond.notify_all()
+            if success:
+                self.stats.success += 1
+                if message and len(self.stats.success_msgs) < MAX_SAMPLES:
+                    self.stats.success_msgs.append(message)
+                self._failed.pop(job.seq, None)
+                self.progress.count("成功")
+            else:
+                self._failed[job.seq] = (job, message)
+                if timed_out:
+                    self.stats.timeouts += 1
+                elif reason == "verify":
+                    self.stats.verify_failed += 1
+                self.progress.count(
+                    "超时"
+                    if timed_out
+                    else "校验失败" if reason == "verify" else "失败"
+                )
+            if job.attempt == 0:
+                # 推进按提交顺序连续完成的位置
+                self._finished.add(job.seq)
+                while self._next_done in self._finished:
+                    self._finished.remove(self._next_done)
+                    self.stats.last_done = self._inflight.pop(self._next_done)
+                    self._next_done += 1
+        if self.metrics:
+            self.metrics.settled(
+                self.__storage(job.task), success, reason, time.time() - job.started
+            )
+        return True
+
+    def __dispatch(self, tasks: Iterable[Tuple[int, Any]], attempt: int) -> None:
+        """
+        每个任务在独立的守护线程中执行，同时执行的任务数不超过线程数
+        超时的任务由看门狗直接记为失败并让出位置，卡住的调用不再等待
+        """
+        slots = BoundedSemaphore(self.workers)
+        for seq, task in tasks:
+            if not self.__acquire(slots):
+                self.__abort(attempt)
+                break
+            job = _Job(seq, task, attempt, self.timeout, slots)
+            with self._lock:
+                self._jobs.add(job)
+            Thread(
+                target=self.__run_job,
+                args=(job,),
+                name=f"{self.name}-{seq}",
+                daemon=True,
+            ).start()
+        self._halt.set()
+        self.__drain()
+
+    def __acquire(self, slots: BoundedSemaphore) -> bool:
+        """
+        等待空闲的执行位置，收到退出事件时返回 False
+        """
+        while not slots.acquire(timeout=0.5):
+            if self.event.is_set():
+                return False
+        if self.event.is_set():
+            # 停止时卡住的任务让出了位置，取得位置后不再开始新的任务
+            slots.release()
+            return False
+        return True
+
+    def __abort(self, attempt: int) -> None:
+        """
+        等待执行位置时收到退出事件，刚取出的任务不再执行
+        """
+        self.stats.stopped = True
+        if attempt == 0:
+            self.stats.dispatched -= 1
+
+    def __run_job(self, job: _Job) -> None:
+        reason = "error"
+        try:
+            success, message = self.__call(job)
+        except Exception as e:
+            success, message, reason = False, str(e), "exception"
+        if success and self.verifier and not job.settled:
+            success, message, reason = self.__verify(job, message)
+        if self.__settle(job, success, message, reason):
+            self.__release(job)
+
+    def __release(self, job: _Job) -> None:
+        """
+        让出任务占用的执行位置，每个任务只让出一次
+        """
+        with self._lock:
+            slots, job.slots = job.slots, None
+        if slots:
+            slots.release()
+
+    def __verify(self, job: _Job, message: str) -> Tuple[bool, str, str]:
+        """
+        执行成功后先让出执行位置再校验，校验与后续任务的执行并行，单项超时重新计时
+        """
+        self.__release(job)
+        if not self.__acquire(self._verify_slots):
+            return False, "收到退出事件，未校验", "verify"
+        try:
+            job.deadline = time.time() + self.timeout if self.timeout else 0.0
+            passed, detail = self.__check(job.task)
+        except Exception as e:
+            passed, detail = False, f"校验出错：{e}"
+        finally:
+            self._verify_slots.release()
+        if passed:
+            return True, message, "error"
+        return False, detail, "verify"
+
+    def __check(self, task: Any) -> Tuple[bool, str]:
+        with self.__span("校验", "verify", task):
+            return self.verifier(task)
+
+    def __watchdog(self) -> None:
+        """
+        看门狗线程：将超过单项超时的任务记为失败，并释放其占用的执行位置
+        """
+        while not self._watch_stop.wait(0.5):
+            now = time.time()
+            with self._lock:
+                expired = [j for j in self._jobs if j.deadline and now > j.deadline]
+            for job in expired:
+                if self.__settle(
+                    job, False, f"执行超时（{self.timeout:g} 秒）", "timeout"
+                ):
+                    logger.warning(f"{self.name}：{self.label(job.task)} 执行超时")
+                    self.__release(job)
+
+    def __drain(self) -> None:
+        """
+        等待已提交的任务完成，收到退出事件后最多再等待 stop_timeout 秒
+        """
+        deadline = 0.0
+        with self._cond:
+            while self._jobs:
+                if self.event.is_set():
+                    self.stats.stopped = True
+                    deadline = deadline or time.time() + self.stop_timeout
+                    if time.time() >= deadline:
+                        logger.warning(
+                            f"{self.name}：仍有 {len(self._jobs)} 个任务未完成，不再等待"
+                        )
+                        for job in self._jobs:
+                            job.settled = True
+                        self._jobs.clear()
+                        break
+                self._cond.wait(0.5)
+
+    async def __dispatch_async(
+        self, tasks: Iterable[Tuple[int, Any]], attempt: int
+    ) -> None:
+        """
+        在单个事件循环中调度执行，同时执行的任务数不超过线程数，并按存储类型限制并发
+        同步的 action 在守护线程中执行，超时后不再等待
+        """
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.workers)
+        verify_slots = asyncio.Semaphore(self.workers)
+        storages = StorageSemaphores(self.storage_limits)
+        executor = DaemonExecutor(f"{self.name}-")
+        pending: Set[asyncio.Task] = set()
+        it = iter(tasks)
+        while True:
+            item = await loop.run_in_executor(None, next, it, None)
+            if item is None:
+                break
+            acquired = False
+            while not acquired:
+                try:
+                    await asyncio.wait_for(slots.acquire(), 0.5)
+                    acquired = True
+                except asyncio.TimeoutError:
+                    if self.event.is_set():
+                        break
+            if acquired and self.event.is_set():
+                slots.release()
+                acquired = False
+            if not acquired:
+                self.__abort(attempt)
+                break
+            job = _Job(*item, attempt, self.timeout, slots)
+            future = loop.create_task(
+                self.__run_job_async(job, storages, verify_slots, executor)
+            )
+            pending.add(future)
+            future.add_done_callback(pending.discard)
+        self._halt.set()
+        deadline = 0.0
+        while pending:
+            await asyncio.wait(set(pending), timeout=0.5)
+            if pending and self.event.is_set():
+                self.stats.stopped = True
+                deadline = deadline or time.time() + self.stop_timeout
+                if time.time() >= deadline:
+                    logger.warning(
+                        f"{self.name}：仍有 {len(pending)} 个任务未完成，不再等待"
+                    )
+                    for future in pending:
+                        future.cancel()
+                    break
+
+    async def __run_job_async(
+        self,
+        job: _Job,
+        storages: StorageSemaphores,
+        verify_slots: asyncio.Semaphore,
+        executor: DaemonExecutor,
+    ) -> None:
+        reason = "error"
+        try:
+            async with AsyncExitStack() as stack:
+                # 按固定顺序获取，避免涉及多个存储的任务互相等待
+                for storage in sorted(
+                    set(self.storage_of(job.task) if self.storage_of else [])
+                ):
+                    semaphore = storages.get(storage)
+                    if semaphore:
+                        await stack.enter_async_context(semaphore)
+                if inspect.iscoroutinefunction(self.action):
+                    result = self.__call_async(job)
+                else:
+                    result = call(self.__call, job, executor=executor)
+                success, message = await asyncio.wait_for(result, self.timeout or None)
+        except asyncio.TimeoutError:
+            reason = "timeout"
+            success, message = False, f"执行超时（{self.timeout:g} 秒）"
+            logger.warning(f"{self.name}：{self.label(job.task)} 执行超时")
+        except Exception as e:
+            success, message, reason = False, str(e), "exception"
+        finally:
+            job.slots.release()
+        if inspect.iscoroutinefunction(self.action):
+            job.running = False  # 协程已结束或已被取消
+        if success and self.verifier:
+            async with verify_slots:
+                try:
+                    passed, detail = await asyncio.wait_for(
+                        call(self.__check, job.task, executor=executor),
+                        self.timeout or None,
+                    )
+                except asyncio.TimeoutError:
+                    passed, detail = False, f"校验超时（{self.timeout:g} 秒）"
+                except Exception as e:
+                    passed, detail = False, f"校验出错：{e}"
+            if not passed:
+                success, message, reason = False, detail, "verify"
+        self.__settle(job, success, message, reason)
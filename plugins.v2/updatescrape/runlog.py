@@ -0,0 +1,155 @@
+from datetime import datetime
+from hashlib import sha1
+from typing import Any, Dict, List
+import json
+
+import pytz
+
+from app.core.config import settings
+from app.plugins import _PluginBase
+
+from .pipeline import RunStats
+
+# 最多保留的运行记录数
+MAX_RUNS = 100
+
+
+def config_fingerprint(config: Dict[str, Any]) -> str:
+    """
+    配置指纹，便于区分不同配置下的运行表现
+    """
+    data = {k: v for k, v in config.items() if k not in ("onlyonce", "enabled")}
+    return sha1(
+        json.dumps(data, sort_keys=True, ensure_ascii=False, default=str).encode()
+    ).hexdigest()[:8]
+
+
+def save_run(
+    plugin: _PluginBase,
+    stats: RunStats,
+    config: Dict[str, Any],
+    limit: int = MAX_RUNS,
+) -> Dict[str, Any]:
+    """
+    保存单次运行统计到插件数据，超出数量时丢弃最早的记录
+    """
+    duration = stats.duration
+    record = {
+        "time": datetime.fromtimestamp(
+            stats.started, tz=pytz.timezone(settings.TZ)
+        ).strftime("%Y-%m-%d %H:%M:%S"),
+        "status": "停止" if stats.stopped else "分片" if stats.sliced else "完成",
+        "duration": round(duration, 2),
+        "listed": stats.listed,
+        "filtered": stats.filtered,
+        "dispatched": stats.dispatched,
+        "success": stats.success,
+        "failed": len(stats.failed_msgs),
+        "skipped": sum(stats.skip_reasons.values()),
+        "throughput": round(stats.dispatched / duration, 3) if duration else 0,
+        "phases": {k: round(v, 2) for k, v in stats.phases.items()},
+        "fingerprint": config_fingerprint(config),
+    }
+    runs: List[Dict[str, Any]] = plugin.get_data("runs") or []
+    runs.append(record)
+    plugin.save_data("runs", runs[-limit:])
+    return record
+
+
+def _chart(title: str, name: str, runs: List[Dict[str, Any]], key: str) -> dict:
+    return {
+        "component": "VCol",
+        "props": {"cols": 12, "md": 6},
+        "content": [
+            {
+                "component": "VApexChart",
+                "props": {
+                    "height": 260,
+                    "type": "line",
+                    "options": {
+                        "chart": {"type": "line", "toolbar": {"show": False}},
+                        "title": {"text": title},
+                        "stroke": {"curve": "smooth", "width": 2},
+                        "xaxis": {"categories": [r["time"] for r in runs]},
+                    },
+                    "series": [{"name": name, "data": [r[key] for r in runs]}],
+                },
+            }
+        ],
+    }
+
+
+def render_runs(runs: List[Dict[str, Any]]) -> List[dict]:
+    """
+    生成运行历史页面：吞吐量、耗时趋势图与运行记录表
+    """
+    if not runs:
+        return [
+            {
+                "component": "div",
+                "text": "暂无运行记录",
+                "props": {"class": "text-center"},
+            }
+        ]
+    headers = [
+        "开始时间",
+        "状态",
+        "耗时（秒）",
+        "扫描",
+        "执行",
+        "成功",
+        "失败",
+        "跳过",
+        "文件/秒",
+        "阶段耗时",
+        "配置",
+    ]
+    rows = [
+        {
+            "component": "tr",
+            "content": [
+                {"component": "td", "text": str(v)}
+                for v in (
+                    r["time"],
+                    r["status"],
+                    r["duration"],
+                    r["listed"],
+                    r["dispatched"],
+                    r["success"],
+                    r["failed"],
+                    r["skipped"],
+                    r["throughput"],
+                    "，".join(f"{k} {v}s" for k, v in r["phases"].items()),
+                    r["fingerprint"],
+                )
+            ],
+        }
+        for r in reversed(runs)
+    ]
+    return [
+        {
+            "component": "VRow",
+            "content": [
+                _chart("吞吐量趋势", "文件/秒", runs, "throughput"),
+                _chart("耗时趋势", "耗时（秒）", runs, "duration"),
+            ],
+        },
+        {
+            "component": "VTable",
+            "props": {"hover": True, "density": "compact"},
+            "content": [
+                {
+                    "component": "thead",
+                    "content": [
+                        {
+                            "component": "tr",
+                            "content": [
+                                {"component": "th", "text": h} for h in headers
+                            ],
+                        }
+                    ],
+                },
+                {"component": "tbody", "content": rows},
+            ],
+        },
+    ]